@@ -4,8 +4,15 @@ tauMargin = 0.1 # Hz
 errorMargin = 5 # Hz
 updateTimestep = 20e-3 # s
 updateTimestepAllan = 5e-1 # s
+ringBufferSize = 2**14 # records of control ticks between plot updates
+tauGrid = 'octave' # 'octave', 'decade', 'all' or 'many'
+flagAllanErrorBars = True
+confidenceLevel = 0.683
 
 waitOffset = 0.001 # s
+pollPeriod = 1e-3 # s, polling period of hardware frequency counters
+schedulerSpin = 200e-6 # s
+schedulerCatchUp = 'skip' # 'skip', 'burst' or 'reset'
 phaseLockMargin = 100 # Hz
 phaseLockCounterLimit = 200
 
@@ -18,5 +25,7 @@ available filters:
 '''
 loopFilter = 'DoubleIntDoubleLowpass'
 # loopFilter = 'IntLowpass'
+loopFilterBackend = 'python' # 'python', 'numba' (compiled integrator and lowpass filters, needs numba) or 'statespace'
 
-flagPrintFilterOutput = False
\ No newline at end of file
+flagPrintFilterOutput = False
+flagProfileTicks = False # latency histograms of control tick stages
\ No newline at end of file
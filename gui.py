@@ -12,6 +12,9 @@ import yaml
 from misc.generators import generate_widgets, generate_layout
 from misc.commands import *
 from src.handlerStabilization import *
+from src.sharedRingBuffer import SharedRingBuffer, FLAG_LOCKED
+from src.scheduler import DeadlineScheduler
+from src.messages import *
 import src.frequency_stability as freq_stab
 from src.utils import save_csv
 import config.config as cfg
@@ -22,18 +25,20 @@ from PyQt5.QtGui import QColor
 from widgets.Dialogs import *
 
 import numpy as np
+import pyqtgraph as pg
 
 availableFilesCfg = '(*.yml *.yaml)'
 availableFilesData = '(*.csv)'
 
 
-def _handleStab(q, conn, eventDisconnect):
+def _handleStab(q, conn, eventDisconnect, ringName):
 
     print('Starting stabilization process', flush=True)
-    handler = handlerStabilization(q, conn)
+    handler = handlerStabilization(q, conn, ringName)
+
+    scheduler = DeadlineScheduler(handler.period(), cfg.schedulerSpin, cfg.schedulerCatchUp)
 
     while True:
-        start = time.time()
         # check for disconnect
         if eventDisconnect.is_set():
             print('Closing stabilization process')
@@ -45,15 +50,20 @@ def _handleStab(q, conn, eventDisconnect):
             handler.filterUpdate()
 
         # check queue
-        while not handler.queueEmpty():
-            handler.parseCommand()
+        handler.parseCommands()
+        # rate may have been changed
+        scheduler.setPeriod(handler.period())
 
-        stop = time.time()
-        # print(stop - start)
-        to_wait = handler.wait(start, stop)
+        to_wait = scheduler.wait()
         # if to_wait < 0:
         #     print('[{0}] Delay: {1} s'.format(datetime.now(), to_wait), flush=True)
 
+    print('Loop overruns: {0}, missed periods: {1}, max delay: {2:.6f} s'.format(
+        scheduler.overruns(),
+        scheduler.missed(),
+        scheduler.maxLateness()
+    ), flush=True)
+
     handler.disconnect()
     conn.close()
 
@@ -66,6 +76,7 @@ class FrequencyDriftStabilizer(QMainWindow):
     updateDevicesDDS = pyqtSignal(list)
     autosave = pyqtSignal()
     phaseLock = pyqtSignal(bool)
+    latencySummary = pyqtSignal(str)
 
     def __init__(self, *args, **kwargs):
 
@@ -91,14 +102,18 @@ class FrequencyDriftStabilizer(QMainWindow):
         self._valTarget = 0
         self._valTargetPhase = 0
 
-        self._tauN = 20 # number of points for Allan deviation plot
+        self._tauN = 0 # number of points for Allan deviation plot, set by tau grid
         self._taus = np.zeros(self._tauN)
         self._AllanDevs = np.zeros(self._tauN) * np.nan
+        self._AllanDevsLower = np.zeros(self._tauN) * np.nan
+        self._AllanDevsUpper = np.zeros(self._tauN) * np.nan
+        self._AllanAccumulator = None
 
         self._iterAutosave = 0
         self._timestampAutosave = np.zeros(self._N)
 
         self._lowerPlot = 'Error'
+        self._AllanType = 'ADEV overlapped'
         self._mode = 'Frequency'
 
         # Flags
@@ -110,12 +125,25 @@ class FrequencyDriftStabilizer(QMainWindow):
         self._flagAllan = False
         self._flagAutosave = False
 
+        # Messages from stabilization process
+        self._router = Router('GUI')
+        self._router.registerAll({
+            FC_CONNECTION: self._cmdConnectionFC,
+            FC_DEVICES: self.updateDevicesFC.emit,
+            DDS_CONNECTION: self._cmdConnectionDDS,
+            DDS_DEVICES: self.updateDevicesDDS.emit,
+            FILT_PHASE_LOCK: self.phaseLock.emit,
+            PROF_SUMMARY: self.latencySummary.emit
+        })
+
         # Stabilization process
         self._eventDisconnect = mp.Event()
         self._queueStab = mp.Queue()
+        # data of every control tick, pipe is for other messages
+        self._ring = SharedRingBuffer(cfg.ringBufferSize)
         # run subprocess
         self._stabConn, child_conn = mp.Pipe()
-        self._processStab = mp.Process(target=_handleStab, args=(self._queueStab, child_conn, self._eventDisconnect,))
+        self._processStab = mp.Process(target=_handleStab, args=(self._queueStab, child_conn, self._eventDisconnect, self._ring.name,))
         self._processStab.start()
 
         # Update thread
@@ -155,18 +183,11 @@ class FrequencyDriftStabilizer(QMainWindow):
 
         # Close all connections
         # unlock
-        self._queueStab.put({
-            'dev': 'filt',
-            'cmd': 'lock',
-            'args': 0
-        })
+        self._queueStab.put(Message(FILT_LOCK, 0))
         # disconnect DDS
-        self._queueStab.put({
-            'dev': 'DDS',
-            'cmd': 'disconnect'
-        })
+        self._queueStab.put(Message(DDS_DISCONNECT))
         # disconnect FC
-        self._queueStab.put({'dev': 'FC', 'cmd': 'disconnect'})
+        self._queueStab.put(Message(FC_DISCONNECT))
 
         self._eventStopAllan.set()
         self._threadUpdateAllan.join()
@@ -181,6 +202,8 @@ class FrequencyDriftStabilizer(QMainWindow):
         self._eventDisconnect.set()
         self._processStab.join()
         self._stabConn.close()
+        self._ring.close()
+        self._ring.unlink()
         print('Stabilization process closed!')
 
         self._exportParams(whileExit=True)
@@ -225,8 +248,10 @@ class FrequencyDriftStabilizer(QMainWindow):
         # Additional init of plotAllan
         self._widgets['plotAllan'].setLabel("bottom", "Tau [s]")
         self._widgets['plotAllan'].setLabel("left", "Allan deviation")
-        self._widgets['plotAllan'].setLogMode(x=False, y=True)
+        self._widgets['plotAllan'].setLogMode(x=True, y=True)
         self._curveAllan = self._widgets['plotAllan'].plot(pen='y')
+        self._errorBarsAllan = pg.ErrorBarItem(x=np.zeros(0), y=np.zeros(0), beam=0.05, pen='y')
+        self._widgets['plotAllan'].addItem(self._errorBarsAllan)
         # self._widgets['checkAllan'].setChecked(True)
 
         # Setting combos in settings section
@@ -270,6 +295,15 @@ class FrequencyDriftStabilizer(QMainWindow):
         actionSaveFrequencyData = menuFile.addAction("Save data")
         actionSaveFrequencyData.triggered.connect(self._saveData)
 
+        menuDiagnostics = self.menuBar().addMenu('Diagnostics')
+        # Latency instrumentation of control ticks
+        actionShowLatencies = menuDiagnostics.addAction("Show latencies")
+        actionShowLatencies.triggered.connect(self._showLatencies)
+        actionSaveLatencies = menuDiagnostics.addAction("Save latency histograms")
+        actionSaveLatencies.triggered.connect(self._saveLatencies)
+        actionResetLatencies = menuDiagnostics.addAction("Reset latencies")
+        actionResetLatencies.triggered.connect(self._resetLatencies)
+
     def initUI(self):
 
         self._widgets['btnFCConnect'].clicked.connect(self._connectFC)
@@ -288,6 +322,7 @@ class FrequencyDriftStabilizer(QMainWindow):
         self.updateDevicesDDS.connect(self._updateDevicesListDDS)
         self.autosave.connect(self._autosave)
         self.phaseLock.connect(self._phaseLockChanged)
+        self.latencySummary.connect(self._latencySummaryReceived)
 
         self._widgets['comboRate'].currentIndexChanged.connect(self._sendParamsFC)
         self._widgets['comboChannelsFC'].currentIndexChanged.connect(self._sendParamsFC)
@@ -304,13 +339,14 @@ class FrequencyDriftStabilizer(QMainWindow):
         self._widgets['filters'].newFilterDesigned.connect(self._setLowpass)
 
         self._widgets['checkAllan'].stateChanged.connect(self._AllanChanged)
+        self._widgets['comboAllan'].activated.connect(self._AllanTypeChanged)
 
         self._widgets['checkAutosave'].stateChanged.connect(self._enableAutosave)
 
     # FC connection
     def _getDevicesFC(self):
 
-        self._queueStab.put({'dev': 'FC', 'cmd': 'devices'})
+        self._queueStab.put(Message(FC_DEVICES))
 
     def _updateDevicesListFC(self, devs):
 
@@ -323,10 +359,10 @@ class FrequencyDriftStabilizer(QMainWindow):
             if not self._getParamsFC():
                 return False
             address = self._widgets['comboConnFC'].currentText()
-            self._queueStab.put({'dev': 'FC', 'cmd': 'connect', 'args': address})
+            self._queueStab.put(Message(FC_CONNECT, address))
             self._sendParamsFC()
         else:
-            self._queueStab.put({'dev': 'FC', 'cmd': 'disconnect'})
+            self._queueStab.put(Message(FC_DISCONNECT))
 
         return True
 
@@ -363,10 +399,10 @@ class FrequencyDriftStabilizer(QMainWindow):
         if not self._getParamsFC():
             return False
         
-        self._queueStab.put({'dev': 'FC', 'cmd': 'rate', 'args': self._paramsFC['Rate']})
+        self._queueStab.put(Message(FC_RATE, self._paramsFC['Rate']))
         print('Rate changed to {}'.format(self._paramsFC['Rate']))
 
-        self._queueStab.put({'dev': 'FC', 'cmd': 'channels', 'args': self._paramsFC['Channels']})
+        self._queueStab.put(Message(FC_CHANNELS, self._paramsFC['Channels']))
         print('Channels changed to {}'.format(self._paramsFC['Channels']))
 
         self._resetVariables()
@@ -374,7 +410,7 @@ class FrequencyDriftStabilizer(QMainWindow):
     # DDS connection
     def _getDevicesDDS(self):
 
-        self._queueStab.put({'dev': 'DDS', 'cmd': 'devices'})
+        self._queueStab.put(Message(DDS_DEVICES))
 
     def _updateDevicesListDDS(self, devs):
 
@@ -385,61 +421,39 @@ class FrequencyDriftStabilizer(QMainWindow):
 
         if not self._flagDDSConnected:
             conn = self._widgets['comboConnDDS'].currentText()
-            self._queueStab.put({
-                'dev': 'DDS',
-                'cmd': 'connect',
-                'args': conn
-            })
+            self._queueStab.put(Message(DDS_CONNECT, conn))
         else:
-            self._queueStab.put({
-                'dev': 'DDS',
-                'cmd': 'disconnect'
-            })
+            self._queueStab.put(Message(DDS_DISCONNECT))
     
     # DDS settings
     def _sendParamsDDS(self):
 
         # Frequency
-        tmp = {
-            'dev': 'DDS',
-            'cmd': 'freq'
-        }
-
         try:
-            tmp['args'] = float(self._widgets['freqDDS'].text())
+            freq = float(self._widgets['freqDDS'].text())
         except ValueError:
             dialogWarning('Could not read DDS frequency!')
             return False
 
-        self._queueStab.put(tmp)
+        self._queueStab.put(Message(DDS_FREQ, freq))
 
         # Amplitude
-        tmp = {
-            'dev': 'DDS',
-            'cmd': 'amp'
-        }
-
         try:
-            tmp['args'] = float(self._widgets['ampDDS'].text())
+            amp = float(self._widgets['ampDDS'].text())
         except ValueError:
             dialogWarning('Could not read DDS amplitude!')
             return False
 
-        self._queueStab.put(tmp)
+        self._queueStab.put(Message(DDS_AMP, amp))
 
         # Phase
-        tmp = {
-            'dev': 'DDS',
-            'cmd': 'phase'
-        }
-
         try:
-            tmp['args'] = float(self._widgets['phaseDDS'].text())
+            phase = float(self._widgets['phaseDDS'].text())
         except ValueError:
             dialogWarning('Could not read DDS phase!')
             return False
 
-        self._queueStab.put(tmp)
+        self._queueStab.put(Message(DDS_PHASE, phase))
 
         return True
 
@@ -451,14 +465,14 @@ class FrequencyDriftStabilizer(QMainWindow):
 
         if not self._flagDDSEnabled:
             self._sendParamsDDS()
-            self._queueStab.put({'dev': 'DDS', 'cmd': 'en', 'args': 1})
+            self._queueStab.put(Message(DDS_EN, 1))
             self._flagDDSEnabled = True
             self._widgets['btnDDSEnable'].setText('Disable')
         else:
             if self._flagLocked:
                 dialogWarning('Disengage lock first!')
                 return False
-            self._queueStab.put({'dev': 'DDS', 'cmd': 'en', 'args': 0})
+            self._queueStab.put(Message(DDS_EN, 0))
             self._flagDDSEnabled = False
             self._widgets['btnDDSEnable'].setText('Enable')
 
@@ -480,11 +494,7 @@ class FrequencyDriftStabilizer(QMainWindow):
 
         self._mode = self._widgets['comboMode'].currentText()
         self._changedLowerPlotShow() # adjust lower plot units
-        self._queueStab.put({
-            'dev': 'filt',
-            'cmd': 'mode',
-            'args': self._mode
-        })
+        self._queueStab.put(Message(FILT_MODE, self._mode))
         self._flagLockReady = False
 
     def _resetVariables(self):
@@ -501,6 +511,9 @@ class FrequencyDriftStabilizer(QMainWindow):
         self._control = np.zeros(self._N) * np.nan
         # Reset Allan deviation
         self._AllanDevs = np.zeros(self._tauN) * np.nan
+        self._AllanDevsLower = np.zeros(self._tauN) * np.nan
+        self._AllanDevsUpper = np.zeros(self._tauN) * np.nan
+        self._resetAllan()
         # Reset iterators
         self._i = 0
         self._iterAutosave = 0
@@ -509,16 +522,8 @@ class FrequencyDriftStabilizer(QMainWindow):
 
     def _setSetpoint(self):
 
-        self._queueStab.put({
-            'dev': 'filt',
-            'cmd': 'sp',
-            'args': self._valTarget
-        })
-        self._queueStab.put({
-            'dev': 'filt',
-            'cmd': 'spPhase',
-            'args': self._valTargetPhase
-        })
+        self._queueStab.put(Message(FILT_SP, self._valTarget))
+        self._queueStab.put(Message(FILT_SP_PHASE, self._valTargetPhase))
 
     def _getStabilizerSettings(self):
 
@@ -530,12 +535,9 @@ class FrequencyDriftStabilizer(QMainWindow):
             dialogWarning('Invalid stabilizer settings!')
             return False
 
+        self._resetAllan()
         self._setSetpoint()
-        self._queueStab.put({
-            'dev': 'filt',
-            'cmd': 'mode',
-            'args': self._mode
-        })
+        self._queueStab.put(Message(FILT_MODE, self._mode))
         
         return True
 
@@ -549,13 +551,7 @@ class FrequencyDriftStabilizer(QMainWindow):
             return
 
         filterParamsFreq['params']['dt'] = self._paramsFC['Rate value']
-        self._queueStab.put({
-            'dev': 'filt',
-            'cmd': 'filt',
-            'type': filterParamsFreq['type'],
-            'mode': 'freq',
-            'params': filterParamsFreq['params']
-        })
+        self._queueStab.put(Message(FILT_SET, (filterParamsFreq['type'], 'freq', filterParamsFreq['params'])))
 
         # Phase
         if self._mode == 'Phase':
@@ -565,13 +561,7 @@ class FrequencyDriftStabilizer(QMainWindow):
                 return
 
             filterParamsPhase['params']['dt'] = self._paramsFC['Rate value']
-            self._queueStab.put({
-                'dev': 'filt',
-                'cmd': 'filt',
-                'type': filterParamsPhase['type'],
-                'mode': 'phase',
-                'params': filterParamsPhase['params']
-            })
+            self._queueStab.put(Message(FILT_SET, (filterParamsPhase['type'], 'phase', filterParamsPhase['params'])))
 
         # Lock ready status
         self._flagLockReady = True
@@ -580,12 +570,7 @@ class FrequencyDriftStabilizer(QMainWindow):
     def _setLowpass(self, lowpassParams):
 
         if lowpassParams['type'] == 'lowpass':
-            self._queueStab.put({
-                'dev': 'filt',
-                'cmd': 'filt',
-                'type': lowpassParams['type'],
-                'params': lowpassParams['params']
-            })
+            self._queueStab.put(Message(FILT_SET, (lowpassParams['type'], None, lowpassParams['params'])))
 
     def _applyLowpass(self):
 
@@ -594,11 +579,7 @@ class FrequencyDriftStabilizer(QMainWindow):
         else:
             state = 0
 
-        self._queueStab.put({
-            'dev': 'filt',
-            'cmd': 'lpApply',
-            'args': state
-        })
+        self._queueStab.put(Message(FILT_LP_APPLY, state))
 
     def _lock(self):
 
@@ -611,20 +592,12 @@ class FrequencyDriftStabilizer(QMainWindow):
                 return False
             else:
                 self._setSetpoint()
-                self._queueStab.put({
-                    'dev': 'filt',
-                    'cmd': 'lock',
-                    'args': 1
-                })
+                self._queueStab.put(Message(FILT_LOCK, 1))
 
                 self._flagLocked = True
                 self._widgets['btnLock'].setText('Unlock')
         else:
-            self._queueStab.put({
-                    'dev': 'filt',
-                    'cmd': 'lock',
-                    'args': 0
-                })
+            self._queueStab.put(Message(FILT_LOCK, 0))
 
             self._flagLocked = False
             self._widgets['btnLock'].setText('Lock')
@@ -633,10 +606,7 @@ class FrequencyDriftStabilizer(QMainWindow):
 
     def _resetFilter(self):
 
-        self._queueStab.put({
-            'dev': 'filt',
-            'cmd': 'reset'
-        })
+        self._queueStab.put(Message(FILT_RESET))
 
     def _phaseLockChanged(self, state):
 
@@ -651,112 +621,106 @@ class FrequencyDriftStabilizer(QMainWindow):
     def _update(self, eventStop, conn):
 
         print('Starting update thread')
-        flagNewData = False
         while True:
             if eventStop.is_set():
                 break
 
             # Command parsing
             while conn.poll():
-                tmp = conn.recv()
-                # Frequency counter
-                if tmp['dev'] == 'FC':
-                    # FC connection
-                    if tmp['cmd'] == 'connection':
-                        self._flagFCConnected = tmp['args']
-                        if self._flagFCConnected:
-                            self._widgets['btnFCConnect'].setText('Disconnect')
-                        else:
-                            self._widgets['btnFCConnect'].setText('Connect')
-                    # FC data
-                    elif tmp['cmd'] == 'data':
-                        flagNewData = True
-                        self._val1[self._i] = tmp['args'][0]
-                        self._val2[self._i] = tmp['args'][1]
-                        self._valAvg[self._i] = np.average(tmp['args'])
-                    # FC devices list
-                    elif tmp['cmd'] == 'devices':
-                        self.updateDevicesFC.emit(tmp['args'])
-                # DDS
-                elif tmp['dev'] == 'DDS':
-                    # DDS connection
-                    if tmp['cmd'] == 'connection':
-                        self._flagDDSConnected = tmp['args']
-                        if self._flagDDSConnected:
-                            self._widgets['btnDDSConnect'].setText('Disconnect')
-                        else:
-                            self._widgets['btnDDSConnect'].setText('Connect')
-                            if self._flagLocked:
-                                self._lock() # unlock
-                            if self._flagDDSEnabled: # software disable DDS
-                                self._flagDDSEnabled = False
-                                self._widgets['btnDDSEnable'].setText('Enable')
-                    # DDS devices list
-                    elif tmp['cmd'] == 'devices':
-                        self.updateDevicesDDS.emit(tmp['args'])
-                # Filter
-                elif tmp['dev'] == 'filt':
-                    # Filtered/raw average
-                    if tmp['cmd'] == 'avg':
-                        self._valAvgFilt[self._i] = tmp['args']
-                    # Process variable
-                    elif tmp['cmd'] == 'pv':
-                        self._pv[self._i] = tmp['args']
-                        self._error_Hz[self._i] = self._valTarget - self._valAvgFilt[self._i]
-                        self._error_period[self._i] = self._error_Hz[self._i]*self._paramsFC['Rate value']
-                    # Control
-                    elif tmp['cmd'] == 'control':
-                        self._control[self._i] = tmp['args']
-                    # Mode
-                    elif tmp['cmd'] == 'phaseLock':
-                        self.phaseLock.emit(tmp['args'])
-                else:
-                    print('Unknown device! dev: {0} cmd: {1}'.format(tmp['dev'], tmp['cmd']))
+                self._router.dispatch(conn.recv())
+
+            # Data of control ticks since the last check
+            records = self._ring.popAll()
+            for record in records:
+                self._storeRecord(record)
 
             # New data handling
-            if flagNewData:
+            if records.size:
                 self.updatePlots.emit()
 
                 # Led lock indicator
-                if (np.absolute(self._error_Hz[self._i]) < cfg.errorMargin) and self._flagLocked:
+                if (np.absolute(records['error'][-1]) < cfg.errorMargin) and self._flagLocked:
                     self._widgets['ledLock'].setChecked(True)
                 else:
                     self._widgets['ledLock'].setChecked(False)
 
-                flagNewData = False
-                self._i += 1
-
-                # Autosave
-                if self._flagAutosave:
-                    self._timestampAutosave[self._iterAutosave] = time.time()
-                    self._iterAutosave += 1
-                if self._iterAutosave == self._N-1:
-                    self._iterAutosave = 0
-                    self.autosave.emit()
-
-            # Data rolling
-            if self._i >= self._N:
-                self._i = self._N-1
-                self._val1 = np.roll(self._val1, -1)
-                self._val1[-1] = np.nan
-                self._val2 = np.roll(self._val2, -1)
-                self._val2[-1] = np.nan
-                self._valAvg = np.roll(self._valAvg, -1)
-                self._valAvg[-1] = np.nan
-                self._valAvgFilt = np.roll(self._valAvg, -1)
-                self._valAvgFilt[-1] = np.nan
-                self._pv = np.roll(self._pv, -1)
-                self._pv[-1] = np.nan
-                self._error_Hz = np.roll(self._error_Hz, -1)
-                self._error_Hz[-1] = np.nan
-                self._error_period = np.roll(self._error_period, -1)
-                self._error_period[-1] = np.nan
-                self._control = np.roll(self._control, -1)
-                self._control[-1] = np.nan
-
             time.sleep(cfg.updateTimestep)
         print('Closing update thread')
 
+    # Messages from stabilization process
+    def _cmdConnectionFC(self, state):
+
+        self._flagFCConnected = state
+        if self._flagFCConnected:
+            self._widgets['btnFCConnect'].setText('Disconnect')
+        else:
+            self._widgets['btnFCConnect'].setText('Connect')
+
+    def _cmdConnectionDDS(self, state):
+
+        self._flagDDSConnected = state
+        if self._flagDDSConnected:
+            self._widgets['btnDDSConnect'].setText('Disconnect')
+        else:
+            self._widgets['btnDDSConnect'].setText('Connect')
+            if self._flagLocked:
+                self._lock() # unlock
+            if self._flagDDSEnabled: # software disable DDS
+                self._flagDDSEnabled = False
+                self._widgets['btnDDSEnable'].setText('Enable')
+
+    def _storeRecord(self, record):
+        '''
+        Store data of one control tick and advance data arrays
+
+        Args:
+            record: record of SharedRingBuffer
+        '''
+        self._val1[self._i] = record['f1']
+        self._val2[self._i] = record['f2']
+        self._valAvg[self._i] = 0.5*(record['f1'] + record['f2'])
+        if self._AllanAccumulator is not None:
+            self._AllanAccumulator.update(self._valAvg[self._i])
+
+        # Filtered/raw average and process variable
+        self._valAvgFilt[self._i] = record['avg']
+        self._pv[self._i] = record['pv']
+        self._error_Hz[self._i] = record['error']
+        self._error_period[self._i] = self._error_Hz[self._i]*self._paramsFC['Rate value']
+        # Control
+        if record['flags'] & FLAG_LOCKED:
+            self._control[self._i] = record['control']
+
+        self._i += 1
+
+        # Autosave
+        if self._flagAutosave:
+            self._timestampAutosave[self._iterAutosave] = time.time()
+            self._iterAutosave += 1
+        if self._iterAutosave == self._N-1:
+            self._iterAutosave = 0
+            self.autosave.emit()
+
+        # Data rolling
+        if self._i >= self._N:
+            self._i = self._N-1
+            self._val1 = np.roll(self._val1, -1)
+            self._val1[-1] = np.nan
+            self._val2 = np.roll(self._val2, -1)
+            self._val2[-1] = np.nan
+            self._valAvg = np.roll(self._valAvg, -1)
+            self._valAvg[-1] = np.nan
+            self._valAvgFilt = np.roll(self._valAvg, -1)
+            self._valAvgFilt[-1] = np.nan
+            self._pv = np.roll(self._pv, -1)
+            self._pv[-1] = np.nan
+            self._error_Hz = np.roll(self._error_Hz, -1)
+            self._error_Hz[-1] = np.nan
+            self._error_period = np.roll(self._error_period, -1)
+            self._error_period[-1] = np.nan
+            self._control = np.roll(self._control, -1)
+            self._control[-1] = np.nan
+
     # Allan deviation
     def _AllanChanged(self):
 
@@ -765,47 +729,115 @@ class FrequencyDriftStabilizer(QMainWindow):
         else:
             self._flagAllan = False
             self._AllanDevs = np.zeros(self._tauN) * np.nan
+            self._AllanDevsLower = np.zeros(self._tauN) * np.nan
+            self._AllanDevsUpper = np.zeros(self._tauN) * np.nan
             self._plotAllan()
 
+    def _AllanTypeChanged(self):
+
+        self._AllanType = self._widgets['comboAllan'].currentText()
+        self._widgets['plotAllan'].setLabel("left", self._AllanType)
+        if self._paramsFC:
+            self._setAllanTaus() # TheoH reaches longer taus, running sums are kept
+        self._plotAllan()
+
+    def _setAllanTaus(self):
+
+        # TheoH gives estimates up to 0.75 of the record length
+        if self._AllanType == 'TheoH':
+            tauMaxRatio = 0.75
+        else:
+            tauMaxRatio = 0.5
+
+        # taus are exact multiples of the sampling period
+        self._taus = freq_stab.calc_tau_grid(
+            self._N,
+            self._paramsFC['Frequency sampling [Hz]'],
+            cfg.tauGrid,
+            tauMaxRatio
+        )
+        self._tauN = self._taus.size
+        self._AllanDevs = np.zeros(self._tauN) * np.nan
+        self._AllanDevsLower = np.zeros(self._tauN) * np.nan
+        self._AllanDevsUpper = np.zeros(self._tauN) * np.nan
+
+        return True
+
     def _AllanDevSettings(self):
 
-        tauMin = 1 / (self._paramsFC['Frequency sampling [Hz]'] - cfg.tauMargin)
-        tauMax = self._N / 2 / (self._paramsFC['Frequency sampling [Hz]'] + cfg.tauMargin)
+        self._setAllanTaus()
+        self._resetAllan()
+
+        return True
+
+    def _resetAllan(self):
 
-        self._taus = np.linspace(tauMin, tauMax, self._tauN)
+        if not self._paramsFC:
+            return False
+
+        # running sums are updated with every new data point in _update, taus
+        # of ADEV and HDEV do not depend on the displayed deviation
+        self._AllanAccumulator = freq_stab.StabilityAccumulator(
+            freq_stab.calc_tau_grid(self._N, self._paramsFC['Frequency sampling [Hz]'], cfg.tauGrid),
+            self._paramsFC['Frequency sampling [Hz]'],
+            self._valTarget
+        )
 
         return True
 
     def _calcAllanDeviation(self):
 
-        if self._i < 1:
+        if self._AllanAccumulator is None or self._AllanAccumulator.count() < 1:
             return False
 
-        tauMaxCurrent = (self._i+1) / 2 / (self._paramsFC['Frequency sampling [Hz]'] + cfg.tauMargin)
-        n = 0
-        for tau in self._taus:
-            if tau <= tauMaxCurrent:
-                n += 1
-            else:
-                break
+        # cost does not depend on the length of collected data
+        if self._AllanType == 'ADEV overlapped':
+            self._AllanDevs = self._AllanAccumulator.getADEV()
+        elif self._AllanType == 'HDEV':
+            self._AllanDevs = self._AllanAccumulator.getHDEV()
+        # other deviations from the plotted data window
+        else:
+            fs = self._valAvg[~np.isnan(self._valAvg)]
+            _, devs = freq_stab.calc_deviations_batch(
+                fs,
+                self._valTarget,
+                self._paramsFC['Frequency sampling [Hz]'],
+                self._taus,
+                deviations=(self._AllanType,)
+            )
+            self._AllanDevs = devs[self._AllanType]
+        # print(self._taus, self._AllanDevs)
+
+        if cfg.flagAllanErrorBars:
+            self._calcAllanConfidence()
+
+        return True
+
+    def _calcAllanConfidence(self):
 
         fs = self._valAvg[~np.isnan(self._valAvg)]
-        fs_frac = freq_stab.calc_fractional_frequency(
-            fs,
-            self._valTarget
-        )
-        phase_error = freq_stab.calc_phase_error(
-            fs_frac,
-            self._paramsFC['Frequency sampling [Hz]']
+        fSampling = self._paramsFC['Frequency sampling [Hz]']
+
+        # running sums cover all data since the last reset
+        if self._AllanType in ['ADEV overlapped', 'HDEV']:
+            N = self._AllanAccumulator.count()
+        else:
+            N = fs.size
+
+        # noise type from the plotted data window
+        noiseIDs = freq_stab.calc_noise_id(fs, self._taus, fSampling)
+        lower, upper = freq_stab.calc_confidence_interval(
+            self._AllanDevs,
+            self._taus,
+            fSampling,
+            noiseIDs,
+            N,
+            self._AllanType,
+            cfg.confidenceLevel
         )
-        # print(phase_error)
-        for i in range(n):
-            self._AllanDevs[i] = freq_stab.calc_ADEV_overlapped_single(
-                phase_error,
-                self._taus[i],
-                self._paramsFC['Frequency sampling [Hz]']
-            )
-        # print(self._taus, self._AllanDevs)
+        self._AllanDevsLower, self._AllanDevsUpper = lower, upper
+
+        return True
 
     def _updateAllan(self, eventStop):
 
@@ -865,6 +897,21 @@ class FrequencyDriftStabilizer(QMainWindow):
 
         self._curveAllan.setData(self._taus, self._AllanDevs)
 
+        devs, lower, upper = self._AllanDevs, self._AllanDevsLower, self._AllanDevsUpper
+        if not cfg.flagAllanErrorBars or lower.size != devs.size or devs.size != self._taus.size:
+            self._errorBarsAllan.setData(x=np.zeros(0), y=np.zeros(0))
+            return
+
+        # error bars are not transformed by the log mode of the plot
+        mask = np.isfinite(lower) & np.isfinite(upper) & (lower > 0)
+        y = np.log10(devs[mask])
+        self._errorBarsAllan.setData(
+            x=np.log10(self._taus[mask]),
+            y=y,
+            top=np.log10(upper[mask]) - y,
+            bottom=y - np.log10(lower[mask])
+        )
+
     # File menu actions
     def _exportParams(self, whileExit=False):
 
@@ -1023,6 +1070,36 @@ class FrequencyDriftStabilizer(QMainWindow):
         dialogInformation('{0} data saved to {1}'.format(valName, outputPath))
         return True
 
+    # Latencies
+    def _showLatencies(self):
+
+        self._queueStab.put(Message(PROF_SUMMARY))
+
+    def _latencySummaryReceived(self, summary):
+
+        print(summary)
+        dialogInformation(summary)
+
+    def _saveLatencies(self):
+
+        outputPath = QFileDialog.getSaveFileName(
+                self,
+                'Save file',
+                '~/',
+                availableFilesData
+            )[0]
+        if outputPath == '':
+            return False
+        if not outputPath.endswith('.csv'):
+            outputPath += '.csv'
+
+        self._queueStab.put(Message(PROF_DUMP, outputPath))
+        return True
+
+    def _resetLatencies(self):
+
+        self._queueStab.put(Message(PROF_RESET))
+
     # Autosave
     def _enableAutosave(self):
 
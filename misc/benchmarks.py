@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+from copy import copy
+from timeit import repeat
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import src.frequency_stability as freq_stab
+import src.filters as filters
+from src.filters import IIRFilter
+from src.filterDesign import get_digital_filter_coefs
+
+
+def time_call(func, *args, repeat=3):
+
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ret = func(*args)
+        best = min(best, time.perf_counter() - start)
+
+    return best, ret
+
+def adev_reference(phase_error, n, tau):
+
+    # second differences and their mean square in extended precision
+    tmp = phase_error[2*n:] - 2*phase_error[n:-n] + phase_error[:-2*n]
+    ret = np.mean(np.square(tmp, dtype=np.longdouble))
+
+    return float(np.sqrt(ret / 2) / tau)
+
+def benchmark_phase_integration(N=10**7, f0=176e6, offset=3.7, noise=1e-4, f_sampling=1e3):
+    '''
+    Precision and speed of phase accumulation around a high carrier frequency.
+    Reference phase is accumulated in np.longdouble.
+
+    Args:
+        N: number of samples
+        f0: carrier frequency in Hz
+        offset: mean offset of measured frequency from f0 in Hz
+        noise: standard deviation of white frequency noise in Hz
+        f_sampling: sampling frequency in Hz
+    '''
+
+    rng = np.random.default_rng(0)
+    fs = f0 + offset + noise*rng.standard_normal(N)
+    fs_frac = freq_stab.calc_fractional_frequency(fs, f0)
+
+    reference = np.cumsum(fs_frac, dtype=np.longdouble) / np.longdouble(f_sampling)
+    t_cumsum, phase_cumsum = time_call(lambda x: freq_stab.calc_phase_error(x.copy(), f_sampling), fs_frac)
+    t_comp, phase_comp = time_call(freq_stab.calc_phase_error_compensated, fs_frac, f_sampling)
+
+    # streaming accumulator fed in blocks, phase is not mean-removed there
+    ns = [1, 10, 100, 1000, 10000]
+    taus = np.array(ns) / f_sampling
+    def stream(fs):
+        acc = freq_stab.StabilityAccumulator(taus, f_sampling, f0)
+        for start in range(0, fs.size, 2**16):
+            acc.updateBlock(fs[start:start+2**16])
+        return acc.getADEV()
+    t_stream, adev_stream = time_call(stream, fs, repeat=1)
+
+    print('Phase integration, N = {0:.0e}, f0 = {1:.0f} Hz, offset = {2} Hz'.format(N, f0, offset))
+    print('{0:>24} {1:>12} {2:>12} {3:>12}'.format('', 'np.cumsum', 'compensated', 'streaming'))
+    print('{0:>24} {1:>12.3f} {2:>12.3f} {3:>12.3f}'.format('time [s]', t_cumsum, t_comp, t_stream))
+    for i, n in enumerate(ns):
+        ref = adev_reference(reference, n, taus[i])
+        err_cumsum = adev_reference(phase_cumsum, n, taus[i]) / ref - 1
+        err_comp = adev_reference(phase_comp, n, taus[i]) / ref - 1
+        err_stream = adev_stream[i] / ref - 1
+        print('{0:>24} {1:>12.1e} {2:>12.1e} {3:>12.1e}'.format(
+            'ADEV rel. err. n={}'.format(n),
+            err_cumsum,
+            err_comp,
+            err_stream
+        ))
+
+def benchmark_iir_update(n_updates=100000, order=2):
+    '''
+    Time of a single IIRFilter.update for a Butterworth lowpass, plain float
+    path against the numpy array path. Outputs of both are compared bit by bit.
+
+    Args:
+        n_updates: number of updates timed
+        order: order of the lowpass
+    '''
+
+    fb_coefs, ff_coefs, _ = get_digital_filter_coefs(order, 10, 1e3)
+    xs = np.random.default_rng(0).standard_normal(n_updates).tolist()
+
+    filters = {}
+    for name, fast in [('numpy', False), ('float', True)]:
+        filt = IIRFilter(ff_coefs, fb_coefs)
+        # selects the update path, normally set from the filter orders
+        filt._fast = fast
+        filt.reset()
+        filters[name] = filt
+
+    print('IIRFilter.update, order {}'.format(order))
+    outputs = {}
+    for name, filt in filters.items():
+        update = filt.update
+        start = time.perf_counter()
+        outputs[name] = [update(x) for x in xs]
+        elapsed = time.perf_counter() - start
+        print('{0:>24} {1:>8.2f} us'.format(name, elapsed / n_updates * 1e6))
+
+    identical = np.array_equal(np.array(outputs['numpy']), np.array(outputs['float']))
+    print('{0:>24} {1}'.format('identical outputs', identical))
+
+
+def clamp_branching(value, bounds):
+
+    # clamping as done in loop filters before the shared clamp helper
+    value = copy(value)
+    if value > bounds[1]:
+        value = bounds[1]
+    elif value < bounds[0]:
+        value = bounds[0]
+
+    return copy(value)
+
+def benchmark_clamping(n_updates=20000, repeats=15):
+    '''
+    Per-update cost of integrator and output clamping and of full loop filter
+    updates. Times are the best of repeats, in us per call.
+
+    Args:
+        n_updates: number of calls timed in one repeat
+        repeats: number of repeats
+    '''
+    def best(func):
+        return min(repeat(func, number=n_updates, repeat=repeats)) / n_updates * 1e6
+
+    bounds = (-1e3, 1e3)
+    print('Clamping, value inside bounds')
+    print('{0:>24} {1:>8.3f} us'.format('copy + if/elif', best(lambda: clamp_branching(3.5, bounds))))
+    print('{0:>24} {1:>8.3f} us'.format('min/max', best(lambda: min(max(3.5, bounds[0]), bounds[1]))))
+    print('{0:>24} {1:>8.3f} us'.format('filters.clamp', best(lambda: filters.clamp(3.5, bounds))))
+
+    fb_coefs, ff_coefs, _ = get_digital_filter_coefs(2, 2*np.pi*20, 2*np.pi*1e3)
+    common = {'dt': 1e-3, 'bounds': (-1e9, 1e9)}
+    loopFilters = {
+        'PID': filters.PID(kp=1, ki=10, kd=0.01, **common),
+        'IntLowpass': filters.IntLowpass(ff_coefs=ff_coefs, fb_coefs=fb_coefs, ki=10, **common),
+        'DoubleIntLowpass': filters.DoubleIntLowpass(ff_coefs=ff_coefs, fb_coefs=fb_coefs, ki=10, kii=1, **common),
+        'DoubleIntDoubleLowpass': filters.DoubleIntDoubleLowpass(
+            ff_coefs1=ff_coefs, fb_coefs1=fb_coefs, ff_coefs2=ff_coefs, fb_coefs2=fb_coefs, ki=10, kii=1, **common
+        )
+    }
+    print('Loop filter update')
+    for name, filt in loopFilters.items():
+        update = filt.update
+        print('{0:>24} {1:>8.3f} us'.format(name, best(lambda: update(1., 0.5))))
+
+
+if __name__ == '__main__':
+
+    benchmark_phase_integration()
+    benchmark_iir_update()
+    benchmark_clamping()
@@ -2,6 +2,8 @@
 
 import telnetlib
 
+from src.messages import *
+
 
 class AD9912Handler():
 
@@ -30,27 +32,37 @@ class AD9912Handler():
         else:
             return False
 
-    def parseCommand(self, params):
-
-        # DDS connection
-        if params['cmd'] == 'connect':
-            self.connect(params['args'])
-        elif params['cmd'] == 'disconnect':
-            self.disconnect()
-        # DDS enable
-        elif params['cmd'] == 'en':
-            if self._flagConnected:
-                if params['args']:
-                    self._flagEnabled = True
-                else:
-                    self._flagEnabled = False
-                    self.setFreq(0)
-        # Amplitude
-        elif params['cmd'] == 'amp':
-            self.setAmp(params['args'])
-        # Phase
-        elif params['cmd'] == 'phase':
-            self.setPhase(params['args'])
+    def routes(self):
+        '''
+        Returns:
+            dict: opcode: handler of messages parsed by DDS
+        '''
+        return {
+            # DDS connection
+            DDS_CONNECT: self.connect,
+            DDS_DISCONNECT: self._cmdDisconnect,
+            # connected by IP address, nothing to list
+            DDS_DEVICES: ignore,
+            # DDS enable
+            DDS_EN: self._cmdEnable,
+            # Amplitude
+            DDS_AMP: self.setAmp,
+            # Phase
+            DDS_PHASE: self.setPhase
+        }
+
+    def _cmdDisconnect(self, args):
+
+        self.disconnect()
+
+    def _cmdEnable(self, state):
+
+        if self._flagConnected:
+            if state:
+                self._flagEnabled = True
+            else:
+                self._flagEnabled = False
+                self.setFreq(0)
 
     def connect(self, ip):
 
@@ -60,12 +72,12 @@ class AD9912Handler():
                 self._DDS.read_until(b'XXX', timeout=2)
                 self._flagConnected = True
                 print('DDS connected!', flush=True)
-                self._conn.send({'dev': 'DDS', 'cmd': 'connection', 'args': 1})
+                self._conn.send(Message(DDS_CONNECTION, 1))
                 return True
             except Exception as e:
                 self._flagConnected = False
                 print('Could not connect to DDS! {}'.format(e), flush=True)
-                self._conn.send({'dev': 'DDS', 'cmd': 'connection', 'args': 0})
+                self._conn.send(Message(DDS_CONNECTION, 0))
                 return False
 
         print('DDS already connected!')
@@ -84,7 +96,7 @@ class AD9912Handler():
                 print('Error while closing DDS connection!', e)
             self._DDS.close()
             self._flagConnected = False
-            self._conn.send({'dev': 'DDS', 'cmd': 'connection', 'args': 0})
+            self._conn.send(Message(DDS_CONNECTION, 0))
             print('DDS disconnected!', flush=True)
 
     def setFreq(self, freq):
@@ -129,7 +141,7 @@ if __name__ == '__main__':
 
     dds = AD9912Handler(DummyConnection())
     dds.connect('172.17.32.130')
-    dds.parseCommand({'cmd': 'en', 'args': 1})
+    dds.routes()[DDS_EN](1)
 
     dds.setFreq(100e6)
     dds.setAmp(100)
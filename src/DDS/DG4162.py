@@ -2,6 +2,8 @@
 
 import pyvisa
 
+from src.messages import *
+
 
 class DG4162Handler():
 
@@ -33,29 +35,34 @@ class DG4162Handler():
         else:
             return False
 
-    def parseCommand(self, params):
-
-        # DDS connection
-        if params['cmd'] == 'connect':
-            self.connect(params['args'])
-        elif params['cmd'] == 'disconnect':
-            self.disconnect()
-        elif params['cmd'] == 'devices':
-            ret = self.enumerate_devices()
-            self._conn.send({'dev': 'DDS', 'cmd': 'devices', 'args': ret})
-        # DDS enable
-        elif params['cmd'] == 'en':
-            if self._flagConnected:
-                self._enable(params['args'])
-        # Frequency
-        elif params['cmd'] == 'freq':
-            self.setFreq(params['args'])
-        # Amplitude
-        elif params['cmd'] == 'amp':
-            self.setAmp(params['args'])
-        # Phase
-        elif params['cmd'] == 'phase':
-            self.setPhase(params['args'])
+    def routes(self):
+        '''
+        Returns:
+            dict: opcode: handler of messages parsed by generator
+        '''
+        return {
+            # DDS connection
+            DDS_CONNECT: self.connect,
+            DDS_DISCONNECT: self._cmdDisconnect,
+            DDS_DEVICES: self._cmdDevices,
+            # DDS enable
+            DDS_EN: self._enable,
+            # Frequency
+            DDS_FREQ: self.setFreq,
+            # Amplitude
+            DDS_AMP: self.setAmp,
+            # Phase
+            DDS_PHASE: self.setPhase
+        }
+
+    def _cmdDisconnect(self, args):
+
+        self.disconnect()
+
+    def _cmdDevices(self, args):
+
+        ret = self.enumerate_devices()
+        self._conn.send(Message(DDS_DEVICES, ret))
 
     # Connection
     def enumerate_devices(self):
@@ -74,16 +81,16 @@ class DG4162Handler():
                 self._dev = self._rm.open_resource(conn)
                 if self._dev is None:
                     print('Could not connect to generator!', flush=True)
-                    self._conn.send({'dev': 'DDS', 'cmd': 'connection', 'args': 0})
+                    self._conn.send(Message(DDS_CONNECTION, 0))
                     return False
                 else:
                     self._flagConnected = True
                     print('Generator connected!', flush=True)
-                    self._conn.send({'dev': 'DDS', 'cmd': 'connection', 'args': 1})
+                    self._conn.send(Message(DDS_CONNECTION, 1))
             except Exception as e:
                 self._flagConnected = False
                 print('Could not connect to generator! {}'.format(e), flush=True)
-                self._conn.send({'dev': 'DDS', 'cmd': 'connection', 'args': 0})
+                self._conn.send(Message(DDS_CONNECTION, 0))
                 return False
             
             # Offset to 0
@@ -101,7 +108,7 @@ class DG4162Handler():
             self._flagEnabled = False
             self._dev.close()
             self._flagConnected = False
-            self._conn.send({'dev': 'DDS', 'cmd': 'connection', 'args': 0})
+            self._conn.send(Message(DDS_CONNECTION, 0))
             print('Generator disconnected!', flush=True)
 
     def _enable(self, state):
@@ -183,7 +190,7 @@ if __name__ == '__main__':
 
     afg = DG4162Handler(DummyConnection())
     afg.connect('172.17.32.183')
-    afg.parseCommand({'cmd': 'en', 'args': 1})
+    afg.routes()[DDS_EN](1)
 
     afg.setFreq(100e6)
     afg.setAmp(100)
@@ -14,6 +14,7 @@ import pyvisa
 import numpy as np
 
 from misc.commands import cmds_values
+from src.messages import *
 
 
 RESOLUTION = 20e-3 # Hz 
@@ -37,19 +38,34 @@ class FC53230A():
 
         print('FC53230 Frequency Counter handler initiated!')
 
-    def parseCommand(self, cmdDict):
-        
-        if cmdDict['cmd'] == 'mode':
-            self._changeMode(cmdDict['args']) 
-        elif cmdDict['cmd'] == 'devices':
-            ret = self.list_resources()
-            self._conn.send({'dev': 'FC', 'cmd': 'devices', 'args': ret})
-        elif cmdDict['cmd'] == 'connect':
-            self.connect(cmdDict['args'])
-            self._conn.send({'dev': 'FC', 'cmd': 'connection', 'args': self._flagConnected})
-        elif cmdDict['cmd'] == 'disconnect':
-            self.disconnect()
-            self._conn.send({'dev': 'FC', 'cmd': 'connection', 'args': self._flagConnected})
+    def routes(self):
+        '''
+        Returns:
+            dict: opcode: handler of messages parsed by frequency counter
+        '''
+        return {
+            # channels are fixed by configuration of mode
+            FC_CHANNELS: ignore,
+            FC_MODE: self._changeMode,
+            FC_DEVICES: self._cmdDevices,
+            FC_CONNECT: self._cmdConnect,
+            FC_DISCONNECT: self._cmdDisconnect
+        }
+
+    def _cmdDevices(self, args):
+
+        ret = self.list_resources()
+        self._conn.send(Message(FC_DEVICES, ret))
+
+    def _cmdConnect(self, address):
+
+        self.connect(address)
+        self._conn.send(Message(FC_CONNECTION, self._flagConnected))
+
+    def _cmdDisconnect(self, args):
+
+        self.disconnect()
+        self._conn.send(Message(FC_CONNECTION, self._flagConnected))
     
     def setFreqTarget(self, fTarget):
 
@@ -223,7 +239,6 @@ class FC53230A():
             self._f[1] = d
 
         self._fAvg = np.average(self._f)
-        self._conn.send({'dev': 'FC', 'cmd': 'data', 'args': self._f})
 
         return True
 
@@ -231,6 +246,10 @@ class FC53230A():
 
         return self._fAvg
 
+    def fChannels(self):
+
+        return self._f
+
     # Misc
     def loop_until_counts_acq(self):
 
@@ -13,6 +13,7 @@ from src.FrequencyCounters.kklib import (
 )
 
 from misc.commands import cmds_kk, cmds_values
+from src.messages import *
 
 
 outputPath = r"C:\Users\user\Desktop\FrequencyDriftStabilizer_latest\src\FrequencyCounters/Debug"
@@ -65,32 +66,55 @@ class FXEHandler():
 
         print('FXE handler initiated!', flush=True)
 
-    def parseCommand(self, cmdDict):
-
-        if cmdDict['cmd'] == 'rate':
-            self._rate = cmds_values['rate'][cmdDict['args']]
-            self.send_command(cmds_kk['rate'][cmdDict['args']])
-        elif cmdDict['cmd'] == 'channels':
-            self.setChannels(cmdDict['args'])
-        elif cmdDict['cmd'] == 'mode':
-            if cmdDict['args'] == 'Phase':
-                self.send_command(cmds_kk['mode']['frequency avg'])
-            else: # includes mode == 'Frequency'
-                self.send_command(cmds_kk['mode']['frequency avg'])
-        elif cmdDict['cmd'] == 'devices':
-            ret = self.enumerate_devices()
-            self._conn.send({'dev': 'FC', 'cmd': 'devices', 'args': ret})
-        elif cmdDict['cmd'] == 'connect':
-            self.connect(cmdDict['args'])
-            self._conn.send({'dev': 'FC', 'cmd': 'connection', 'args': self._flagConnected})
-        elif cmdDict['cmd'] == 'disconnect':
-            self.disconnect()
-            self._conn.send({'dev': 'FC', 'cmd': 'connection', 'args': self._flagConnected})
+    def routes(self):
+        '''
+        Returns:
+            dict: opcode: handler of messages parsed by frequency counter
+        '''
+        return {
+            FC_RATE: self._cmdRate,
+            FC_CHANNELS: self.setChannels,
+            FC_MODE: self._cmdMode,
+            FC_DEVICES: self._cmdDevices,
+            FC_CONNECT: self._cmdConnect,
+            FC_DISCONNECT: self._cmdDisconnect
+        }
+
+    def _cmdRate(self, rate):
+
+        self._rate = cmds_values['rate'][rate]
+        self.send_command(cmds_kk['rate'][rate])
+
+    def _cmdMode(self, mode):
+
+        if mode == 'Phase':
+            self.send_command(cmds_kk['mode']['frequency avg'])
+        else: # includes mode == 'Frequency'
+            self.send_command(cmds_kk['mode']['frequency avg'])
+
+    def _cmdDevices(self, args):
+
+        ret = self.enumerate_devices()
+        self._conn.send(Message(FC_DEVICES, ret))
+
+    def _cmdConnect(self, address):
+
+        self.connect(address)
+        self._conn.send(Message(FC_CONNECTION, self._flagConnected))
+
+    def _cmdDisconnect(self, args):
+
+        self.disconnect()
+        self._conn.send(Message(FC_CONNECTION, self._flagConnected))
     
     def fAvg(self):
 
         return self._fAvg
 
+    def fChannels(self):
+
+        return self._f
+
     def isConnected(self):
 
         if self._flagConnected:
@@ -223,7 +247,6 @@ class FXEHandler():
                         self._f[0] = float(data[1]) * 1e3
                         self._f[1] = float(data[2]) * 1e3
                     self._fAvg = np.average(self._f)
-                    self._conn.send({'dev': 'FC', 'cmd': 'data', 'args': self._f})
                     return True
                 except ValueError:
                     return False
@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
 
+from functools import lru_cache
+
 import numpy as np
 
-from scipy.signal import iirfilter, freqz
+from scipy.signal import iirfilter, freqz, sosfreqz, firwin
 
 
 # Conversions
@@ -145,6 +147,39 @@ def get_digital_filter_coefs(order, omega_c, omega_samp, btype='lowpass'):
 
     return fb_coefs, ff_coefs, [w, h]
 
+def get_digital_filter_sos(order, omega_c, omega_samp, btype='lowpass'):
+
+    N = int(order)
+    omega_nyquist = omega_samp/2
+    Wn = omega_c / omega_nyquist # normalise frequency to nyquist frequency
+
+    # cascade of second order sections, well conditioned for high orders
+    sos = iirfilter(N, Wn, btype=btype, output='sos')
+
+    w, h = sosfreqz(sos)
+
+    return sos, [w, h]
+
+def get_decimation_filter(decimation, numtaps=None):
+    '''
+    Lowpass FIR anti-aliasing filter for decimation, unit gain at DC
+
+    Args:
+        decimation: decimation factor
+        numtaps: number of taps, 4*decimation+1 if None, which keeps the
+            delay at two decimated samples
+    Returns:
+        np.array: filter taps
+    '''
+    decimation = int(decimation)
+    if decimation <= 1:
+        return np.ones(1)
+    if numtaps is None:
+        numtaps = 4*decimation + 1
+
+    # cutoff at Nyquist frequency after decimation
+    return firwin(int(numtaps), 1/decimation)
+
 def get_digital_filter_zpk(order, omega_c, omega_samp, btype='lowpass'):
 
     N = int(order)
@@ -154,3 +189,208 @@ def get_digital_filter_zpk(order, omega_c, omega_samp, btype='lowpass'):
     z, p, k = iirfilter(N, Wn, btype=btype, output='zpk')
 
     return z, p, k
+
+
+# Cached designs
+def calc_bode_freqs(f_samp, N=400):
+    '''
+    Logarithmic frequency grid for loop responses, from 1e-5 of the sampling
+    frequency up to the Nyquist frequency
+
+    Args:
+        f_samp: sampling frequency in Hz
+        N: number of points
+    Returns:
+        np.array: frequencies in Hz
+    '''
+    return np.logspace(np.log10(f_samp) - 5, np.log10(f_samp/2), N, endpoint=False)
+
+@lru_cache(maxsize=64)
+def _design_cached(btype, order, f_cutoff, f_samp, gain_dB):
+
+    N = int(order)
+    Wn = f_cutoff / (f_samp/2) # normalise frequency to nyquist frequency
+    gain = dB_to_att(gain_dB)
+
+    b, a = iirfilter(N, Wn, btype=btype)
+    ff_coefs = gain * b / a[0]
+    fb_coefs = -a[1:] / a[0]
+
+    sos = iirfilter(N, Wn, btype=btype, output='sos')
+    sos[0, :3] *= gain
+
+    # response of sections is accurate also for high orders
+    freqs = calc_bode_freqs(f_samp)
+    _, h = sosfreqz(sos, worN=freqs, fs=f_samp)
+
+    ret = (fb_coefs, ff_coefs, sos, freqs, h)
+    # cached arrays are shared between calls
+    for arr in ret:
+        arr.flags.writeable = False
+
+    return ret
+
+def design_filter(order, f_cutoff, f_samp, gain_dB=0, btype='lowpass'):
+    '''
+    Butterworth filter design with its frequency response. Designs are
+    cached on (type, order, cutoff, sampling, gain), so repeated designs
+    cost a dictionary lookup.
+
+    Args:
+        order: filter order
+        f_cutoff: cutoff frequency in Hz
+        f_samp: sampling frequency in Hz
+        gain_dB: filter gain in dB
+        btype: filter type
+    Returns:
+        dict: feedback and feedforward coefficients, second order sections,
+            frequencies in Hz and complex response, all copies of cached values
+    '''
+    fb_coefs, ff_coefs, sos, freqs, h = _design_cached(
+        btype,
+        int(order),
+        float(f_cutoff),
+        float(f_samp),
+        float(gain_dB)
+    )
+
+    ret = {
+        'fb_coefs': fb_coefs.copy(),
+        'ff_coefs': ff_coefs.copy(),
+        'sos': sos.copy(),
+        'freqs': freqs.copy(),
+        'response': h.copy()
+    }
+
+    return ret
+
+
+# Loop responses
+def calc_iir_response(ff_coefs, fb_coefs, zinv):
+    '''
+    Response of IIRFilter, y = sum(ff_coefs*inputs) + sum(fb_coefs*outputs)
+
+    Args:
+        ff_coefs: feedforward coefficients
+        fb_coefs: feedback coefficients
+        zinv: array of exp(-i*omega*dt)
+    Returns:
+        np.array: complex response
+    '''
+    # polynomials in z^-1, highest power first for polyval
+    num = np.polyval(np.asarray(ff_coefs)[::-1], zinv)
+    den = 1 - zinv * np.polyval(np.asarray(fb_coefs)[::-1], zinv)
+
+    return num / den
+
+def calc_loop_response(filterType, params, f_samp, freqs=None, responses=None):
+    '''
+    Open loop response of loop filter and frequency counter. Control set after
+    a measurement affects the next measurement, so the plant is a unit gain
+    with one sample delay. Filter sign is assumed to give negative feedback.
+
+    Args:
+        filterType: 'pid', 'IntLowpass', 'DoubleIntLowpass', 'DoubleIntDoubleLowpass'
+            or 'MultiRateDoubleIntDoubleLowpass'
+        params: loop filter parameters, as sent to the handler
+        f_samp: sampling frequency in Hz
+        freqs: frequencies in Hz, calc_bode_freqs grid if None
+        responses: optional list of precomputed lowpass responses at freqs
+    Returns:
+        np.array: frequencies in Hz
+        dict: complex responses of loop components and of open loop
+    '''
+    if freqs is None:
+        freqs = calc_bode_freqs(f_samp)
+    freqs = np.asarray(freqs, dtype=float)
+    dt = 1/f_samp
+    zinv = np.exp(-2j*np.pi*freqs*dt)
+
+    ki = params.get('ki', 0)
+    kii = params.get('kii', 0)
+    gain = params.get('gain', 1)
+
+    ret = {}
+    # trapezoid integrator
+    ret['Integrator'] = 0.5 * ki * dt * (1 + zinv) / (1 - zinv)
+    # slow terms of multi-rate filter run on decimated error and are held
+    # between updates
+    decimation = int(params.get('decimation', 1))
+    zinvSlow = zinv**decimation
+    if decimation > 1:
+        taps = get_decimation_filter(decimation, params.get('numtaps'))
+        hold = (1 - zinvSlow) / (decimation * (1 - zinv))
+        slow = hold * np.polyval(taps[::-1], zinv)
+    else:
+        slow = 1
+
+    if filterType in ('DoubleIntLowpass', 'DoubleIntDoubleLowpass', 'MultiRateDoubleIntDoubleLowpass') and ki != 0:
+        # direct summation of integral
+        ret['Double integrator'] = kii * dt / ki * ret['Integrator'] / (1 - zinv)
+
+    if filterType == 'pid':
+        lead = params.get('lead_coef', 1)
+        ret['Proportional'] = params.get('kp', 0) * np.ones(freqs.size)
+        ret['Derivative'] = lead * params.get('kd', 0) / dt * (1 - zinv) / (1 - (1 - lead) * zinv)
+    else:
+        if filterType in ('DoubleIntDoubleLowpass', 'MultiRateDoubleIntDoubleLowpass'):
+            coefs = [
+                (params['ff_coefs1'], params['fb_coefs1']),
+                (params['ff_coefs2'], params['fb_coefs2'])
+            ]
+        else:
+            coefs = [(params['ff_coefs'], params['fb_coefs'])]
+
+        if responses is None:
+            responses = [calc_iir_response(ff, fb, zinvSlow) for ff, fb in coefs]
+        # lowpasses in series
+        ret['Lowpass'] = slow * np.prod(responses, axis=0)
+
+    ret['Loop filter'] = gain * np.sum(list(ret.values()), axis=0)
+    ret['Open loop'] = ret['Loop filter'] * zinv
+
+    return freqs, ret
+
+def calc_stability_margins(freqs, L):
+    '''
+    Gain and phase margins of open loop response
+
+    Args:
+        freqs: frequencies in Hz
+        L: complex open loop response
+    Returns:
+        float: gain margin in dB, nan if phase does not cross -180 deg
+        float: phase margin in deg, nan if gain does not cross 1
+        float: gain crossover frequency in Hz
+        float: phase crossover frequency in Hz
+    '''
+    mag = np.abs(L)
+    phase = np.rad2deg(np.unwrap(np.angle(L)))
+
+    # first crossing of unity gain
+    idx = np.flatnonzero((mag[:-1] >= 1) & (mag[1:] < 1))
+    if idx.size:
+        i = idx[0]
+        frac = np.log(mag[i]) / (np.log(mag[i]) - np.log(mag[i+1]))
+        f_gc = freqs[i] * (freqs[i+1]/freqs[i])**frac
+        phaseMargin = 180 + phase[i] + frac*(phase[i+1] - phase[i])
+        # wrap to (-180, 180]
+        phaseMargin = (phaseMargin + 180) % 360 - 180
+    else:
+        f_gc = np.nan
+        phaseMargin = np.nan
+
+    # first crossing of -180 deg, modulo 360
+    idx = np.flatnonzero(np.diff(np.floor((phase + 180) / 360)) < 0)
+    if idx.size:
+        i = idx[0]
+        target = 360 * np.floor((phase[i] + 180) / 360) - 180
+        frac = (phase[i] - target) / (phase[i] - phase[i+1])
+        f_pc = freqs[i] * (freqs[i+1]/freqs[i])**frac
+        magdB = 20*np.log10(mag)
+        gainMargin = - (magdB[i] + frac*(magdB[i+1] - magdB[i]))
+    else:
+        f_pc = np.nan
+        gainMargin = np.nan
+
+    return gainMargin, phaseMargin, f_gc, f_pc
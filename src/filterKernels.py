@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+import config.config as cfg
+from src.filters import IIRFilter
+
+try:
+    from numba import njit
+    numbaAvailable = True
+except ImportError:
+    numbaAvailable = False
+
+    # kernels run as plain Python functions
+    def njit(*args, **kwargs):
+
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+
+        def decorator(func):
+            return func
+
+        return decorator
+
+
+# Indices of loop filter parameters
+P_DT = 0
+P_KI = 1
+P_KII = 2
+P_SIGN = 3
+P_INT_LOW = 4
+P_INT_HIGH = 5
+P_LOW = 6
+P_HIGH = 7
+P_DOUBLE_INT = 8 # 1 if double integrator is used
+P_LOWPASS_COUNT = 9 # number of lowpasses in series, 1 or 2
+P_KAW = 10 # back-calculation anti wind-up gain, 0 disables it
+P_SIZE = 11
+
+# Indices of loop filter state
+S_INTEGRAL = 0
+S_INTEGRAL_DOUBLE = 1
+S_ERROR_CURR = 2
+S_ERROR_LAST = 3
+S_CONTROL = 4
+S_SIZE = 5
+
+
+# ----- Kernels -----
+@njit(cache=True)
+def iir_step(ff_coefs, fb_coefs, inputs, outputs, x):
+
+    # same summation order as IIRFilter.update below 8 coefficients
+    for i in range(inputs.size - 1, 0, -1):
+        inputs[i] = inputs[i-1]
+    inputs[0] = x
+
+    y = ff_coefs[0] * inputs[0]
+    for i in range(1, ff_coefs.size):
+        y += ff_coefs[i] * inputs[i]
+
+    y_fb = fb_coefs[0] * outputs[0]
+    for i in range(1, fb_coefs.size):
+        y_fb += fb_coefs[i] * outputs[i]
+    y += y_fb
+
+    for i in range(outputs.size - 1, 0, -1):
+        outputs[i] = outputs[i-1]
+    outputs[0] = y
+
+    return y
+
+@njit(cache=True)
+def loop_filter_step(params, state, ff1, fb1, in1, out1, ff2, fb2, in2, out2, setpoint, process_variable):
+
+    # Error
+    state[S_ERROR_LAST] = state[S_ERROR_CURR]
+    if params[P_SIGN] == 1:
+        state[S_ERROR_CURR] = setpoint - process_variable
+    elif params[P_SIGN] == -1:
+        state[S_ERROR_CURR] = - setpoint + process_variable
+    error = state[S_ERROR_CURR]
+
+    # Integral, trapezoid approximation
+    I = state[S_INTEGRAL] + 0.5 * params[P_KI] * params[P_DT] * (error + state[S_ERROR_LAST])
+    if I > params[P_INT_HIGH]:
+        I = params[P_INT_HIGH]
+    elif I < params[P_INT_LOW]:
+        I = params[P_INT_LOW]
+    state[S_INTEGRAL] = I
+    control = I
+
+    # Double integral, direct summation
+    if params[P_DOUBLE_INT]:
+        II = state[S_INTEGRAL_DOUBLE] + params[P_KII] * params[P_DT] * I/params[P_KI]
+        if II > params[P_INT_HIGH]:
+            II = params[P_INT_HIGH]
+        elif II < params[P_INT_LOW]:
+            II = params[P_INT_LOW]
+        state[S_INTEGRAL_DOUBLE] = II
+        control += II
+
+    # Lowpass
+    LP = iir_step(ff1, fb1, in1, out1, error)
+    if params[P_LOWPASS_COUNT] > 1:
+        LP = iir_step(ff2, fb2, in2, out2, LP)
+    control += LP
+
+    # Bounds clamping, with back-calculation anti wind-up if enabled
+    unclamped = control
+    if control > params[P_HIGH]:
+        control = params[P_HIGH]
+    elif control < params[P_LOW]:
+        control = params[P_LOW]
+    if params[P_KAW] != 0:
+        if params[P_DOUBLE_INT]:
+            state[S_INTEGRAL_DOUBLE] += params[P_KAW] * params[P_DT] * (control - unclamped)
+        else:
+            state[S_INTEGRAL] += params[P_KAW] * params[P_DT] * (control - unclamped)
+    state[S_CONTROL] = control
+
+    return control
+
+@njit(cache=True)
+def loop_filter_block(params, state, ff1, fb1, in1, out1, ff2, fb2, in2, out2, setpoints, process_variables):
+
+    ret = np.empty(process_variables.size)
+    for i in range(process_variables.size):
+        ret[i] = loop_filter_step(
+            params, state,
+            ff1, fb1, in1, out1,
+            ff2, fb2, in2, out2,
+            setpoints[i], process_variables[i]
+        )
+
+    return ret
+
+
+# ----- Filters -----
+class CompiledLoopFilter():
+    '''
+    Integrator and lowpass loop filter with its state in arrays, updated by
+    a single compiled kernel. Same outputs as IntLowpass, DoubleIntLowpass
+    and DoubleIntDoubleLowpass from filters for lowpasses of fewer than 8
+    coefficients each, longer ones agree up to rounding as np.sum adds them
+    pairwise.
+    '''
+
+    def __init__(self, dt, lowpasses, padding=0, ki=1, kii=0, doubleInt=False, sign=1, int_bounds=(-np.inf,np.inf), bounds=(1e6,100e6), kaw=0):
+
+        self._params = np.zeros(P_SIZE)
+        self._params[P_DOUBLE_INT] = doubleInt
+        self._state = np.zeros(S_SIZE)
+
+        # output printing is decided once, not on every update
+        self._flagPrint = cfg.flagPrintFilterOutput
+
+        self._setParams(dt, ki, kii, sign, int_bounds, bounds, kaw)
+        self._setLowpasses(lowpasses, padding)
+
+    def _setParams(self, dt, ki, kii, sign, int_bounds, bounds, kaw):
+
+        self._params[P_DT] = dt
+        self._params[P_KI] = ki
+        self._params[P_KII] = kii
+        self._params[P_SIGN] = sign
+        self._params[P_INT_LOW], self._params[P_INT_HIGH] = int_bounds
+        self._params[P_LOW], self._params[P_HIGH] = bounds
+        self._params[P_KAW] = kaw
+
+    def _setLowpasses(self, lowpasses, padding):
+
+        self._params[P_LOWPASS_COUNT] = len(lowpasses)
+
+        # second lowpass arrays are not used when there is only one
+        self._lowpasses = []
+        for ff_coefs, fb_coefs in (list(lowpasses) * 2)[:2]:
+            ff_coefs = np.array(ff_coefs, dtype=float, ndmin=1)
+            fb_coefs = np.array(fb_coefs, dtype=float, ndmin=1)
+            self._lowpasses += [
+                ff_coefs,
+                fb_coefs,
+                np.zeros(ff_coefs.size) + padding,
+                np.zeros(fb_coefs.size) + padding
+            ]
+
+    def _swapLowpasses(self, lowpasses):
+
+        # lowpass histories are mapped as in IIRFilter.setFilter
+        swapped = []
+        for i, (ff_coefs, fb_coefs) in enumerate((list(lowpasses) * 2)[:2]):
+            ff_old, fb_old, inputs, outputs = self._lowpasses[4*i:4*i+4]
+            lowpass = IIRFilter(ff_old, fb_old)
+            lowpass.setState(inputs, outputs)
+            lowpass.setFilter(ff_coefs, fb_coefs)
+            inputs, outputs = lowpass.getState()
+            swapped += [
+                np.array(ff_coefs, dtype=float, ndmin=1),
+                np.array(fb_coefs, dtype=float, ndmin=1),
+                inputs,
+                outputs
+            ]
+
+        self._params[P_LOWPASS_COUNT] = len(lowpasses)
+        self._lowpasses = swapped
+
+    def setInitialOffset(self, value):
+
+        if self._params[P_DOUBLE_INT]:
+            self._state[S_INTEGRAL] = 0
+            self._state[S_INTEGRAL_DOUBLE] = value
+        else:
+            self._state[S_INTEGRAL] = value
+
+    def update(self, setpoint, process_variable):
+
+        control = loop_filter_step(
+            self._params,
+            self._state,
+            *self._lowpasses,
+            setpoint,
+            process_variable
+        )
+
+        if self._flagPrint:
+            print('I: {:.9e}\tII: {:.9e}\tControl: {:.9e}'.format(
+                self._state[S_INTEGRAL],
+                self._state[S_INTEGRAL_DOUBLE],
+                control
+            ))
+
+        return control
+
+    def process_block(self, setpoints, process_variables):
+        '''
+        Control values for a block of samples, same as calling update for
+        every sample.
+
+        Args:
+            setpoints: array of setpoints or a single setpoint
+            process_variables: array of process variables
+        Returns:
+            np.array: control values
+        '''
+        process_variables = np.asarray(process_variables, dtype=float)
+        setpoints = np.broadcast_to(np.asarray(setpoints, dtype=float), process_variables.shape)
+
+        return loop_filter_block(
+            self._params,
+            self._state,
+            *self._lowpasses,
+            np.ascontiguousarray(setpoints),
+            process_variables
+        )
+
+    def reset(self):
+
+        self._state[:] = 0
+
+    def set_timestep(self, dt):
+
+        self._params[P_DT] = dt
+
+
+class IntLowpassCompiled(CompiledLoopFilter):
+
+    def __init__(self, dt, ff_coefs, fb_coefs, padding=0, ki=1, sign=1, int_bounds=(-np.inf,np.inf), bounds=(1e6,100e6), kaw=0):
+
+        super().__init__(dt, [(ff_coefs, fb_coefs)], padding, ki, 0, False, sign, int_bounds, bounds, kaw)
+
+    def setFilter(self, dt, ff_coefs, fb_coefs, ki=0, sign=1, int_bounds=(-np.inf,np.inf), bounds=(1e6,100e6), kaw=0):
+
+        self._setParams(dt, ki, 0, sign, int_bounds, bounds, kaw)
+        self._swapLowpasses([(ff_coefs, fb_coefs)])
+
+
+class DoubleIntLowpassCompiled(CompiledLoopFilter):
+
+    def __init__(self, dt, ff_coefs, fb_coefs, padding=0, ki=1, kii=0, sign=1, int_bounds=(-np.inf,np.inf), bounds=(1e6,100e6), kaw=0):
+
+        super().__init__(dt, [(ff_coefs, fb_coefs)], padding, ki, kii, True, sign, int_bounds, bounds, kaw)
+
+    def setFilter(self, dt, ff_coefs, fb_coefs, ki=1, kii=0, sign=1, int_bounds=(-np.inf,np.inf), bounds=(1e6,100e6), kaw=0):
+
+        self._setParams(dt, ki, kii, sign, int_bounds, bounds, kaw)
+        self._swapLowpasses([(ff_coefs, fb_coefs)])
+
+
+class DoubleIntDoubleLowpassCompiled(CompiledLoopFilter):
+
+    def __init__(self, dt, ff_coefs1, fb_coefs1, ff_coefs2, fb_coefs2, padding=0, ki=1, kii=0, sign=1, int_bounds=(-np.inf, np.inf), bounds=(1e6, 100e6), kaw=0):
+
+        super().__init__(dt, [(ff_coefs1, fb_coefs1), (ff_coefs2, fb_coefs2)], padding, ki, kii, True, sign, int_bounds, bounds, kaw)
+
+    def setFilter(self, dt, ff_coefs1, fb_coefs1, ff_coefs2, fb_coefs2, ki=1, kii=0, sign=1, int_bounds=(-np.inf,np.inf), bounds=(1e6,100e6), kaw=0):
+
+        self._setParams(dt, ki, kii, sign, int_bounds, bounds, kaw)
+        self._swapLowpasses([(ff_coefs1, fb_coefs1), (ff_coefs2, fb_coefs2)])
+
+
+# filter type: compiled class
+compiledFilters = {
+    'IntLowpass': IntLowpassCompiled,
+    'DoubleIntLowpass': DoubleIntLowpassCompiled,
+    'DoubleIntDoubleLowpass': DoubleIntDoubleLowpassCompiled
+}
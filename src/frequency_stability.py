@@ -1,6 +1,12 @@
 # -*- coding: utf-8 -*-
 
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from multiprocessing import shared_memory
+
 import numpy as np
+from scipy.special import binom
+from scipy.stats import chi2
 
 
 # ----- Misc -----
@@ -22,25 +28,159 @@ def calc_phase_error(fs_frac, f_sampling):
 
     return ret
 
+def calc_phase_error_compensated(fs_frac, f_sampling, remove_mean=True, block_size=4096):
+    '''
+    Phase error with rounding errors that do not grow with record length.
+    Mean fractional frequency is removed, so the phase does not ramp up,
+    and block sums are carried over with Kahan compensated summation.
+    Removing the mean leaves all deviations unchanged.
+
+    Args:
+        fs_frac: fractional frequency array
+        f_sampling: sampling frequency
+        remove_mean: subtract mean fractional frequency first
+        block_size: number of samples summed directly by np.cumsum
+    Returns:
+        np.array: phase error
+    '''
+
+    tmp = np.asarray(fs_frac, dtype=float)
+    if remove_mean and tmp.size:
+        tmp = tmp - np.mean(tmp)
+
+    ret = np.empty(tmp.size)
+    carry = 0.
+    comp = 0.
+    for start in range(0, tmp.size, block_size):
+        ret[start:start+block_size], carry, comp = calc_cumsum_compensated(
+            tmp[start:start+block_size],
+            carry,
+            comp
+        )
+
+    ret /= f_sampling
+
+    return ret
+
+def calc_cumsum_compensated(arr, carry=0., comp=0.):
+    '''
+    Cumulative sum of a block continued from previous blocks. The running
+    total is carried with Kahan compensation, the block itself is summed
+    by np.cumsum.
+
+    Args:
+        arr: block of values
+        carry: running total of previous blocks
+        comp: compensation of the running total (its lost part, negated)
+    Returns:
+        np.array: cumulative sum
+        float: running total after the block
+        float: compensation after the block
+    '''
+
+    ret = np.cumsum(arr, dtype=float)
+    if ret.size == 0:
+        return ret, carry, comp
+    total = ret[-1]
+
+    ret -= comp
+    ret += carry
+
+    y = total - comp
+    t = carry + y
+    comp = (t - carry) - y
+
+    return ret, t, comp
+
+def calc_phase_block(fs, f0, frac_ref, carry=0., comp=0.):
+    '''
+    Running phase of a block of frequencies as kept by StabilityAccumulator,
+    in units of sampling periods. Non-finite samples are skipped.
+
+    Args:
+        fs: block of frequencies in Hz
+        f0: central frequency in Hz
+        frac_ref: fractional frequency removed from all samples
+        carry: running phase of previous blocks
+        comp: compensation of the running phase
+    Returns:
+        np.array: phase
+        float: running phase after the block
+        float: compensation after the block
+    '''
+    fs = np.asarray(fs, dtype=float)
+    fs = fs[np.isfinite(fs)]
+    frac = (fs - f0) / f0
+
+    return calc_cumsum_compensated(frac - frac_ref, carry, comp)
+
+def calc_averaging_factor(tau, f_sampling):
+
+    # rounding before flooring keeps taus built as n/f_sampling at exactly n
+    ret = np.round(tau * f_sampling, 9)
+    ret = int(np.floor(ret))
+
+    return ret
+
 def calc_array_avg(arr, tau, f_sampling):
 
-    n = tau * f_sampling # averaging factor
-    n = int(np.floor(n)) + 1
-    loop_count = arr.size / n
-    loop_count = int(np.floor(loop_count))
+    n = calc_averaging_factor(tau, f_sampling) + 1 # averaging factor
+    loop_count = arr.size // n
 
-    ret = []
-    iter = 0
-    for _ in range(loop_count):
-        ret.append(np.average(arr[iter:iter+n]))
-        iter += n
+    # consecutive non-overlapping blocks of n samples as rows
+    ret = np.reshape(arr[:loop_count*n], (loop_count, n))
+    ret = np.mean(ret, axis=1)
 
-    return np.array(ret)
+    return ret
 
 def calc_array_diff(arr):
 
-    N = arr.size
-    ret = arr[1:N] - arr[:N-1]
+    ret = np.diff(arr)
+
+    return ret
+
+def calc_array_diff_strided(arr, n):
+
+    # differences of samples n apart, empty if there are none
+    if arr.size <= n:
+        return np.zeros(0)
+    ret = arr[n:] - arr[:arr.size-n]
+
+    return ret
+
+# ----- Tau grid -----
+def calc_tau_grid(N, f_sampling, grid='octave', tau_max_ratio=0.5):
+    '''
+    Generate averaging times which are exact multiples of the sampling period
+
+    Args:
+        N: number of data points
+        f_sampling: sampling frequency in Hz
+        grid: 'octave' (1, 2, 4, 8...), 'decade' (1, 2, 4, 10, 20, 40...),
+            'all' (every averaging factor) or 'many' (about 500 log spaced factors)
+        tau_max_ratio: longest tau as a fraction of record length
+    Returns:
+        np.array: averaging times in s
+    '''
+    if grid not in ('octave', 'decade', 'all', 'many'):
+        raise ValueError('Unknown tau grid: {}'.format(grid))
+
+    n_max = int(np.floor(N * tau_max_ratio))
+    if n_max < 1:
+        return np.array([])
+
+    if grid == 'octave':
+        ns = np.power(2, np.arange(int(np.log2(n_max)) + 1))
+    elif grid == 'decade':
+        ns = np.outer(np.power(10, np.arange(int(np.log10(n_max)) + 1)), [1, 2, 4]).flatten()
+    elif grid == 'all':
+        ns = np.arange(1, n_max + 1)
+    else:
+        ns = np.logspace(0, np.log10(n_max), 500)
+        ns = np.unique(np.floor(ns))
+
+    ns = ns[ns <= n_max]
+    ret = ns / f_sampling
 
     return ret
 
@@ -62,7 +202,10 @@ def calc_ADEV_single(phase_error, tau):
 
     return ret
 
-def calc_ADEV(phase_error, taus):
+def calc_ADEV(phase_error, taus, workers=None):
+
+    if workers:
+        return calc_deviation_parallel(phase_error, taus, None, 'ADEV', workers)
 
     ret = []
     print('Calculating Allan deviation...')
@@ -74,77 +217,881 @@ def calc_ADEV(phase_error, taus):
 
 def calc_ADEV_overlapped_single(phase_error, tau, f_sampling):
 
+    phase_error = np.asarray(phase_error, dtype=float)
     N = phase_error.size
-    n = tau * f_sampling # averaging factor
-    n = int(np.floor(n))
-    # print(N, n, flush=True)
+    n = calc_averaging_factor(tau, f_sampling)
+    if N - 2*n <= 0:
+        return np.nan
 
-    ret = 0
-    for i in range(N - 2*n):
-        tmp = phase_error[i + 2*n]
-        tmp -= 2*phase_error[i+n]
-        tmp += phase_error[i]
+    # second differences with stride n over the whole record
+    tmp = phase_error[2*n:]
+    tmp = tmp - 2*phase_error[n:N-n]
+    tmp += phase_error[:N-2*n]
 
-        ret += np.power(tmp, 2)
-    # print(ret, (2*(N - 2*n)*np.power(tau, 2)), flush=True)
+    ret = np.dot(tmp, tmp)
     ret /= (2*(N - 2*n)*np.power(tau, 2))
     ret = np.sqrt(ret)
 
     return ret
 
-def calc_ADEV_overlapped(phase_error, taus, f_sampling):
+def calc_ADEV_overlapped(phase_error, taus, f_sampling, workers=None):
+
+    if workers:
+        return calc_deviation_parallel(phase_error, taus, f_sampling, 'ADEV overlapped', workers)
 
-    ret = []
     print('Calculating overlapped Allan deviation...')
+    phase_error = np.asarray(phase_error, dtype=float)
     
-    for tau in taus:
-        ret.append(calc_ADEV_overlapped_single(phase_error, tau, f_sampling))
+    ret = [calc_ADEV_overlapped_single(phase_error, tau, f_sampling) for tau in taus]
+
+    return np.array(ret)
+
+def calc_phase_prefix_sum(phase_error):
+
+    # remove offset first, deviations do not depend on it
+    tmp = np.asarray(phase_error, dtype=float)
+    tmp = tmp - np.average(tmp)
+
+    ret = np.zeros(tmp.size + 1)
+    np.cumsum(tmp, out=ret[1:])
+
+    return ret
+
+def calc_MDEV_single(phase_error, tau, f_sampling, prefix_sum=None):
+
+    if prefix_sum is None:
+        prefix_sum = calc_phase_prefix_sum(phase_error)
+    N = prefix_sum.size - 1
+    n = calc_averaging_factor(tau, f_sampling)
+    if n < 1 or N - 3*n + 1 <= 0:
+        return np.nan
+
+    # n-sample sums of second differences from the prefix sums, O(N) per tau
+    tmp = prefix_sum[3*n:]
+    tmp = tmp - 3*prefix_sum[2*n:N+1-n]
+    tmp += 3*prefix_sum[n:N+1-2*n]
+    tmp -= prefix_sum[:N+1-3*n]
+
+    ret = np.dot(tmp, tmp)
+    ret /= (2*np.power(n, 2)*(N - 3*n + 1)*np.power(tau, 2))
+    ret = np.sqrt(ret)
+
+    return ret
+
+def calc_MDEV(phase_error, taus, f_sampling):
+
+    print('Calculating modified Allan deviation...')
+    prefix_sum = calc_phase_prefix_sum(phase_error)
+
+    ret = [calc_MDEV_single(phase_error, tau, f_sampling, prefix_sum) for tau in taus]
+
+    return np.array(ret)
+
+def calc_TDEV_single(phase_error, tau, f_sampling, prefix_sum=None):
+
+    ret = calc_MDEV_single(phase_error, tau, f_sampling, prefix_sum)
+    ret *= tau / np.sqrt(3)
+
+    return ret
+
+def calc_TDEV(phase_error, taus, f_sampling):
+
+    print('Calculating time deviation...')
+    prefix_sum = calc_phase_prefix_sum(phase_error)
+
+    ret = [calc_TDEV_single(phase_error, tau, f_sampling, prefix_sum) for tau in taus]
 
     return np.array(ret)
 
 def calc_HDEV_single(phase_error, tau, f_sampling):
 
+    phase_error = np.asarray(phase_error, dtype=float)
     N = phase_error.size
-    n = tau * f_sampling # averaging factor
-    n = int(np.floor(n))
-
-    ret = 0
-    for i in range(N - 3*n):
-        tmp = phase_error[i + 3*n]
-        tmp -= 3*phase_error[i+2*n]
-        tmp += 3*phase_error[i+n]
-        tmp -= phase_error[i]
+    n = calc_averaging_factor(tau, f_sampling)
+    if N - 3*n <= 0:
+        return np.nan
 
-        ret += np.power(tmp, 2)
+    # third differences with stride n over the whole record
+    tmp = phase_error[3*n:]
+    tmp = tmp - 3*phase_error[2*n:N-n]
+    tmp += 3*phase_error[n:N-2*n]
+    tmp -= phase_error[:N-3*n]
 
+    ret = np.dot(tmp, tmp)
     ret /= (6*(N - 3*n)*np.power(tau, 2))
     ret = np.sqrt(ret)
 
     return ret
 
-def calc_HDEV(phase_error, taus, f_sampling):
+def calc_HDEV(phase_error, taus, f_sampling, workers=None):
+
+    if workers:
+        return calc_deviation_parallel(phase_error, taus, f_sampling, 'HDEV', workers)
 
-    ret = []
     print('Calculating Hadamard deviation...')
-    for tau in taus:
-        ret.append(calc_HDEV_single(phase_error, tau, f_sampling))
+    phase_error = np.asarray(phase_error, dtype=float)
+
+    ret = [calc_HDEV_single(phase_error, tau, f_sampling) for tau in taus]
+
+    return np.array(ret)
+
+def calc_phase_reflected(phase_error):
+
+    # extend the record by reflecting it about both end points
+    phase_error = np.asarray(phase_error, dtype=float)
+    tmp = phase_error[1:-1][::-1]
+    ret = np.concatenate((2*phase_error[0] - tmp, phase_error, 2*phase_error[-1] - tmp))
+
+    return ret
+
+def calc_TOTDEV_single(phase_error, tau, f_sampling, reflected=None):
+
+    phase_error = np.asarray(phase_error, dtype=float)
+    N = phase_error.size
+    n = calc_averaging_factor(tau, f_sampling)
+    if n < 1 or n > N - 1 or N < 3:
+        return np.nan
+
+    if reflected is None:
+        reflected = calc_phase_reflected(phase_error)
+    x = reflected
+    mid = N - 2 # index of phase_error[0] in x
+
+    # second differences centred on every inner point of the original record
+    tmp = x[mid+1-n:mid+N-1-n]
+    tmp = tmp - 2*x[mid+1:mid+N-1]
+    tmp += x[mid+1+n:mid+N-1+n]
+
+    ret = np.dot(tmp, tmp)
+    ret /= (2*(N - 2)*np.power(tau, 2))
+    ret = np.sqrt(ret)
+
+    return ret
+
+def calc_TOTDEV(phase_error, taus, f_sampling):
+
+    print('Calculating total deviation...')
+    phase_error = np.asarray(phase_error, dtype=float)
+    reflected = calc_phase_reflected(phase_error) if phase_error.size >= 3 else None
+
+    ret = [calc_TOTDEV_single(phase_error, tau, f_sampling, reflected) for tau in taus]
 
     return np.array(ret)
 
+def calc_theo1_factor(tau, f_sampling):
+
+    # Theo1 is defined for tau = 0.75*m/f_sampling with even m
+    ret = np.round(tau * f_sampling / 1.5, 9)
+    ret = 2*int(np.round(ret))
+
+    return ret
+
+def calc_autocorrelation(x, n):
+
+    # linear, not circular, autocorrelation at lags 0..n-1
+    nfft = 1 << int(2*x.size - 1).bit_length()
+    tmp = np.fft.rfft(x, nfft)
+    ret = np.fft.irfft(tmp * np.conj(tmp), nfft)[:n]
+
+    return ret
+
+def calc_theo1_sums(phase_error, ms):
+    '''
+    Double sums of Theo1 for several even averaging factors at once
+
+    Each term x(i) - x(i+a) - x(i+m-a) + x(i+m) is squared and expanded into
+    products of phase. Summed over i they are running sums of squares, the
+    autocorrelation of the whole record, calculated with one FFT, and edge
+    terms of the first and last m points: their autocorrelation and sums
+    along half diagonals of their products. Edge terms are updated from the
+    previous m, so all m together cost about one pass over pairs of the
+    first max(ms) points instead of one FFT per a.
+
+    Expanded terms are much larger than the sum when phase wanders far, as
+    for random walk FM, so sums below 1e-6 of them are calculated directly to
+    keep relative rounding errors around 1e-9.
+
+    Args:
+        phase_error: phase data
+        ms: even averaging factors, each not larger than N - 1
+    Returns:
+        np.array: sums for each m
+    '''
+    x = np.asarray(phase_error, dtype=float)
+    ms = np.asarray(ms, dtype=int)
+    N = x.size
+    ret = np.zeros(ms.size)
+    if ms.size == 0:
+        return ret
+
+    # terms do not depend on linear trend of phase
+    i = np.arange(N)
+    x = x - np.polyval(np.polyfit(i, x, 1), i)
+    xr = x[::-1].copy() # edge terms of the last points are the same for reversed phase
+
+    autocorr = calc_autocorrelation(x, N)
+    squares = np.zeros(N + 1)
+    np.cumsum(x*x, out=squares[1:])
+
+    m_max = ms.max()
+    # padding for lags longer than index
+    xp = np.concatenate((np.zeros(m_max), x))
+    xrp = np.concatenate((np.zeros(m_max), xr))
+    edge_autocorr = np.zeros(m_max) # of first m plus last m points
+    edge_diagonals = np.zeros(m_max//2 + 1) # sums of x(j)*x(j+d) over 2j + d < m, even d
+
+    m_prev = 0
+    ms_unique, inverse = np.unique(ms, return_inverse=True)
+    sums = np.zeros(ms_unique.size)
+    for k, m in enumerate(ms_unique):
+        step = m - m_prev
+        if step > 2*int(m).bit_length():
+            edge_autocorr[:m] = calc_autocorrelation(x[:m], m) + calc_autocorrelation(xr[:m], m)
+        else:
+            l = np.arange(m)
+            for j in range(m_prev, m):
+                edge_autocorr[:m] += x[j]*xp[m_max+j-l] + xr[j]*xrp[m_max+j-l]
+
+        d = np.arange(0, m, 2)
+        j0 = np.maximum(0, (m_prev - d)//2)
+        for q in range(step//2):
+            j = j0 + q
+            valid = j < (m - d)//2
+            j[~valid] = 0
+            edge_diagonals[:d.size] += np.where(valid, x[j]*x[j+d] + xr[j]*xr[j+d], 0)
+        m_prev = m
+
+        a = np.arange(1, m//2 + 1)
+        K = N - m
+        tmp = squares[K] + squares[a+K] - squares[a] + squares[m-a+K] - squares[m-a] + squares[N] - squares[m]
+        tmp += 2*autocorr[m] + 2*autocorr[m-2*a] - 4*autocorr[a] - 4*autocorr[m-a]
+        ret_m = np.sum(tmp / a)
+        # products across the first and last m points, lags a and m - a
+        l = np.arange(1, m)
+        weights = np.where(2*l <= m, 2/l, 0) + np.where(2*l >= m, 2/np.maximum(m - l, 1), 0)
+        ret_m += np.dot(weights, edge_autocorr[1:m])
+        ret_m -= np.sum(2/a * edge_diagonals[(m - 2*a)//2])
+
+        if ret_m < 1e-6 * 16*squares[N]*np.sum(1/a):
+            ret_m = 0
+            for b in a:
+                tmp = x[:K] - x[b:b+K] - x[m-b:m-b+K] + x[m:]
+                ret_m += np.dot(tmp, tmp) / b
+        sums[k] = ret_m
+
+    ret = sums[inverse]
+
+    return ret
+
+def calc_THEO1(phase_error, taus, f_sampling):
+    '''
+    Theo1 deviation. Taus are rounded to the nearest 0.75*m/f_sampling with even m.
+    '''
+    phase_error = np.asarray(phase_error, dtype=float)
+    N = phase_error.size
+    ms = np.array([calc_theo1_factor(tau, f_sampling) for tau in taus], dtype=int)
+    valid = (ms >= 2) & (ms <= N - 1)
+
+    ret = np.zeros(ms.size) * np.nan
+    m = ms[valid]
+    tmp = calc_theo1_sums(phase_error, m)
+    tmp /= 0.75*(N - m)*np.power(m / f_sampling, 2)
+    ret[valid] = np.sqrt(tmp)
+
+    return ret
+
+def calc_THEO1_single(phase_error, tau, f_sampling):
+
+    return calc_THEO1(phase_error, [tau], f_sampling)[0]
+
+def calc_THEOBR_ratio(phase_error, f_sampling):
+    '''
+    Bias ratio of Allan and Theo1 variances used by TheoBR and TheoH (Howe)
+
+    Returns:
+        float: average of AVAR(m=9+3i)/Theo1(m=12+4i) for i=0..N/6-3
+    '''
+    phase_error = np.asarray(phase_error, dtype=float)
+    N = phase_error.size
+    n = int(np.floor(N/6 - 3))
+    if n < 0:
+        return np.nan
+
+    i = np.arange(n + 1)
+    taus_avar = (9 + 3*i) / f_sampling
+    taus_theo1 = 0.75*(12 + 4*i) / f_sampling # same taus as for Allan variance
+
+    avar = np.array([calc_ADEV_overlapped_single(phase_error, tau, f_sampling) for tau in taus_avar])
+    theo1 = calc_THEO1(phase_error, taus_theo1, f_sampling)
+
+    # the longest Allan variance may have no terms left
+    ret = np.nanmean(np.power(avar/theo1, 2))
+
+    return ret
+
+def calc_THEOH(phase_error, taus, f_sampling, k_ratio=0.1):
+    '''
+    Hybrid TheoH deviation: overlapped Allan deviation for taus up to k_ratio of
+    the record length and bias corrected Theo1 above it, up to 0.75 of the record.
+    '''
+    phase_error = np.asarray(phase_error, dtype=float)
+    taus = np.asarray(taus, dtype=float)
+    T = phase_error.size / f_sampling
+    short = taus <= k_ratio*T
+
+    ret = np.zeros(taus.size) * np.nan
+    ret[short] = [calc_ADEV_overlapped_single(phase_error, tau, f_sampling) for tau in taus[short]]
+    if np.any(~short):
+        ratio = calc_THEOBR_ratio(phase_error, f_sampling)
+        ret[~short] = np.sqrt(ratio) * calc_THEO1(phase_error, taus[~short], f_sampling)
+
+    return ret
+
+# deviations calculated tau by tau in calc_deviations_batch
+deviations_single = frozenset((
+    'ADEV overlapped',
+    'HDEV',
+    'MDEV',
+    'TDEV',
+    'TOTDEV'
+))
+# deviations calculated for all taus at once in calc_deviations_batch
+deviations_multi = {
+    'Theo1': calc_THEO1,
+    'TheoH': calc_THEOH
+}
+
+def calc_deviations_batch(fs, f0, f_sampling, taus=None, grid='octave', deviations=('ADEV overlapped', 'HDEV')):
+    '''
+    Calculate several deviations for every tau from one phase record. All
+    deviations of a tau are calculated in one pass: differences of phase
+    with stride of the averaging factor are shared by ADEV and HDEV,
+    differences of the prefix sums by MDEV and TDEV.
+
+    Args:
+        fs: measured frequencies in Hz
+        f0: central frequency in Hz
+        f_sampling: sampling frequency in Hz
+        taus: averaging times in s, if None they are generated with calc_tau_grid
+        grid: type of tau grid used when taus is None
+        deviations: names of deviations from deviations_single or deviations_multi
+    Returns:
+        tuple: (taus, dict with deviations for each name)
+    '''
+    for name in deviations:
+        if name not in deviations_single and name not in deviations_multi:
+            raise ValueError('Unknown deviation: {}'.format(name))
+
+    fs = np.asarray(fs, dtype=float)
+    if taus is None:
+        taus = calc_tau_grid(fs.size, f_sampling, grid)
+
+    # fractional frequency and its cumulative sum are calculated only once
+    fs_frac = calc_fractional_frequency(fs, f0)
+    phase_error = calc_phase_error_compensated(fs_frac, f_sampling)
+    N = phase_error.size
+
+    ret = {}
+    for name in deviations:
+        if name in deviations_multi:
+            ret[name] = deviations_multi[name](phase_error, taus, f_sampling)
+        else:
+            ret[name] = np.zeros(len(taus)) * np.nan
+
+    flagDiffs = 'ADEV overlapped' in ret or 'HDEV' in ret
+    flagMDEV = 'MDEV' in ret or 'TDEV' in ret
+    prefix_sum = calc_phase_prefix_sum(phase_error) if flagMDEV else None
+    reflected = calc_phase_reflected(phase_error) if 'TOTDEV' in ret and N >= 3 else None
+
+    for k, tau in enumerate(taus):
+        n = calc_averaging_factor(tau, f_sampling)
+        if n < 1:
+            continue
+
+        # second and third differences, each from the previous one
+        if flagDiffs:
+            tmp = calc_array_diff_strided(calc_array_diff_strided(phase_error, n), n)
+            if 'ADEV overlapped' in ret and tmp.size:
+                ret['ADEV overlapped'][k] = np.sqrt(np.dot(tmp, tmp) / (2*tmp.size*np.power(tau, 2)))
+            tmp = calc_array_diff_strided(tmp, n)
+            if 'HDEV' in ret and tmp.size:
+                ret['HDEV'][k] = np.sqrt(np.dot(tmp, tmp) / (6*tmp.size*np.power(tau, 2)))
+
+        # second differences of n-sample sums
+        if prefix_sum is not None:
+            tmp = calc_array_diff_strided(prefix_sum, n)
+            tmp = calc_array_diff_strided(calc_array_diff_strided(tmp, n), n)
+            if tmp.size:
+                mdev = np.sqrt(np.dot(tmp, tmp) / (2*np.power(n, 2)*tmp.size*np.power(tau, 2)))
+                if 'MDEV' in ret:
+                    ret['MDEV'][k] = mdev
+                if 'TDEV' in ret:
+                    ret['TDEV'][k] = mdev * tau / np.sqrt(3)
+
+        if reflected is not None:
+            ret['TOTDEV'][k] = calc_TOTDEV_single(phase_error, tau, f_sampling, reflected)
+
+    return taus, ret
+
+# ----- Parallel -----
+# deviation: (difference coefficients, normalization) of the sums of
+# squared phase differences evaluated by calc_deviation_parallel
+difference_params = {
+    'ADEV': (np.array([1., -2., 1.]), 2),
+    'ADEV overlapped': (np.array([1., -2., 1.]), 2),
+    'HDEV': (np.array([-1., 3., -3., 1.]), 6)
+}
+
+_shared_phase_memory = None
+_shared_phase = None
+
+def _attach_shared_phase(name, N):
+
+    global _shared_phase_memory, _shared_phase
+
+    # the phase array is mapped, not copied, into every worker
+    _shared_phase_memory = shared_memory.SharedMemory(name=name)
+    _shared_phase = np.ndarray((N,), dtype=float, buffer=_shared_phase_memory.buf)
+
+def _calc_difference_sum(coefs, stride, start, stop):
+
+    # squared differences x[i + j*stride] weighted by coefs[j] for start <= i < stop
+    x = _shared_phase
+    tmp = coefs[0] * x[start:stop]
+    for j in range(1, coefs.size):
+        tmp += coefs[j] * x[start + j*stride:stop + j*stride]
+
+    return np.dot(tmp, tmp)
+
+def calc_deviation_parallel(phase_error, taus, f_sampling, deviation='ADEV overlapped', workers=None, chunk_size=2**20):
+    '''
+    Deviations calculated by a pool of processes. Sums for different taus
+    and for chunks of long records are evaluated independently.
+
+    Args:
+        phase_error: phase error array
+        taus: averaging times
+        f_sampling: sampling frequency, not used for 'ADEV'
+        deviation: name of deviation from difference_params
+        workers: number of processes, all cores if None
+        chunk_size: maximal number of differences summed by one task
+    Returns:
+        ndarray: deviations, nan where record is too short
+    '''
+
+    phase_error = np.asarray(phase_error, dtype=float)
+    N = phase_error.size
+    coefs, norm = difference_params[deviation]
+    order = coefs.size - 1
+
+    # calc_ADEV uses consecutive points for all taus
+    if deviation == 'ADEV':
+        strides = [1 for _ in taus]
+    else:
+        strides = [calc_averaging_factor(tau, f_sampling) for tau in taus]
+
+    print('Calculating {} with a process pool...'.format(deviation))
+    shm = shared_memory.SharedMemory(create=True, size=max(phase_error.nbytes, 1))
+    try:
+        shared = np.ndarray((N,), dtype=float, buffer=shm.buf)
+        shared[:] = phase_error
+
+        sums = {}
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_attach_shared_phase,
+            initargs=(shm.name, N)
+        ) as pool:
+            # same stride gives the same sum, it is calculated once
+            futures = {}
+            for stride in set(strides):
+                count = N - order*stride
+                if stride < 1 or count <= 0:
+                    continue
+                futures[stride] = [
+                    pool.submit(_calc_difference_sum, coefs, stride, start, min(start + chunk_size, count))
+                    for start in range(0, count, chunk_size)
+                ]
+            for stride in futures:
+                sums[stride] = sum(future.result() for future in futures[stride])
+        del shared
+    finally:
+        shm.close()
+        shm.unlink()
+
+    ret = np.zeros(len(strides)) * np.nan
+    for i, stride in enumerate(strides):
+        if stride in sums:
+            ret[i] = sums[stride] / (norm*(N - order*stride)*np.power(taus[i], 2))
+    ret = np.sqrt(ret)
+
+    return ret
+
+# ----- Streaming -----
+class StabilityAccumulator():
+
+    def __init__(self, taus, f_sampling, f0):
+
+        self._taus = np.asarray(taus, dtype=float)
+        self._f_sampling = f_sampling
+        self._f0 = f0
+
+        # averaging factors, same as in calc_ADEV_overlapped_single
+        self._ns = np.array([calc_averaging_factor(tau, f_sampling) for tau in self._taus], dtype=int)
+        # phase history long enough for third differences of the longest tau
+        self._size = 3*int(self._ns.max(initial=0)) + 1
+        self._offsets = np.outer(np.arange(1, 4), self._ns)
+
+        self.reset()
+
+    def reset(self):
+        '''
+        Forget all accumulated data
+        '''
+        self._history = np.zeros(self._size)
+        self._pos = -1 # index of the newest phase sample in history
+        self._count = 0 # number of phase samples seen
+        self._phase = 0. # running sum of fractional frequency
+        self._phaseComp = 0. # Kahan compensation of the running sum
+        self._fracRef = None # removed frequency offset, keeps the phase small
+
+        self._sum2 = np.zeros(self._ns.size) # sums of squared second differences
+        self._sum3 = np.zeros(self._ns.size) # sums of squared third differences
+
+    def setCentralFrequency(self, f0):
+        '''
+        Change central frequency used for fractional frequency. Resets accumulated data.
+
+        Args:
+            f0: central frequency in Hz
+        '''
+        self._f0 = f0
+        self.reset()
+
+    def count(self):
+
+        return self._count
+
+    def update(self, f):
+        '''
+        Add one frequency sample. Cost is O(number of taus) regardless of history length.
+
+        Args:
+            f: measured frequency in Hz
+        '''
+        if not np.isfinite(f):
+            return
+
+        # differences do not depend on a linear phase ramp, so the offset
+        # of the first sample is removed from all samples
+        frac = (f - self._f0) / self._f0
+        if self._fracRef is None:
+            self._fracRef = frac
+
+        # compensated sum, long runs do not accumulate rounding errors
+        y = (frac - self._fracRef) - self._phaseComp
+        t = self._phase + y
+        self._phaseComp = (t - self._phase) - y
+        self._phase = t
+
+        self._pos = (self._pos + 1) % self._size
+        self._history[self._pos] = self._phase
+
+        x = self._history[(self._pos - self._offsets) % self._size]
+        x1 = x[0]
+        x2 = x[1]
+        x3 = x[2]
+
+        # second differences
+        tmp = self._phase - 2*x1
+        tmp += x2
+        tmp *= tmp
+        # only for taus with enough history
+        if self._count < self._size:
+            tmp[self._count < 2*self._ns] = 0
+        self._sum2 += tmp
+
+        # third differences
+        tmp = self._phase - 3*x1
+        tmp += 3*x2
+        tmp -= x3
+        tmp *= tmp
+        if self._count < self._size:
+            tmp[self._count < 3*self._ns] = 0
+        self._sum3 += tmp
+
+        self._count += 1
+
+    def updateBlock(self, fs):
+        '''
+        Add a block of frequency samples. Same result as calling update for
+        each sample, with the differences evaluated by array operations.
+
+        Args:
+            fs: array of measured frequencies in Hz
+        '''
+        fs = np.asarray(fs, dtype=float)
+        fs = fs[np.isfinite(fs)]
+        B = fs.size
+        if B == 0:
+            return
+
+        if self._fracRef is None:
+            self._fracRef = np.mean((fs - self._f0) / self._f0)
+        phase, self._phase, self._phaseComp = calc_phase_block(
+            fs,
+            self._f0,
+            self._fracRef,
+            self._phase,
+            self._phaseComp
+        )
+
+        # stored history in chronological order followed by the new phase
+        P = min(self._count, self._size - 1)
+        idx = (self._pos - np.arange(P)[::-1]) % self._size
+        ext = np.concatenate((self._history[idx], phase))
+
+        for i, n in enumerate(self._ns):
+            # first new sample with enough history for this tau
+            k = P + max(0, 2*n - self._count)
+            if k < ext.size:
+                tmp = ext[k:] - 2*ext[k-n:ext.size-n]
+                tmp += ext[k-2*n:ext.size-2*n]
+                self._sum2[i] += np.dot(tmp, tmp)
+
+            k = P + max(0, 3*n - self._count)
+            if k < ext.size:
+                tmp = ext[k:] - 3*ext[k-n:ext.size-n]
+                tmp += 3*ext[k-2*n:ext.size-2*n]
+                tmp -= ext[k-3*n:ext.size-3*n]
+                self._sum3[i] += np.dot(tmp, tmp)
+
+        # keep the newest samples, oldest first
+        tail = ext[-self._size:]
+        self._history[:] = 0
+        self._history[:tail.size] = tail
+        self._pos = tail.size - 1
+
+        self._count += B
+
+    def getPhaseState(self):
+        '''
+        Returns:
+            int: number of samples seen
+            float: running phase
+            float: compensation of the running phase
+        '''
+        return self._count, self._phase, self._phaseComp
+
+    def getFracRef(self):
+        '''
+        Returns:
+            float: fractional frequency removed from all samples, None before
+                the first sample
+        '''
+        return self._fracRef
+
+    def getADEV(self):
+        '''
+        Overlapped Allan deviation of all data seen so far
+
+        Returns:
+            np.array: deviations for each tau, nan where there is not enough data
+        '''
+        return calc_deviation_from_sums(self._sum2, self._count, self._ns, self._taus, self._f_sampling, 2)
+
+    def getHDEV(self):
+        '''
+        Hadamard deviation of all data seen so far
+
+        Returns:
+            np.array: deviations for each tau, nan where there is not enough data
+        '''
+        return calc_deviation_from_sums(self._sum3, self._count, self._ns, self._taus, self._f_sampling, 3)
+
+def calc_deviation_from_sums(sums, count, ns, taus, f_sampling, d):
+    '''
+    Overlapped Allan (d = 2) or Hadamard (d = 3) deviation from sums of
+    squared d-th differences of phase in sampling periods
+
+    Args:
+        sums: sums of squared differences for each tau
+        count: number of phase samples
+        ns: averaging factors
+        taus: averaging times
+        f_sampling: sampling frequency
+        d: order of differences
+    Returns:
+        np.array: deviations for each tau, nan where there is not enough data
+    '''
+    N = count - d*np.asarray(ns)
+    factor = 2 if d == 2 else 6
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ret = sums / (factor*N*np.power(taus, 2))
+    ret = np.where(N <= 0, np.nan, ret)
+    ret = np.sqrt(ret) / f_sampling
+
+    return ret
+
+def iterate_chunks(fs, chunk_size=2**20):
+    '''
+    Blocks of frequency samples from an array or an iterable of blocks.
+
+    Args:
+        fs: array-like (e.g. np.memmap) or iterable of arrays
+        chunk_size: number of samples in a block taken from an array
+    '''
+    if hasattr(fs, 'shape'):
+        for start in range(0, fs.shape[0], chunk_size):
+            yield np.asarray(fs[start:start+chunk_size], dtype=float)
+    else:
+        for chunk in fs:
+            yield np.asarray(chunk, dtype=float)
+
+def calc_phase_error_chunks(fs, f0, f_sampling, chunk_size=2**20):
+    '''
+    Phase error of consecutive blocks of frequency samples, continued
+    from block to block.
+
+    Args:
+        fs: array-like (e.g. np.memmap) or iterable of arrays
+        f0: central frequency in Hz
+        f_sampling: sampling frequency
+        chunk_size: number of samples in a block taken from an array
+    '''
+    carry = 0.
+    comp = 0.
+    for chunk in iterate_chunks(fs, chunk_size):
+        if chunk.size == 0:
+            continue
+        tmp = calc_fractional_frequency(chunk, f0)
+        tmp, carry, comp = calc_cumsum_compensated(tmp, carry, comp)
+
+        yield tmp / f_sampling
+
+def calc_streaming_sums_long(fs, f0, ns, counts, carries, frac_ref, chunk_size=2**20):
+    '''
+    Sums of squared second and third differences of phase for taus too long
+    for the history of StabilityAccumulator. Phase of any range is rebuilt
+    from the chunks of fs covering it and the running phase recorded before
+    each chunk in the first pass, so each tau takes one more pass over fs
+    reading it at four offsets.
+
+    Args:
+        fs: array-like (e.g. np.memmap) of frequencies in Hz
+        f0: central frequency in Hz
+        ns: averaging factors
+        counts: number of finite samples before each chunk and in total
+        carries: (running phase, compensation) before each chunk
+        frac_ref: fractional frequency removed from all samples
+        chunk_size: number of samples in a chunk of the first pass
+    Returns:
+        np.array: sums of squared second differences
+        np.array: sums of squared third differences
+    '''
+
+    def phase(a, b):
+
+        # phase of finite samples a to b - 1
+        first = np.searchsorted(counts, a, side='right') - 1
+        ret = [np.zeros(0)]
+        j = first
+        while j < len(carries) and counts[j] < b:
+            tmp, _, _ = calc_phase_block(fs[j*chunk_size:(j+1)*chunk_size], f0, frac_ref, *carries[j])
+            ret.append(tmp)
+            j += 1
+        ret = np.concatenate(ret)
+
+        return ret[a-counts[first]:b-counts[first]]
+
+    N = counts[-1]
+    sum2 = np.zeros(len(ns))
+    sum3 = np.zeros(len(ns))
+    for i, n in enumerate(ns):
+        for start in range(0, max(N - 2*n, 0), chunk_size):
+            L = min(chunk_size, N - 2*n - start)
+            x0 = phase(start, start + L)
+            x1 = phase(start + n, start + n + L)
+            x2 = phase(start + 2*n, start + 2*n + L)
+            tmp = x2 - 2*x1
+            tmp += x0
+            sum2[i] += np.dot(tmp, tmp)
+
+            L = min(L, N - 3*n - start)
+            if L > 0:
+                tmp = phase(start + 3*n, start + 3*n + L) - 3*x2[:L]
+                tmp += 3*x1[:L]
+                tmp -= x0[:L]
+                sum3[i] += np.dot(tmp, tmp)
+
+    return sum2, sum3
+
+def calc_deviations_streaming(fs, f0, f_sampling, taus=None, grid='octave', chunk_size=2**20, max_history=2**22):
+    '''
+    Overlapped Allan and Hadamard deviation of data larger than RAM. Taus
+    whose 3n + 1 phase samples of history fit in max_history are calculated
+    in a single pass, longer ones in one more pass over fs each, so memory
+    use is a few times chunk_size plus max_history samples.
+
+    Args:
+        fs: array-like (e.g. np.memmap) or iterable of arrays of frequencies,
+            iterables can only be used for taus within max_history
+        f0: central frequency in Hz
+        f_sampling: sampling frequency
+        taus: averaging times, required if fs is an iterable
+        grid: tau grid used if taus is None
+        chunk_size: number of samples in a block taken from an array
+        max_history: longest phase history kept in samples
+    Returns:
+        np.array: taus
+        dict: deviation name -> array of deviations
+    '''
+    arrayLike = hasattr(fs, 'shape')
+    if taus is None:
+        if not arrayLike:
+            raise ValueError('Taus are required for iterable input')
+        taus = calc_tau_grid(fs.shape[0], f_sampling, grid)
+
+    taus = np.asarray(taus, dtype=float)
+    ns = np.array([calc_averaging_factor(tau, f_sampling) for tau in taus], dtype=int)
+    long = 3*ns + 1 > max_history
+    if np.any(long) and not arrayLike:
+        raise ValueError('Taus longer than max_history/3 samples require array-like input')
+
+    acc = StabilityAccumulator(taus[~long], f_sampling, f0)
+    counts = []
+    carries = []
+    for chunk in iterate_chunks(fs, chunk_size):
+        count, phase, comp = acc.getPhaseState()
+        counts.append(count)
+        carries.append((phase, comp))
+        acc.updateBlock(chunk)
+    counts.append(acc.count())
+
+    ret = {
+        'ADEV overlapped': np.zeros(taus.size) * np.nan,
+        'HDEV': np.zeros(taus.size) * np.nan
+    }
+    ret['ADEV overlapped'][~long] = acc.getADEV()
+    ret['HDEV'][~long] = acc.getHDEV()
+
+    if np.any(long) and acc.count() > 0:
+        sum2, sum3 = calc_streaming_sums_long(fs, f0, ns[long], counts, carries, acc.getFracRef(), chunk_size)
+        ret['ADEV overlapped'][long] = calc_deviation_from_sums(sum2, acc.count(), ns[long], taus[long], f_sampling, 2)
+        ret['HDEV'][long] = calc_deviation_from_sums(sum3, acc.count(), ns[long], taus[long], f_sampling, 3)
+
+    return taus, ret
+
 # ----- Confidence intervals and noise type -----
 def calc_r1(fs_frac):
 
-    f_avg = np.average(fs_frac)
-    N = fs_frac.size
-    nom = 0
-    denom = 0
+    z = np.asarray(fs_frac, dtype=float)
+    z = z - np.mean(z)
 
-    # Numerator
-    for i in range(N-1):
-        nom += (fs_frac[i] - f_avg) * (fs_frac[i+1] - f_avg)
-    # Denominator
-    for i in range(N):
-        denom += np.power(fs_frac[i] - f_avg, 2)
+    nom = np.dot(z[:-1], z[1:])
+    denom = np.dot(z, z)
+    if denom == 0:
+        return np.nan
 
     ret = nom/denom
 
@@ -152,24 +1099,24 @@ def calc_r1(fs_frac):
 
 def calc_noise_type(arr_avg):
 
-    flag = True
     d = 0
-    ret = 0
     z = arr_avg
 
-    while(flag):
+    # differencing shortens the data, stop when r1 cannot be estimated
+    while(z.size > 2):
         r1 = calc_r1(z)
+        if not np.isfinite(r1):
+            break
         delta = r1/(r1+1)
 
         if (delta < .25):
             p = -2*(delta + d)
-            ret = p # for frequency data
-            flag = False
-        else:
-            z = calc_array_diff(z)
-            d += 1
+            return p # for frequency data
 
-    return ret
+        z = calc_array_diff(z)
+        d += 1
+
+    return np.nan
 
 def calc_noise_id_single(freqs, tau, f_sampling):
 
@@ -179,45 +1126,196 @@ def calc_noise_id_single(freqs, tau, f_sampling):
     return ret
 
 def calc_noise_id(freqs, taus, f_sampling):
+    '''
+    Noise exponents of all taus as in calc_noise_id_single. Block averages of
+    all taus are kept one tau after another in one array, so r1 and
+    differencing are calculated for all taus at once and the loop only goes
+    over the order of differencing.
+    '''
+    # r1 does not depend on the offset, removing it once keeps the block
+    # averages of all taus small
+    freqs = np.asarray(freqs, dtype=float)
+    freqs = freqs - np.mean(freqs)
+    ret = np.zeros(len(taus)) * np.nan
+    if ret.size == 0:
+        return ret
+
+    prefix_sum = np.zeros(freqs.size + 1)
+    np.cumsum(freqs, out=prefix_sum[1:])
+    ns = np.array([calc_averaging_factor(tau, f_sampling) + 1 for tau in taus], dtype=int)
+    ns = np.maximum(ns, 1)
+    sizes = freqs.size // ns
+    # differencing shortens the data, stop when r1 cannot be estimated
+    ids = np.flatnonzero(sizes > 2)
+    ns, sizes = ns[ids], sizes[ids]
+
+    # block averages of all taus, same as calc_array_avg
+    starts = np.cumsum(sizes) - sizes
+    n = np.repeat(ns, sizes)
+    k = np.arange(n.size) - np.repeat(starts, sizes)
+    z = (prefix_sum[(k+1)*n] - prefix_sum[k*n]) / n
 
-    ret = []
+    d = 0
+    while ids.size:
+        zc = z - np.repeat(np.add.reduceat(z, starts) / sizes, sizes)
+        denom = np.add.reduceat(zc*zc, starts)
+        tmp = zc[:-1]*zc[1:]
+        tmp[starts[1:] - 1] = 0 # products across taus
+        nom = np.add.reduceat(tmp, starts)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r1 = np.where(denom != 0, nom/denom, np.nan)
+            delta = r1/(r1+1)
+
+        done = delta < .25
+        ret[ids[done]] = -2*(delta[done] + d) # for frequency data
+
+        keep = np.isfinite(r1) & ~done & (sizes > 3)
+        mask = np.repeat(keep, sizes)
+        mask[starts + sizes - 1] = False # differences across taus
+        z = np.diff(z)[mask[:-1]]
+        ids, sizes = ids[keep], sizes[keep] - 1
+        starts = np.cumsum(sizes) - sizes
+        d += 1
 
-    for tau in taus:
-        ret.append(calc_noise_id_single(freqs, tau, f_sampling))
+    return ret
 
-    return np.array(ret)
+# deviation: (d, overlapping, modified) as in the Greenhall EDF algorithm
+edf_params = {
+    'ADEV': (2, False, False),
+    'ADEV overlapped': (2, True, False),
+    'MDEV': (2, True, True),
+    'TDEV': (2, True, True),
+    'HDEV': (3, True, False)
+}
 
-def calc_confidence_interval_single(dev, tau, f_sampling, noiseID, N):
+def calc_greenhall_sw(t, alpha):
 
-    avgCount = tau * f_sampling
-    loopCount = N/avgCount # number of loop iterations
-    loopCount_reduced = np.sqrt(loopCount)
+    t = np.abs(t)
+    ret = np.power(t, 3 - alpha)
 
-    # dominant white PM noise
-    if noiseID >= 1.5:
-        tmp = .99 * dev/loopCount_reduced
-    # dominant flicker PM noise
-    elif noiseID < 1.5 and noiseID >= .5:
-        tmp = .99 * dev/loopCount_reduced
-    # dominant white FM noise
-    elif noiseID < .5 and noiseID >= -.5:
-        tmp = .87 * dev/loopCount_reduced
-    # dominant flicker FM noise
-    elif noiseID < -.5 and noiseID >= -1.5:
-        tmp = .77 * dev/loopCount_reduced
-    # dominant random walk FM noise
-    else:
-        tmp = .75 * dev/loopCount_reduced
+    # odd alphas have a logarithmic term vanishing at t = 0
+    if alpha % 2:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ret = np.where(t > 0, ret * np.log(t), 0)
 
-    return tmp
+    return ret
 
-def calc_confidence_interval(devs, taus, f_sampling, noiseIDs, N):
+def calc_greenhall_sx(t, F, alpha):
 
-    ret = []
-    for i in range(devs.size):
-        ret.append(calc_confidence_interval_single(devs[i], taus[i], f_sampling, noiseIDs[i], N))
+    if np.isinf(F):
+        return calc_greenhall_sw(t, alpha + 2)
 
-    return np.array(ret)
+    ret = 2*calc_greenhall_sw(t, alpha)
+    ret -= calc_greenhall_sw(t - 1/F, alpha)
+    ret -= calc_greenhall_sw(t + 1/F, alpha)
+
+    return F**2 * ret
+
+def calc_greenhall_sz(t, F, alpha, d):
+
+    ret = 0
+    for k in range(-d, d+1):
+        ret += (-1)**k * binom(2*d, d+k) * calc_greenhall_sx(t + k, F, alpha)
+
+    return ret
+
+def calc_greenhall_basic_sum(J, M, S, F, alpha, d):
+
+    j = np.arange(1, J)
+
+    ret = calc_greenhall_sz(0, F, alpha, d)**2
+    ret += (1 - J/M) * calc_greenhall_sz(J/S, F, alpha, d)**2
+    ret += 2*np.sum((1 - j/M) * calc_greenhall_sz(j/S, F, alpha, d)**2)
+
+    return ret
+
+def calc_edf(alpha, d, m, N, overlapping=True, modified=False):
+    '''
+    Equivalent degrees of freedom after C. A. Greenhall and W. J. Riley,
+    "Uncertainty of stability variances based on finite differences".
+
+    Args:
+        alpha: integer exponent of frequency noise, from -4 to 2
+        d: order of phase difference, 2 for Allan and 3 for Hadamard variance
+        m: averaging factor
+        N: number of phase points
+        overlapping: overlapping estimator
+        modified: modified variance
+    Returns:
+        float: equivalent degrees of freedom, nan if N is too short for m
+    '''
+
+    F = 1 if modified else m # filter factor
+    S = m if overlapping else 1 # stride factor
+    L = m/F + m*d # filter length
+    M = 1 + np.floor(S*(N - L)/m)
+    if m < 1 or M < 1:
+        return np.nan
+
+    ret = calc_edf_outputs(alpha, d, m, int(M), overlapping, modified)
+
+    return ret
+
+@lru_cache(maxsize=4096)
+def calc_edf_outputs(alpha, d, m, M, overlapping=True, modified=False):
+
+    # EDF of M filter outputs
+    F = 1 if modified else m # filter factor
+    S = m if overlapping else 1 # stride factor
+    J = int(min(M, (d+1)*S))
+
+    # the unmodified filter is replaced by its limit for long filters
+    if not modified and alpha <= 0 and m*(d+1) > 100:
+        F = np.inf
+
+    inv_edf = calc_greenhall_basic_sum(J, M, S, F, alpha, d)
+    inv_edf /= calc_greenhall_sz(0, F, alpha, d)**2 * M
+
+    return 1/inv_edf
+
+def calc_confidence_interval(devs, taus, f_sampling, noiseIDs, N, deviation='ADEV overlapped', confidence=0.683):
+    '''
+    Chi-squared confidence interval of deviations.
+
+    Args:
+        devs: deviations
+        taus: averaging times
+        f_sampling: sampling frequency
+        noiseIDs: noise exponents from calc_noise_id
+        N: number of data points the deviations were calculated from
+        deviation: name of deviation from edf_params
+        confidence: confidence level
+    Returns:
+        ndarray: lower bounds of deviations
+        ndarray: upper bounds of deviations
+    '''
+
+    devs = np.asarray(devs, dtype=float)
+    taus = np.asarray(taus, dtype=float)
+    noiseIDs = np.asarray(noiseIDs, dtype=float)
+    edfs = np.zeros(devs.size) * np.nan
+
+    if deviation not in edf_params:
+        return edfs, edfs.copy()
+    d, overlapping, modified = edf_params[deviation]
+
+    valid = np.isfinite(devs) & np.isfinite(noiseIDs)
+    alphas = np.clip(np.round(noiseIDs[valid]), -2, 2).astype(int)
+    ms = np.floor(np.round(taus[valid] * f_sampling, 9)).astype(int) # as in calc_averaging_factor
+
+    # EDF only of distinct pairs, cached by exact number of filter outputs
+    pairs, inverse = np.unique(np.stack((alphas, ms), axis=1), axis=0, return_inverse=True)
+    tmp = np.array([calc_edf(int(alpha), d, int(m), int(N), overlapping, modified) for alpha, m in pairs])
+    edfs[valid] = tmp[inverse.ravel()] if tmp.size else tmp
+    edfs[~(edfs > 0)] = np.nan
+
+    chi2_lower = chi2.ppf((1 - confidence)/2, edfs)
+    chi2_upper = chi2.ppf((1 + confidence)/2, edfs)
+
+    lower = devs * np.sqrt(edfs / chi2_upper)
+    upper = devs * np.sqrt(edfs / chi2_lower)
+
+    return lower, upper
 
 def dominant_noise_single(noiseID):
 
@@ -260,16 +1358,11 @@ if __name__ == '__main__':
     f_sampling = meta['Sampling frequency [Hz]']
 
     N = freqs.size
-    T = N / f_sampling
 
     fs_frac = calc_fractional_frequency(freqs, meta['Central frequency [Hz]'])
     phase_error = calc_phase_error(fs_frac, f_sampling)
 
-    taus = np.linspace(
-        1/(f_sampling+1),
-        0.49*T,
-        20
-    )
+    taus = calc_tau_grid(N, f_sampling, 'octave')
 
     # Deviations
     adevs = calc_ADEV(phase_error, taus)
@@ -278,9 +1371,9 @@ if __name__ == '__main__':
 
     # Noise type and confidence interval
     alphas = calc_noise_id(freqs, taus, f_sampling)
-    conf_int_adev = calc_confidence_interval(adevs, taus, f_sampling, alphas, N)
-    conf_int_adev_overlapped = calc_confidence_interval(adevs_overlapped, taus, f_sampling, alphas, N)
-    conf_int_hdev = calc_confidence_interval(hdevs, taus, f_sampling, alphas, N)
+    conf_int_adev = calc_confidence_interval(adevs, taus, f_sampling, alphas, N, 'ADEV')
+    conf_int_adev_overlapped = calc_confidence_interval(adevs_overlapped, taus, f_sampling, alphas, N, 'ADEV overlapped')
+    conf_int_hdev = calc_confidence_interval(hdevs, taus, f_sampling, alphas, N, 'HDEV')
 
     noise_dom = dominant_noise(alphas)
     print('Dominant noise: ', noise_dom)
@@ -322,7 +1415,7 @@ if __name__ == '__main__':
     ax.errorbar(
         taus,
         adevs,
-        yerr=conf_int_adev,
+        yerr=[adevs - conf_int_adev[0], conf_int_adev[1] - adevs],
         markersize=3,
         fmt='o',
         label='ADEV'
@@ -330,7 +1423,7 @@ if __name__ == '__main__':
     ax.errorbar(
         taus,
         adevs_overlapped,
-        yerr=conf_int_adev_overlapped,
+        yerr=[adevs_overlapped - conf_int_adev_overlapped[0], conf_int_adev_overlapped[1] - adevs_overlapped],
         markersize=3,
         fmt='^',
         label='ADEV overlapped'
@@ -338,7 +1431,7 @@ if __name__ == '__main__':
     ax.errorbar(
         taus,
         hdevs,
-        yerr=conf_int_hdev,
+        yerr=[hdevs - conf_int_hdev[0], conf_int_hdev[1] - hdevs],
         markersize=3,
         fmt='x',
         label='HDEV'
@@ -3,27 +3,38 @@
 import os
 import time
 import importlib
+from queue import Empty
 
 import yaml
 import numpy as np
 
 from misc.commands import cmds_values
 import src.filters as filters
+import src.filterKernels as filterKernels
+from src.sharedRingBuffer import SharedRingBuffer, FLAG_LOCKED, FLAG_PHASE_MODE, FLAG_LOWPASS
+from src.tickProfiler import *
+from src.messages import *
 import config.config as cfg
 
 
 class handlerStabilization():
 
-    def __init__(self, q, conn):
+    def __init__(self, q, conn, ringName):
 
         # config
         config_path = os.path.join("./", "config", "devices.yml")
         with open(config_path) as config_file:
             self.devices_config = yaml.safe_load(config_file)
 
-        # Process connection
+        # Process connection, pipe is kept for rare messages and data of
+        # every tick goes through the ring buffer
         self._q = q
         self._conn = conn
+        self._ring = SharedRingBuffer(name=ringName)
+
+        # Latency instrumentation, profiling is decided once, not on every tick
+        self._flagProfile = cfg.flagProfileTicks
+        self._profiler = TickProfiler() if self._flagProfile else None
 
         # Variables
         self._rate = 0.1
@@ -36,6 +47,17 @@ class handlerStabilization():
         self._lowpass = None
         self._filterFreq = None
         self._filterPhase = None
+        self._filterFreqType = None
+        self._filterPhaseType = None
+
+        # Loop filter backend
+        self._flagCompiledFilters = False
+        if cfg.loopFilterBackend == 'numba':
+            if filterKernels.numbaAvailable:
+                self._flagCompiledFilters = True
+            else:
+                print('Numba not installed, using python loop filters!', flush=True)
+        self._flagStateSpaceFilters = cfg.loopFilterBackend == 'statespace'
 
         # Flags
         self._lockStatus = False
@@ -66,52 +88,82 @@ class handlerStabilization():
 
         self._DDSfreq = 0
         self._DDSphase = 0
-    
-    def queueEmpty(self):
-        '''
-        Check if commands queue is empty
-        
-        Returns:
-            bool: if queue is empty
-        '''
-        return self._q.empty()
 
-    def parseCommand(self):
+        # Message routing, devices parse their messages first
+        self._router = Router('Stabilization')
+        self._router.registerAll(self._FC.routes())
+        self._router.registerAll(self._DDS.routes())
+        self._router.registerAll({
+            FC_RATE: self._cmdRate,
+            DDS_FREQ: self._cmdDDSFreq,
+            DDS_PHASE: self._cmdDDSPhase,
+            FILT_SET: self._cmdSetFilter,
+            FILT_LP_APPLY: self._cmdApplyLowpass,
+            FILT_RESET: self._cmdResetFilters,
+            FILT_LOCK: self._cmdLock,
+            FILT_SP: self._cmdSetpoint,
+            FILT_SP_PHASE: self._cmdSetpointPhase,
+            FILT_MODE: self._cmdMode,
+            PROF_SUMMARY: self._cmdProfilerSummary,
+            PROF_DUMP: self._cmdProfilerDump,
+            PROF_RESET: self._cmdProfilerReset
+        })
+        # Only dummy
+        if self.devices_config['DDS'] == 'Dummy' and self.devices_config['FrequencyCounter'] == 'Dummy':
+            self._router.register(DDS_FREQ, self._cmdDummyDDSFreq)
+            self._router.register(DDS_EN, self._cmdDummyDDSEnable)
+
+    def parseCommands(self):
         '''
-        Take one command from queue and parse it. 
-        
-        Args:
-            dict: nested dictionary with command
+        Take all commands waiting in queue without blocking and parse them
+        at once. Of repeated setpoint, rate and DDS settings not separated
+        by other commands only the last one is applied.
         '''
-        tmp = self._q.get()
-        if tmp['dev'] == 'FC':
-            self._FC.parseCommand(tmp)
-            # Change timestep of PID filter
-            if tmp['cmd'] == 'rate':
-                self._rate = cmds_values['rate'][tmp['args']]
-                if self._filterFreq is not None:
-                    self._filterFreq.set_timestep(cmds_values['rate'][tmp['args']])
-                if self._filterPhase is not None:
-                    self._filterPhase.set_timestep(cmds_values['rate'][tmp['args']])
-        elif tmp['dev'] == 'DDS':
-            self._DDS.parseCommand(tmp)
-            # Change DDS frequency
-            if tmp['cmd'] == 'freq':
-                self._DDSfreq = tmp['args']
-            # Only dummy
-            if self.devices_config['DDS'] == 'Dummy' and self.devices_config['FrequencyCounter'] == 'Dummy':
-                if tmp['cmd'] == 'freq' and self._DDS.isEnabled():
-                    self._FC.changeOffset(self._DDSfreq)
-                elif tmp['cmd'] == 'en':
-                    if tmp['args']:
-                        self._FC.changeOffset(self._DDSfreq)
-                    else:
-                        self._FC.changeOffset(0)
-            # Change DDS phase
-            if tmp['cmd'] == 'phase':
-                self._DDSphase = tmp['args']
-        elif tmp['dev'] == 'filt':
-            self.parseFilterCommand(tmp)
+        if self._flagProfile:
+            self._profiler.stamp(STAMP_COMMANDS_BEGIN)
+
+        # empty check only polls the pipe, cheaper than a failed get_nowait
+        if not self._q.empty():
+            msgs = []
+            while True:
+                try:
+                    msgs.append(self._q.get_nowait())
+                except Empty:
+                    break
+            self._router.dispatchBatch(msgs)
+
+        if self._flagProfile:
+            self._profiler.stamp(STAMP_COMMANDS_END)
+
+    # Device commands
+    def _cmdRate(self, rate):
+
+        # Change timestep of loop filters
+        self._rate = cmds_values['rate'][rate]
+        if self._filterFreq is not None:
+            self._filterFreq.set_timestep(self._rate)
+        if self._filterPhase is not None:
+            self._filterPhase.set_timestep(self._rate)
+
+    def _cmdDDSFreq(self, freq):
+
+        self._DDSfreq = freq
+
+    def _cmdDDSPhase(self, phase):
+
+        self._DDSphase = phase
+
+    def _cmdDummyDDSFreq(self, freq):
+
+        if self._DDS.isEnabled():
+            self._FC.changeOffset(self._DDSfreq)
+
+    def _cmdDummyDDSEnable(self, state):
+
+        if state:
+            self._FC.changeOffset(self._DDSfreq)
+        else:
+            self._FC.changeOffset(0)
 
     # General
     def disconnect(self):
@@ -120,133 +172,185 @@ class handlerStabilization():
         '''
         self._DDS.disconnect()
         self._FC.disconnect()
+        self._ring.close()
 
     def measure(self):
         '''
         If Frequency Counter is connected measures frequencies on both channels. Returns true if new data has arrived.
         '''
+        if self._flagProfile:
+            self._profiler.beginTick()
+            ret = self._FC.measure()
+            self._profiler.stamp(STAMP_MEASURE_END)
+            return ret
+
         return self._FC.measure()
     
-    def wait(self, timeStart, timeStop):
+    def period(self):
         '''
-        Sleep for a period of time equal to rate - (timeStop - timeStart) - cfg.waitOffset
-        
-        Args:
-            timeStart, timeStop: timestamps in s to calculate sleep time 
+        Period of the acquisition loop. Dummy counter is paced by the loop,
+        other counters are polled for new data.
+
         Returns:
-            float: time to wait in s, if negative, then there is a delay in measurement update
+            float: period in s
         '''
-        # print(self._rate)
-        # print(timeStop-timeStart)
-        to_wait = self._rate - (timeStop - timeStart)
-        # to_wait_offset = 0.5*to_wait - cfg.waitOffset
         if self.devices_config['FrequencyCounter'] == 'Dummy':
-            if to_wait > 0:
-                time.sleep(to_wait)
-            else:
-                print('Delay {}'.format(to_wait))
-        return to_wait
+            return self._rate
+        return min(cfg.pollPeriod, self._rate)
 
     # Filter
-    def parseFilterCommand(self, params):
+    def _cmdSetFilter(self, args):
         '''
-        Parse commands specific for filter operation
-        
+        Construct or update filter
+
         Args:
-            params: dictionary with command for filter operation
+            args: filter type, 'freq' or 'phase' for loop filters, None for
+                lowpass, filter parameters
         '''
-        # Filter construction
-        if params['cmd'] == 'filt':
-            # Construct PID filter
-            if params['type'] == 'pid':
-                filt = filters.PID(**params['params'])
-            # Construct IntLowpass filter
-            elif params['type'] == 'IntLowpass':
-                filt = filters.IntLowpass(**params['params'])
-            # Construct DoubleIntLowpass filter
-            elif params['type'] == 'DoubleIntLowpass':
-                filt = filters.DoubleIntLowpass(**params['params'])
-            # Construct DoubleIntDoubleLowpass filter
-            elif params['type'] == 'DoubleIntDoubleLowpass':
-                filt = filters.DoubleIntDoubleLowpass(**params['params'])
-
-            # Set or update frequency filter
-            if params['mode'] == 'freq':
-                if self._filterFreq is None:
-                    self._filterFreq = filt
-                else:
-                    self._filterFreq.setFilter(**params['params'])
-            # Set or update phase filter
-            if params['mode'] == 'phase':
-                if self._filterPhase is None:
-                    self._filterPhase = filt
-                else:
-                    self._filterPhase.setFilter(**params['params'])
-
-            # Construct lowpass
-            elif params['type'] == 'lowpass':
-                self._lowpass = filters.IIRFilter(
-                        params['params']['ff_coefs'],
-                        params['params']['fb_coefs'],
-                        padding=self._FC.fAvg()
-                    )
-                self._flagLowpass = True
-        # Apply lowpass filter
-        elif params['cmd'] == 'lpApply':
-            if params['args']:
-                self._flagLowpassActive = True
-                print('Lowpass activated!', flush=True)
+        filterType, mode, params = args
+        # Construct lowpass
+        if filterType == 'lowpass':
+            if 'sos' in params:
+                self._lowpass = filters.SOSFilter(
+                    params['sos'],
+                    padding=self._FC.fAvg()
+                )
             else:
-                self._flagLowpassActive = False
-                print('Lowpass deactivated!', flush=True)
-        # Reset filters
-        elif params['cmd'] == 'reset':
-            self._phasePrev = 0
-            if self._filterFreq is not None:
-                self._filterFreq.reset()
-            if self._filterPhase is not None:
-                self._filterPhase.reset()
-            if self._lowpass is not None:
-                self._lowpass.reset(padding=self._FC.fAvg())
+                self._lowpass = filters.IIRFilter(
+                    params['ff_coefs'],
+                    params['fb_coefs'],
+                    padding=self._FC.fAvg()
+                )
+            self._flagLowpass = True
+            return
+        # Set or update frequency filter
+        if mode == 'freq':
+            self._filterFreq = self._setLoopFilter(self._filterFreq, self._filterFreqType, filterType, params)
+            self._filterFreqType = filterType
+        # Set or update phase filter
+        if mode == 'phase':
+            self._filterPhase = self._setLoopFilter(self._filterPhase, self._filterPhaseType, filterType, params)
+            self._filterPhaseType = filterType
+
+    def _setLoopFilter(self, filt, currentType, filterType, params):
+        '''
+        Update loop filter of the same type, otherwise construct a new one
+        which continues from the last control value
+
+        Args:
+            filt: current filter or None
+            currentType: type of current filter
+            filterType: requested filter type
+            params: filter parameters
+        Returns:
+            filter to use
+        '''
+        if filt is not None and currentType == filterType:
+            filt.setFilter(**params)
+            return filt
+
+        # Construct state space realization of the filter
+        if self._flagStateSpaceFilters and filterType in filters.stateSpaceFilterTypes:
+            ret = filters.StateSpaceFilter(filterType, **params)
+        # Construct compiled integrator and lowpass filter
+        elif self._flagCompiledFilters and filterType in filterKernels.compiledFilters:
+            ret = filterKernels.compiledFilters[filterType](**params)
+        # Construct python loop filter, other backends do not have all types
+        else:
+            if self._flagStateSpaceFilters or self._flagCompiledFilters:
+                print('No {} in selected backend, using python loop filter!'.format(filterType), flush=True)
+            ret = filters.loopFilters[filterType](**params)
+
+        # changed filter continues control without a jump
+        if filt is not None:
+            ret.setInitialOffset(self._control)
+
+        return ret
+
+    def _cmdApplyLowpass(self, state):
+
+        if state:
+            self._flagLowpassActive = True
+            print('Lowpass activated!', flush=True)
+        else:
+            self._flagLowpassActive = False
+            print('Lowpass deactivated!', flush=True)
+
+    def _cmdResetFilters(self, args):
+
+        self._phasePrev = 0
+        if self._filterFreq is not None:
+            self._filterFreq.reset()
+        if self._filterPhase is not None:
+            self._filterPhase.reset()
+        if self._lowpass is not None:
+            self._lowpass.reset(padding=self._FC.fAvg())
+
+    def _cmdLock(self, state):
+
         # Lock engage
-        elif params['cmd'] == 'lock':
-            if params['args']:
-                # soft start of filter, so it continues DDS setting
-                self._filterFreq.setInitialOffset(self._DDSfreq)
-                if self._flagPhaseLock:
-                    self._filterPhase.setInitialOffset(self._DDSfreq)
-                self._lockStatus = True
-                print('Lock engaged!')
-            else:
-                self._DDS.setFreq(self._DDSfreq)
-                self._lockStatus = False
-                self._counterPhaseLock = 0
-                if self._mode: # if in phase mode switch to frequency with active phase lock
-                    self._mode = 0
-                    self._flagPhaseLock = True
-                # Only dummy
-                if self.devices_config['DDS'] == 'Dummy':
-                    self._FC.changeOffset(self._control)
-                print('Lock disengaged!')
-                self._conn.send({'dev': 'filt', 'cmd': 'phaseLock', 'args': 0})
-        # Setpoint
-        elif params['cmd'] == 'sp':
-            self._setpoint = params['args']
-            self._FC.setFreqTarget(params['args'])
-        # Setpoint phase
-        elif params['cmd'] == 'spPhase':
-            self._setpointPhase = params['args']
-            self._FC.setFreqTarget(params['args'])
-        # Mode
-        elif params['cmd'] == 'mode':
-            if params['args'] == 'Phase':
-                print('Mode changed to PLL!')
-                self._flagPhaseLock = True
-            else:
-                print('Mode changed to FLL!')
-                self._flagPhaseLock = False
+        if state:
+            # soft start of filter, so it continues DDS setting
+            self._filterFreq.setInitialOffset(self._DDSfreq)
+            if self._flagPhaseLock:
+                self._filterPhase.setInitialOffset(self._DDSfreq)
+            self._lockStatus = True
+            print('Lock engaged!')
+        else:
+            self._DDS.setFreq(self._DDSfreq)
+            self._lockStatus = False
+            self._counterPhaseLock = 0
+            if self._mode: # if in phase mode switch to frequency with active phase lock
                 self._mode = 0
-            
+                self._flagPhaseLock = True
+            # Only dummy
+            if self.devices_config['DDS'] == 'Dummy':
+                self._FC.changeOffset(self._control)
+            print('Lock disengaged!')
+            self._conn.send(Message(FILT_PHASE_LOCK, 0))
+
+    def _cmdSetpoint(self, setpoint):
+
+        self._setpoint = setpoint
+        self._FC.setFreqTarget(setpoint)
+
+    def _cmdSetpointPhase(self, setpoint):
+
+        self._setpointPhase = setpoint
+        self._FC.setFreqTarget(setpoint)
+
+    def _cmdMode(self, mode):
+
+        if mode == 'Phase':
+            print('Mode changed to PLL!')
+            self._flagPhaseLock = True
+        else:
+            print('Mode changed to FLL!')
+            self._flagPhaseLock = False
+            self._mode = 0
+
+    # Profiler
+    def _cmdProfilerSummary(self, args):
+
+        # Table of stage latencies for the GUI
+        if self._flagProfile:
+            summary = self._profiler.summary()
+        else:
+            summary = 'Tick profiling is disabled, set flagProfileTicks in config'
+        self._conn.send(Message(PROF_SUMMARY, summary))
+
+    def _cmdProfilerDump(self, path):
+
+        # Save histograms
+        if self._flagProfile:
+            self._profiler.dump(path)
+            print('Latency histograms saved to {}'.format(path))
+
+    def _cmdProfilerReset(self, args):
+
+        if self._flagProfile:
+            self._profiler.reset()
+
     def filterUpdate(self):
         '''
         Updates filter output. Calculates process variable and applies lowpass filter if active.
@@ -258,8 +362,9 @@ class handlerStabilization():
             pv = self._lowpass.update(self._FC.fAvg())
         else:
             pv = self._FC.fAvg()
-        
-        self._conn.send({'dev': 'filt', 'cmd': 'avg', 'args': pv})
+        avg = pv
+        if self._flagProfile:
+            self._profiler.stamp(STAMP_LOWPASS_END)
 
         # PLL/FLL if locked
         if self._lockStatus:
@@ -271,7 +376,7 @@ class handlerStabilization():
                     self._filterPhase.setInitialOffset(self._control)
                     self._mode = 1
                     self._flagPhaseLock = False
-                    self._conn.send({'dev': 'filt', 'cmd': 'phaseLock', 'args': 1})
+                    self._conn.send(Message(FILT_PHASE_LOCK, 1))
             # Check if still frequency locked
             if self._mode:
                 if abs(self._setpoint - pv) > cfg.phaseLockMargin:
@@ -279,7 +384,7 @@ class handlerStabilization():
                 if self._counterPhaseLock <= 0:
                     self._mode = 0
                     self._flagPhaseLock = True
-                    self._conn.send({'dev': 'filt', 'cmd': 'phaseLock', 'args': 0})
+                    self._conn.send(Message(FILT_PHASE_LOCK, 0))
 
         # Process variable integration if phase mode
         if self._mode:
@@ -289,20 +394,30 @@ class handlerStabilization():
             pv = self._phasePrev + pv # integration to retrieve phase
             self._phasePrev = pv
 
-        self._conn.send({'dev': 'filt', 'cmd': 'pv', 'args': pv})
-
         if self._lockStatus:
             # Calculate control
             if self._mode == 1:
                 self._control = self._filterPhase.update(self._setpointPhase, pv)
             else:
                 self._control = self._filterFreq.update(self._setpoint, pv)
+            if self._flagProfile:
+                self._profiler.stamp(STAMP_FILTER_END)
             # Set control value
             self._DDS.setFreq(self._control)
-            self._conn.send({'dev': 'filt', 'cmd': 'control', 'args': self._control})
             # Only dummy
             if self.devices_config['DDS'] == 'Dummy':
                 self._FC.changeOffset(self._control)
+            if self._flagProfile:
+                self._profiler.stamp(STAMP_DDS_END)
+
+        # Record of this tick for the GUI
+        if self._flagProfile:
+            self._profiler.stamp(STAMP_IPC_BEGIN)
+        f1, f2 = self._FC.fChannels()
+        flags = FLAG_LOCKED*self._lockStatus | FLAG_PHASE_MODE*self._mode | FLAG_LOWPASS*(self._flagLowpass and self._flagLowpassActive)
+        self._ring.push(time.time(), f1, f2, avg, pv, self._setpoint - avg, self._control, flags)
+        if self._flagProfile:
+            self._profiler.stamp(STAMP_IPC_END)
 
 
 class DummyFC():
@@ -324,26 +439,48 @@ class DummyFC():
 
         print('Dummy Frequency Counter handler initiated!', flush=True)
 
-    def parseCommand(self, cmdDict):
-
-        if cmdDict['cmd'] == 'rate':
-            self._rate = cmds_values['rate'][cmdDict['args']]
-        elif cmdDict['cmd'] == 'channels':
-            self._channels = cmdDict['args']
-        elif cmdDict['cmd'] == 'devices':
-            ret = self.enumerate_devices()
-            self._conn.send({'dev': 'FC', 'cmd': 'devices', 'args': ret})
-        elif cmdDict['cmd'] == 'connect':
-            self.connect(cmdDict['args'])
-            self._conn.send({'dev': 'FC', 'cmd': 'connection', 'args': self._flagConnected})
-        elif cmdDict['cmd'] == 'disconnect':
-            self.disconnect()
-            self._conn.send({'dev': 'FC', 'cmd': 'connection', 'args': self._flagConnected})
+    def routes(self):
+
+        return {
+            FC_RATE: self._cmdRate,
+            FC_CHANNELS: self._cmdChannels,
+            FC_MODE: ignore,
+            FC_DEVICES: self._cmdDevices,
+            FC_CONNECT: self._cmdConnect,
+            FC_DISCONNECT: self._cmdDisconnect
+        }
+
+    def _cmdRate(self, rate):
+
+        self._rate = cmds_values['rate'][rate]
+
+    def _cmdChannels(self, channels):
+
+        self._channels = channels
+
+    def _cmdDevices(self, args):
+
+        ret = self.enumerate_devices()
+        self._conn.send(Message(FC_DEVICES, ret))
+
+    def _cmdConnect(self, address):
+
+        self.connect(address)
+        self._conn.send(Message(FC_CONNECTION, self._flagConnected))
+
+    def _cmdDisconnect(self, args):
+
+        self.disconnect()
+        self._conn.send(Message(FC_CONNECTION, self._flagConnected))
 
     def fAvg(self):
 
         return self._fAvg
 
+    def fChannels(self):
+
+        return self._f
+
     def setFreqTarget(self, fTarget):
 
         return True
@@ -408,7 +545,6 @@ class DummyFC():
                     self._f[0] = float(data[0])
                     self._f[1] = float(data[1])
                     self._fAvg = np.average(self._f)
-                    self._conn.send({'dev': 'FC', 'cmd': 'data', 'args': self._f})
                 except ValueError:
                     return False
         
@@ -447,29 +583,37 @@ class DummyDDS():
         else:
             return False
 
-    def parseCommand(self, params):
-
-        # DDS connection
-        if params['cmd'] == 'connect':
-            self.connect(params['args'])
-        elif params['cmd'] == 'disconnect':
-            self.disconnect()
-        elif params['cmd'] == 'devices':
-            ret = self.enumerate_devices()
-            self._conn.send({'dev': 'DDS', 'cmd': 'devices', 'args': ret})
-        # DDS enable
-        elif params['cmd'] == 'en':
-            if self._flagConnected:
-                if params['args']:
-                    self._flagEnabled = True
-                else:
-                    self._flagEnabled = False
-        # Frequency
-        elif params['cmd'] == 'freq':
-            self.setFreq(params['args'])
-        # Amplitude
-        elif params['cmd'] == 'amp':
-            self.setAmp(params['args'])
+    def routes(self):
+
+        return {
+            # DDS connection
+            DDS_CONNECT: self.connect,
+            DDS_DISCONNECT: self._cmdDisconnect,
+            DDS_DEVICES: self._cmdDevices,
+            # DDS enable
+            DDS_EN: self._cmdEnable,
+            # Frequency
+            DDS_FREQ: self.setFreq,
+            # Amplitude
+            DDS_AMP: self.setAmp
+        }
+
+    def _cmdDisconnect(self, args):
+
+        self.disconnect()
+
+    def _cmdDevices(self, args):
+
+        ret = self.enumerate_devices()
+        self._conn.send(Message(DDS_DEVICES, ret))
+
+    def _cmdEnable(self, state):
+
+        if self._flagConnected:
+            if state:
+                self._flagEnabled = True
+            else:
+                self._flagEnabled = False
 
     def enumerate_devices(self):
 
@@ -480,7 +624,7 @@ class DummyDDS():
         if not self._flagConnected:
             self._flagConnected = True
             print('DDS connected!', flush=True)
-            self._conn.send({'dev': 'DDS', 'cmd': 'connection', 'args': 1})
+            self._conn.send(Message(DDS_CONNECTION, 1))
             return True
             
         print('Already connected to DDS!')
@@ -490,7 +634,7 @@ class DummyDDS():
 
         self.setFreq(0)
         self._flagConnected = False
-        self._conn.send({'dev': 'DDS', 'cmd': 'connection', 'args': 0})
+        self._conn.send(Message(DDS_CONNECTION, 0))
         print('DDS disconnected!', flush=True)
 
     def setFreq(self, freq):
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+from typing import Any, NamedTuple
+
+
+# Opcodes of messages between GUI and stabilization process. Devices are
+# kept in separate ranges only for readability, routing uses opcode alone.
+
+# Frequency counter
+FC_RATE = 0
+FC_CHANNELS = 1
+FC_MODE = 2
+FC_DEVICES = 3 # request and reply with list of devices
+FC_CONNECT = 4
+FC_DISCONNECT = 5
+FC_CONNECTION = 6 # reply with connection state
+
+# DDS
+DDS_DEVICES = 10 # request and reply with list of devices
+DDS_CONNECT = 11
+DDS_DISCONNECT = 12
+DDS_CONNECTION = 13 # reply with connection state
+DDS_EN = 14
+DDS_FREQ = 15
+DDS_AMP = 16
+DDS_PHASE = 17
+
+# Filters
+FILT_SET = 20 # args: (filter type, 'freq', 'phase' or None for lowpass, parameters)
+FILT_LP_APPLY = 21
+FILT_RESET = 22
+FILT_LOCK = 23
+FILT_SP = 24
+FILT_SP_PHASE = 25
+FILT_MODE = 26
+FILT_PHASE_LOCK = 27 # reply with phase lock state
+
+# Latency instrumentation
+PROF_SUMMARY = 30 # request and reply with table of latencies
+PROF_DUMP = 31
+PROF_RESET = 32
+
+OP_SIZE = 33
+
+# Only the last of these messages in a run of a batch matters, earlier ones
+# are overwritten by it. Any other message ends the run, as it may depend on
+# the state they set.
+coalescedOps = frozenset((
+    FC_RATE,
+    FC_CHANNELS,
+    DDS_FREQ,
+    DDS_AMP,
+    DDS_PHASE,
+    FILT_SP,
+    FILT_SP_PHASE
+))
+
+
+def ignore(args):
+    '''
+    Handler of messages a receiver accepts without acting on them, which
+    keeps them from being reported as unknown
+    '''
+    return
+
+
+class Message(NamedTuple):
+
+    op: int
+    args: Any = None
+
+
+class Router():
+    '''
+    Table of message handlers indexed by opcode, so dispatch cost does not
+    depend on the number of commands. Handlers take message arguments.
+    '''
+
+    def __init__(self, name):
+        '''
+        Args:
+            name: name of receiver used in unknown message warnings
+        '''
+        self._name = name
+        self._handlers = [self._unknown(op) for op in range(OP_SIZE)]
+        self._registered = [False] * OP_SIZE
+
+    def _unknown(self, op):
+
+        def handler(args):
+            print('{0}: unknown message! op: {1}'.format(self._name, op), flush=True)
+
+        return handler
+
+    def register(self, op, handler):
+        '''
+        Set handler of opcode. Handler registered for an opcode which
+        already has one is called after it.
+
+        Args:
+            op: opcode
+            handler: callable taking message arguments
+        '''
+        if not self._registered[op]:
+            self._handlers[op] = handler
+            self._registered[op] = True
+            return
+
+        previous = self._handlers[op]
+
+        def chained(args):
+            previous(args)
+            handler(args)
+
+        self._handlers[op] = chained
+
+    def registerAll(self, routes):
+        '''
+        Args:
+            routes: dict opcode: handler
+        '''
+        for op, handler in routes.items():
+            self.register(op, handler)
+
+    def dispatchBatch(self, msgs):
+        '''
+        Dispatch messages in order, skipping messages of coalesced opcodes
+        which are followed by a newer one of the same opcode before any
+        message of other opcode
+
+        Args:
+            msgs: list of messages
+        '''
+        pending = {}
+        for msg in msgs:
+            if msg.op in coalescedOps:
+                # keep order of the last messages of run
+                pending.pop(msg.op, None)
+                pending[msg.op] = msg
+                continue
+
+            for coalesced in pending.values():
+                self.dispatch(coalesced)
+            pending.clear()
+            self.dispatch(msg)
+
+        for coalesced in pending.values():
+            self.dispatch(coalesced)
+
+    def dispatch(self, msg):
+
+        try:
+            handler = self._handlers[msg.op]
+        except IndexError:
+            handler = self._unknown(msg.op)
+        handler(msg.args)
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+
+# Catch-up policies after an overrun
+CATCH_UP_SKIP = 'skip' # missed deadlines are skipped, next one stays on the grid
+CATCH_UP_BURST = 'burst' # missed deadlines are run back to back
+CATCH_UP_RESET = 'reset' # grid restarts one period after the overrun
+
+
+class DeadlineScheduler():
+    '''
+    Periodic loop timing on absolute deadlines of the monotonic
+    time.perf_counter_ns clock, so wall clock jumps and time spent in the
+    loop body do not accumulate as drift. Waiting sleeps until shortly
+    before the deadline and spins for the rest, as sleep wakes up late by
+    up to its timer granularity.
+    '''
+
+    def __init__(self, period, spin=200e-6, catchUp=CATCH_UP_SKIP):
+        '''
+        Args:
+            period: loop period in s
+            spin: time in s before the deadline spent spinning instead of sleeping
+            catchUp: policy after an overrun, 'skip', 'burst' or 'reset'
+        '''
+        if catchUp not in (CATCH_UP_SKIP, CATCH_UP_BURST, CATCH_UP_RESET):
+            raise ValueError('Unknown catch-up policy: {}'.format(catchUp))
+
+        self._period = int(round(period*1e9))
+        self._spin = int(round(spin*1e9))
+        self._catchUp = catchUp
+
+        self._overruns = 0
+        self._missed = 0
+        self._maxLateness = 0
+
+        self.reset()
+
+    def reset(self):
+        '''
+        Start grid of deadlines one period from now and clear statistics
+        '''
+        self._deadline = time.perf_counter_ns() + self._period
+        self._overruns = 0
+        self._missed = 0
+        self._maxLateness = 0
+
+    def setPeriod(self, period):
+        '''
+        Change loop period, next deadline is one new period after the last one
+
+        Args:
+            period: loop period in s
+        '''
+        period = int(round(period*1e9))
+        if period == self._period:
+            return
+
+        self._deadline += period - self._period
+        self._period = period
+
+    def period(self):
+
+        return self._period*1e-9
+
+    def overruns(self):
+        '''
+        Returns:
+            int: number of waits called after their deadline
+        '''
+        return self._overruns
+
+    def missed(self):
+        '''
+        Returns:
+            int: number of deadlines skipped by the catch-up policy
+        '''
+        return self._missed
+
+    def maxLateness(self):
+        '''
+        Returns:
+            float: largest delay in s of a wait called after its deadline
+        '''
+        return self._maxLateness*1e-9
+
+    def wait(self):
+        '''
+        Wait until the current deadline and advance to the next one
+
+        Returns:
+            float: time left in s when called, if negative, then the loop
+                overran its deadline
+        '''
+        deadline = self._deadline
+        now = time.perf_counter_ns()
+        left = deadline - now
+
+        if left < 0:
+            self._overruns += 1
+            if -left > self._maxLateness:
+                self._maxLateness = -left
+            if self._catchUp == CATCH_UP_SKIP:
+                skipped = -left // self._period
+                self._missed += skipped
+                self._deadline = deadline + (skipped + 1)*self._period
+            elif self._catchUp == CATCH_UP_BURST:
+                self._deadline = deadline + self._period
+            else:
+                self._deadline = now + self._period
+            return left*1e-9
+
+        # coarse sleep, then spin to the deadline
+        if left > self._spin:
+            time.sleep((left - self._spin)*1e-9)
+        while time.perf_counter_ns() < deadline:
+            pass
+
+        self._deadline = deadline + self._period
+
+        return left*1e-9
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+# One record per control tick
+recordDtype = np.dtype([
+    ('timestamp', 'f8'),
+    ('f1', 'f8'),
+    ('f2', 'f8'),
+    ('avg', 'f8'),
+    ('pv', 'f8'),
+    ('error', 'f8'),
+    ('control', 'f8'),
+    ('flags', 'u4')
+])
+
+# Record flags
+FLAG_LOCKED = 1 # control is valid
+FLAG_PHASE_MODE = 2 # process variable is phase
+FLAG_LOWPASS = 4 # average is lowpass filtered
+
+# Header of counters, padded to a cache line
+_HEAD = 0 # records written, only the producer changes it
+_TAIL = 1 # records read, only the consumer changes it
+_DROPPED = 2 # records dropped because the buffer was full
+_HEADER_SIZE = 64
+
+
+class SharedRingBuffer():
+    '''
+    Single producer single consumer ring buffer of fixed layout records in
+    shared memory. Producer only writes head and consumer only writes tail,
+    so no locks are needed. Records pushed when the buffer is full are
+    dropped and counted.
+    '''
+
+    def __init__(self, capacity=2**14, name=None):
+        '''
+        Args:
+            capacity: number of records, used only when creating
+            name: name of existing shared memory to attach to, new shared
+                memory is created if None
+        '''
+        if name is None:
+            size = _HEADER_SIZE + capacity*recordDtype.itemsize
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+            self._owner = True
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            self._owner = False
+            capacity = (self._shm.size - _HEADER_SIZE) // recordDtype.itemsize
+
+        self._capacity = capacity
+        self._counters = np.ndarray((3,), dtype=np.uint64, buffer=self._shm.buf)
+        self._records = np.ndarray((capacity,), dtype=recordDtype, buffer=self._shm.buf, offset=_HEADER_SIZE)
+
+        if self._owner:
+            self._counters[:] = 0
+
+    @property
+    def name(self):
+
+        return self._shm.name
+
+    def capacity(self):
+
+        return self._capacity
+
+    def dropped(self):
+
+        return int(self._counters[_DROPPED])
+
+    # Producer
+    def push(self, timestamp, f1, f2, avg, pv, error, control, flags):
+        '''
+        Write one record
+
+        Returns:
+            bool: if record was written, False if buffer is full
+        '''
+        head = int(self._counters[_HEAD])
+        if head - int(self._counters[_TAIL]) >= self._capacity:
+            self._counters[_DROPPED] += 1
+            return False
+
+        self._records[head % self._capacity] = (timestamp, f1, f2, avg, pv, error, control, flags)
+        # record is complete before it is published
+        self._counters[_HEAD] = head + 1
+
+        return True
+
+    # Consumer
+    def popAll(self):
+        '''
+        Read all records written since the last call
+
+        Returns:
+            np.array: structured array of records, oldest first
+        '''
+        tail = int(self._counters[_TAIL])
+        head = int(self._counters[_HEAD])
+        if head == tail:
+            return np.zeros(0, dtype=recordDtype)
+
+        start = tail % self._capacity
+        stop = start + head - tail
+        if stop <= self._capacity:
+            ret = self._records[start:stop].copy()
+        else:
+            ret = np.concatenate((self._records[start:], self._records[:stop - self._capacity]))
+
+        # slots are released only after records are copied
+        self._counters[_TAIL] = head
+
+        return ret
+
+    def close(self):
+
+        # views must be released before the shared memory is closed
+        self._counters = None
+        self._records = None
+        self._shm.close()
+
+    def unlink(self):
+
+        if self._owner:
+            self._shm.unlink()
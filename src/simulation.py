@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+
+import numpy as np
+
+import src.filters as filters
+import src.frequency_stability as freq_stab
+
+
+def generate_flicker_noise(N, rng):
+    '''
+    Flicker (1/f power spectral density) noise with unit standard deviation
+
+    Args:
+        N: number of samples
+        rng: numpy random generator
+    Returns:
+        np.array: noise samples
+    '''
+    if N < 2:
+        return np.zeros(N)
+
+    spectrum = rng.standard_normal(N//2 + 1) + 1j*rng.standard_normal(N//2 + 1)
+    f = np.arange(N//2 + 1)
+    spectrum[0] = 0
+    spectrum[1:] /= np.sqrt(f[1:])
+
+    ret = np.fft.irfft(spectrum, N)
+    ret /= np.std(ret)
+
+    return ret
+
+
+class PlantModel():
+    '''
+    Frequency seen by the frequency counter, as in DummyFC: free running
+    frequency with drift, sinusoidal disturbance and noise, shifted by the
+    DDS frequency set by the loop filter.
+    '''
+
+    def __init__(self, f0=176e6, drift=0, ADisturbance=1, fDisturbance=0.1, whiteNoise=0.1, flickerNoise=0, DDSStep=0, coupling=-1, seed=None):
+        '''
+        Args:
+            f0: free running frequency in Hz
+            drift: linear frequency drift in Hz/s
+            ADisturbance: amplitude of sinusoidal disturbance in Hz
+            fDisturbance: frequency of sinusoidal disturbance in Hz
+            whiteNoise: standard deviation of white frequency noise in Hz
+            flickerNoise: standard deviation of flicker frequency noise in Hz
+            DDSStep: frequency resolution of DDS in Hz, 0 for no quantization
+            coupling: change of measured frequency per Hz of DDS frequency
+            seed: seed of noise generator
+        '''
+        self.f0 = f0
+        self.drift = drift
+        self.ADisturbance = ADisturbance
+        self.fDisturbance = fDisturbance
+        self.whiteNoise = whiteNoise
+        self.flickerNoise = flickerNoise
+        self.DDSStep = DDSStep
+        self.coupling = coupling
+        self.seed = seed
+
+    def freeFrequencies(self, ts):
+        '''
+        Measured frequencies without DDS correction. Control does not change
+        them, so all samples are generated at once.
+
+        Args:
+            ts: sampling times in s
+        Returns:
+            np.array: frequencies in Hz
+        '''
+        ts = np.asarray(ts, dtype=float)
+        rng = np.random.default_rng(self.seed)
+
+        ret = self.f0 + self.drift*ts
+        ret += self.ADisturbance*np.sin(2*np.pi*self.fDisturbance*ts)
+        ret += self.whiteNoise*rng.standard_normal(ts.size)
+        if self.flickerNoise:
+            ret += self.flickerNoise*generate_flicker_noise(ts.size, rng)
+
+        return ret
+
+    def DDSFrequency(self, control):
+
+        if self.DDSStep:
+            return np.round(control/self.DDSStep)*self.DDSStep
+
+        return control
+
+
+def simulate(filt, plant, setpoint, rate, duration, lowpass=None, initialControl=0):
+    '''
+    Closed loop in frequency mode, sample by sample as in
+    handlerStabilization.filterUpdate. Control set after a measurement
+    affects the next measurement.
+
+    Args:
+        filt: loop filter with update(setpoint, process_variable)
+        plant: PlantModel
+        setpoint: target frequency in Hz
+        rate: sampling period in s
+        duration: simulated time in s
+        lowpass: optional filter applied to measured frequency
+        initialControl: DDS frequency when the lock is engaged
+    Returns:
+        dict: time, process variable, error and control arrays
+    '''
+    N = int(round(duration/rate))
+    ts = np.arange(N)*rate
+    fs = plant.freeFrequencies(ts)
+
+    pvs = np.zeros(N)
+    controls = np.zeros(N)
+
+    # soft start as on lock engage
+    filt.setInitialOffset(initialControl)
+    control = initialControl
+    update = filt.update
+    for i in range(N):
+        pv = fs[i] + plant.coupling*plant.DDSFrequency(control)
+        if lowpass is not None:
+            pv = lowpass.update(pv)
+        control = update(setpoint, pv)
+
+        pvs[i] = pv
+        controls[i] = control
+
+    ret = {
+        'Time [s]': ts,
+        'Process variable [Hz]': pvs,
+        'Error [Hz]': setpoint - pvs,
+        'Control [Hz]': controls
+    }
+
+    return ret
+
+
+# ----- Scoring -----
+def calc_settling_time(ts, errors, margin):
+    '''
+    Time after which the error stays within margin
+
+    Returns:
+        float: settling time in s, nan if the error does not settle
+    '''
+    outside = np.flatnonzero(~(np.abs(errors) <= margin))
+    if outside.size == 0:
+        return ts[0]
+    if outside[-1] == errors.size - 1:
+        return np.nan
+
+    return ts[outside[-1] + 1]
+
+def score_simulation(result, setpoint, rate, margin, taus=None):
+    '''
+    Settling time and overlapped Allan deviation of the settled process variable
+
+    Args:
+        result: output of simulate
+        setpoint: target frequency in Hz
+        rate: sampling period in s
+        margin: error margin in Hz defining settling
+        taus: averaging times of residual ADEV, octave grid if None
+    Returns:
+        dict: settling time, taus and residual ADEV
+    '''
+    ts = result['Time [s]']
+    settlingTime = calc_settling_time(ts, result['Error [Hz]'], margin)
+
+    ret = {
+        'Settling time [s]': settlingTime,
+        'Taus [s]': np.zeros(0) if taus is None else np.asarray(taus, dtype=float),
+        'ADEV': np.zeros(0) if taus is None else np.zeros(len(taus)) * np.nan
+    }
+    if np.isnan(settlingTime):
+        return ret
+
+    pvs = result['Process variable [Hz]'][ts >= settlingTime]
+    if pvs.size < 3:
+        return ret
+    taus, devs = freq_stab.calc_deviations_batch(
+        pvs,
+        setpoint,
+        1/rate,
+        taus,
+        deviations=('ADEV overlapped',)
+    )
+    ret['Taus [s]'] = taus
+    ret['ADEV'] = devs['ADEV overlapped']
+
+    return ret
+
+
+# ----- Parameter sweeps -----
+def _run_sweep_point(args):
+
+    filterType, params, plantParams, setpoint, rate, duration, margin, taus, initialControl = args
+
+    # filters are built from names and parameters, as sent to the handler
+    filt = getattr(filters, filterType)(**params)
+    plant = PlantModel(**plantParams)
+    result = simulate(filt, plant, setpoint, rate, duration, initialControl=initialControl)
+
+    return score_simulation(result, setpoint, rate, margin, taus)
+
+def run_sweep(filterType, baseParams, sweepParams, plantParams, setpoint, rate, duration, margin, taus=None, initialControl=0, workers=None):
+    '''
+    Simulations for all combinations of swept filter parameters, run in a
+    pool of processes
+
+    Args:
+        filterType: name of filter class in filters, e.g. 'DoubleIntLowpass'
+        baseParams: filter parameters common to all runs
+        sweepParams: dict parameter name -> list of values
+        plantParams: PlantModel parameters
+        setpoint: target frequency in Hz
+        rate: sampling period in s
+        duration: simulated time in s
+        margin: error margin in Hz defining settling
+        taus: averaging times of residual ADEV
+        initialControl: DDS frequency when the lock is engaged
+        workers: number of processes, all cores if None
+    Returns:
+        list: (swept parameters, score) for each combination
+    '''
+    names = list(sweepParams.keys())
+    points = [dict(zip(names, values)) for values in product(*[sweepParams[name] for name in names])]
+
+    tasks = []
+    for point in points:
+        params = dict(baseParams)
+        params.update(point)
+        tasks.append((filterType, params, plantParams, setpoint, rate, duration, margin, taus, initialControl))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        scores = list(pool.map(_run_sweep_point, tasks))
+
+    return list(zip(points, scores))
+
+
+if __name__ == '__main__':
+
+    import src.filterDesign as fd
+
+    rate = 1e-3
+    fb_coefs, ff_coefs, _ = fd.get_digital_filter_coefs(2, 2*np.pi*20, 2*np.pi/rate)
+
+    baseParams = {
+        'dt': rate,
+        'ff_coefs': ff_coefs,
+        'fb_coefs': fb_coefs,
+        'sign': -1,
+        'bounds': (1e6, 100e6)
+    }
+    plantParams = {
+        'f0': 176e6,
+        'drift': 0.01,
+        'whiteNoise': 0.1,
+        'flickerNoise': 0.05,
+        'DDSStep': 0.01,
+        'seed': 0
+    }
+
+    results = run_sweep(
+        'DoubleIntLowpass',
+        baseParams,
+        {'ki': [10, 30, 100], 'kii': [0, 10, 100]},
+        plantParams,
+        setpoint=96e6,
+        rate=rate,
+        duration=20,
+        margin=0.5,
+        taus=[1e-2, 1e-1, 1],
+        initialControl=80e6 + 5 # 5 Hz away from the setpoint
+    )
+    for params, score in results:
+        print(params, 'settling: {:.3f} s'.format(score['Settling time [s]']), 'ADEV:', score['ADEV'])
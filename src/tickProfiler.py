@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+
+from time import perf_counter_ns
+
+import numpy as np
+
+
+# Stamps taken during one control tick
+STAMP_MEASURE_BEGIN = 0
+STAMP_MEASURE_END = 1
+STAMP_LOWPASS_END = 2
+STAMP_FILTER_END = 3 # only when locked
+STAMP_DDS_END = 4 # only when locked
+STAMP_IPC_BEGIN = 5
+STAMP_IPC_END = 6
+STAMP_COMMANDS_BEGIN = 7
+STAMP_COMMANDS_END = 8
+STAMP_SIZE = 9
+
+# stage name: (begin stamp, end stamp)
+stages = {
+    'measure': (STAMP_MEASURE_BEGIN, STAMP_MEASURE_END),
+    'lowpass': (STAMP_MEASURE_END, STAMP_LOWPASS_END),
+    'filter': (STAMP_LOWPASS_END, STAMP_FILTER_END),
+    'DDS': (STAMP_FILTER_END, STAMP_DDS_END),
+    'IPC': (STAMP_IPC_BEGIN, STAMP_IPC_END),
+    'commands': (STAMP_COMMANDS_BEGIN, STAMP_COMMANDS_END),
+    'tick': (STAMP_MEASURE_BEGIN, STAMP_COMMANDS_END)
+}
+
+
+class LatencyHistogram():
+    '''
+    Log-linear histogram of latencies in ns, as in HdrHistogram. Values below
+    2**subBits have their own buckets, larger values are split into
+    2**(subBits-1) buckets per power of two, so relative resolution is
+    2**-(subBits-1) over the whole range.
+    '''
+
+    def __init__(self, subBits=7, maxBits=40):
+        '''
+        Args:
+            subBits: bits of resolution, 7 gives below 1.6 % bucket width
+            maxBits: values of 2**maxBits ns and above go to the last bucket
+        '''
+        self._subBits = subBits
+        self._maxBits = maxBits
+        self._counts = np.zeros(self._index(2**maxBits - 1) + 1, dtype=np.int64)
+        self._sum = 0
+        self._min = None
+        self._max = 0
+
+    def _index(self, values):
+
+        values = np.asarray(values, dtype=np.int64)
+        # bit length, exact for values below 2**53
+        exponent = np.maximum(np.frexp(values.astype(float))[1] - self._subBits, 0)
+        half = 2**(self._subBits - 1)
+
+        return np.where(
+            exponent == 0,
+            values,
+            2*half + (exponent - 1)*half + (values >> exponent) - half
+        )
+
+    def lowerEdge(self, index):
+        '''
+        Args:
+            index: bucket index
+        Returns:
+            int: smallest value in ns of bucket
+        '''
+        half = 2**(self._subBits - 1)
+        if index < 2*half:
+            return index
+        exponent = (index - 2*half) // half + 1
+
+        return ((index - 2*half) % half + half) << exponent
+
+    def record(self, values):
+        '''
+        Add latencies
+
+        Args:
+            values: array of latencies in ns
+        '''
+        values = np.clip(np.asarray(values, dtype=np.int64), 0, 2**self._maxBits - 1)
+        if values.size == 0:
+            return
+
+        self._counts += np.bincount(self._index(values), minlength=self._counts.size)
+        self._sum += int(values.sum())
+        self._max = max(self._max, int(values.max()))
+        if self._min is None:
+            self._min = int(values.min())
+        else:
+            self._min = min(self._min, int(values.min()))
+
+    def reset(self):
+
+        self._counts[:] = 0
+        self._sum = 0
+        self._min = None
+        self._max = 0
+
+    def count(self):
+
+        return int(self._counts.sum())
+
+    def buckets(self):
+        '''
+        Returns:
+            list: (lower edge in ns, count) of non-empty buckets
+        '''
+        return [(self.lowerEdge(i), int(self._counts[i])) for i in np.flatnonzero(self._counts)]
+
+    def percentile(self, q):
+        '''
+        Args:
+            q: percentile between 0 and 100
+        Returns:
+            int: lower edge in ns of bucket holding the percentile, 0 if empty
+        '''
+        N = self.count()
+        if N == 0:
+            return 0
+        index = np.searchsorted(np.cumsum(self._counts), max(1, np.ceil(q/100*N)))
+
+        return min(max(self.lowerEdge(index), self._min), self._max)
+
+    def summary(self):
+        '''
+        Returns:
+            dict: count and statistics in ns
+        '''
+        N = self.count()
+        ret = {
+            'count': N,
+            'min': self._min or 0,
+            'mean': self._sum/N if N else 0,
+            'max': self._max
+        }
+        for q in (50, 90, 99, 99.9):
+            ret['p{}'.format(q)] = self.percentile(q)
+
+        return ret
+
+
+class TickProfiler():
+    '''
+    Stamps of time.perf_counter_ns written into a preallocated list, one
+    row of STAMP_SIZE per control tick. Full list is folded into histograms
+    of stage latencies at once, so the control loop only writes list items,
+    which is cheaper than writing numpy array elements.
+    '''
+
+    def __init__(self, capacity=1024):
+        '''
+        Args:
+            capacity: number of ticks kept before folding into histograms
+        '''
+        self._capacity = capacity
+        self._stamps = [0] * (capacity*STAMP_SIZE)
+        self._row = 0
+        # index of the first stamp of the current tick
+        self._base = 0
+        self._histograms = {stage: LatencyHistogram() for stage in stages}
+
+    def beginTick(self):
+
+        if self._row == self._capacity - 1:
+            self._record(self._capacity)
+            self._stamps[:] = [0] * (self._capacity*STAMP_SIZE)
+            self._row = 0
+        else:
+            self._row += 1
+        self._base = self._row*STAMP_SIZE
+        self._stamps[self._base] = perf_counter_ns()
+
+    def stamp(self, index):
+
+        self._stamps[self._base + index] = perf_counter_ns()
+
+    def _record(self, N):
+
+        ticks = np.array(self._stamps[:N*STAMP_SIZE], dtype=np.int64).reshape(N, STAMP_SIZE)
+        for stage, (begin, end) in stages.items():
+            # stages skipped in a tick have no stamps
+            valid = (ticks[:, begin] > 0) & (ticks[:, end] > 0)
+            self._histograms[stage].record(ticks[valid, end] - ticks[valid, begin])
+
+    def fold(self):
+        '''
+        Move latencies of finished ticks to histograms. Current tick is kept.
+        '''
+        self._record(self._row)
+
+        current = self._stamps[self._base:self._base + STAMP_SIZE]
+        self._stamps[:] = [0] * (self._capacity*STAMP_SIZE)
+        self._stamps[:STAMP_SIZE] = current
+        self._row = 0
+        self._base = 0
+
+    def reset(self):
+
+        self._stamps[:] = [0] * (self._capacity*STAMP_SIZE)
+        self._row = 0
+        self._base = 0
+        for histogram in self._histograms.values():
+            histogram.reset()
+
+    def summary(self):
+        '''
+        Returns:
+            str: table of stage latencies in us
+        '''
+        self.fold()
+
+        header = ['stage', 'count', 'min', 'p50', 'p90', 'p99', 'p99.9', 'max', 'mean']
+        ret = '{:<10}{:>10}'.format(*header[:2]) + ''.join('{:>10}'.format(h) for h in header[2:]) + '\n'
+        for stage, histogram in self._histograms.items():
+            s = histogram.summary()
+            ret += '{:<10}{:>10d}'.format(stage, s['count'])
+            ret += ''.join('{:>10.1f}'.format(s[key]*1e-3) for key in header[2:])
+            ret += '\n'
+
+        return ret
+
+    def dump(self, path):
+        '''
+        Save summary and histogram buckets of all stages to text file
+
+        Args:
+            path: path of output file
+        '''
+        summary = self.summary()
+        with open(path, 'w') as f:
+            f.write('# Latencies in us\n')
+            for line in summary.splitlines():
+                f.write('# ' + line + '\n')
+            f.write('stage,lower edge [ns],count\n')
+            for stage, histogram in self._histograms.items():
+                for edge, count in histogram.buckets():
+                    f.write('{0},{1},{2}\n'.format(stage, edge, count))
@@ -24,3 +24,38 @@ def save_csv(data, outFile, metadata={}, **kwargs):
             mode='a',
             **kwargs
         )
+
+
+def read_csv_metadata(inFile):
+
+    with open(inFile, 'r') as f:
+        line = f.readline()
+
+    if line.startswith('#'):
+        return json.loads(line[1:])
+    return {}
+
+def read_csv_chunks(inFiles, column='Frequency avg [Hz]', chunksize=2**20):
+    '''
+    Values of one column read block by block, e.g. from consecutive
+    autosave files, without loading whole files.
+
+    Args:
+        inFiles: path or list of paths to csv files saved by save_csv
+        column: name of column to read
+        chunksize: number of rows in a block
+    '''
+
+    if isinstance(inFiles, str):
+        inFiles = [inFiles]
+
+    for inFile in inFiles:
+        reader = pd.read_csv(
+            inFile,
+            comment='#',
+            usecols=[column],
+            chunksize=chunksize
+        )
+        with reader:
+            for chunk in reader:
+                yield chunk[column].to_numpy(dtype=float)
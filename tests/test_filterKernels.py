@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+import copy
+
+import numpy as np
+from scipy.signal import butter
+
+from src.filterKernels import compiledFilters, iir_step
+from src.filters import IIRFilter, loopFilters
+
+
+def iir(order, cutoff):
+
+    b, a = butter(order, cutoff)
+
+    return b, -a[1:]
+
+def loop_filter_params(**kwargs):
+
+    ret = {
+        'IntLowpass': {'ff_coefs': iir(2, 0.1)[0], 'fb_coefs': iir(2, 0.1)[1], 'ki': 2.},
+        'DoubleIntLowpass': {'ff_coefs': iir(3, 0.1)[0], 'fb_coefs': iir(3, 0.1)[1], 'ki': 2., 'kii': 0.5},
+        'DoubleIntDoubleLowpass': {
+            'ff_coefs1': iir(2, 0.1)[0], 'fb_coefs1': iir(2, 0.1)[1],
+            'ff_coefs2': iir(1, 0.2)[0], 'fb_coefs2': iir(1, 0.2)[1],
+            'ki': 2., 'kii': 0.5
+        }
+    }
+    for params in ret.values():
+        params.update({'dt': 0.01, 'sign': 1, 'bounds': (1e6, 100e6)}, **kwargs)
+
+    return ret
+
+def test_iir_step():
+
+    xs = 10e6 + np.random.default_rng(0).normal(size=1000)
+    for order in (1, 2, 6, 8):
+        filt = IIRFilter(*iir(order, 0.2), padding=xs[0])
+        inputs, outputs = filt.getState()
+
+        ys = [iir_step(filt._ff_coefs, filt._fb_coefs, inputs, outputs, x) for x in xs]
+        expected = [filt.update(x) for x in xs]
+        if filt._fast:
+            np.testing.assert_array_equal(ys, expected)
+        else:
+            # np.sum adds 8 and more coefficients pairwise
+            assert np.allclose(ys, expected, rtol=1e-12, atol=0)
+
+def test_compiled_filters():
+
+    pv = 50e6 + 100*np.cumsum(np.random.default_rng(0).normal(size=2000))
+    for kwargs in ({}, {'kaw': 0.5, 'sign': -1}, {'int_bounds': (-5.001e7, 5.001e7), 'bounds': (4.999e7, 5.001e7)}):
+        for filterType, params in loop_filter_params(**kwargs).items():
+            ref = loopFilters[filterType](**params)
+            filt = compiledFilters[filterType](**params)
+            ref.setInitialOffset(50e6)
+            filt.setInitialOffset(50e6)
+            block = copy.deepcopy(filt)
+
+            # same per tick ordering as the python filters, bit by bit
+            expected = [ref.update(50e6, x) for x in pv]
+            np.testing.assert_array_equal([filt.update(50e6, x) for x in pv], expected)
+            np.testing.assert_array_equal(block.process_block(50e6, pv), expected)
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+import copy
+
+import numpy as np
+import pytest
+from scipy.signal import butter
+
+from src.filters import IIRFilter, SOSFilter, StateSpaceFilter, loopFilters
+
+
+def iir(order, cutoff):
+
+    b, a = butter(order, cutoff)
+
+    return b, -a[1:]
+
+def signal(N):
+
+    # slow drift with noise around 10 MHz
+    t = np.arange(N)
+
+    return 10e6 + 5*np.sin(2*np.pi*t/400) + np.random.default_rng(0).normal(size=N)
+
+def array_path(filt):
+
+    # same filter on the numpy array path of update
+    ret = copy.deepcopy(filt)
+    ret._fast = False
+    ret.setState(*filt.getState())
+
+    return ret
+
+def test_iir_fast_path():
+
+    xs = signal(2000)
+    for ff_coefs, fb_coefs in (iir(1, 0.05), iir(2, 0.05), iir(6, 0.2), (np.full(7, 1/7), [0.3]), ([0.5], [0.2, 0.1, 0.05])):
+        filt = IIRFilter(ff_coefs, fb_coefs, padding=xs[0])
+        assert filt._fast
+        ref = array_path(filt)
+
+        # bit by bit, the list path keeps the summation order of np.sum
+        np.testing.assert_array_equal([filt.update(x) for x in xs], [ref.update(x) for x in xs])
+        for state, expected in zip(filt.getState(), ref.getState()):
+            np.testing.assert_array_equal(state, expected)
+
+def test_iir_switch_continuous():
+
+    xs = signal(300)
+    for order_old, order_new in ((2, 2), (2, 4), (4, 1)):
+        filt = IIRFilter(*iir(order_old, 0.05), padding=xs[0])
+        for x in xs:
+            filt.update(x)
+        old = copy.deepcopy(filt)
+
+        filt.setFilter(*iir(order_new, 0.02))
+
+        # held input, new filter continues the old trajectory as long as
+        # its output history
+        held = xs[-1]
+        assert abs(filt.update(held) - old.update(held)) < 1e-6
+        new = [filt.update(held) for i in range(order_new - 1)]
+        expected = [old.update(held) for i in range(order_new - 1)]
+        assert np.allclose(new, expected, rtol=1e-12, atol=0)
+
+def test_iir_switch_jump():
+
+    xs = signal(300)
+    filt = IIRFilter(*iir(2, 0.05), padding=xs[0])
+    for x in xs:
+        filt.update(x)
+    old = copy.deepcopy(filt)
+    zeroed = copy.deepcopy(filt)
+
+    filt.setFilter(*iir(3, 0.02))
+    zeroed.setFilter(*iir(3, 0.02), bumpless=False)
+
+    # first output of next sample is close to the old filter, not to zero
+    x = 10e6
+    expected = old.update(x)
+    assert abs(filt.update(x) - expected) < 1
+    assert abs(zeroed.update(x) - expected) > 1e6
+
+def test_sos_switch_continuous():
+
+    xs = signal(300)
+    for order_old, order_new in ((2, 2), (4, 6), (6, 2)):
+        filt = SOSFilter(butter(order_old, 0.05, output='sos'), padding=xs[0])
+        for x in xs:
+            filt.update(x)
+        old = copy.deepcopy(filt)
+
+        filt.setFilter(butter(order_new, 0.02, output='sos'))
+
+        held = xs[-1]
+        assert abs(filt.update(held) - old.update(held)) < 1e-6
+        new = [filt.update(held) for i in range(order_new - 1)]
+        expected = [old.update(held) for i in range(order_new - 1)]
+        assert np.allclose(new, expected, rtol=1e-12, atol=0)
+
+def loop_filter_params(**kwargs):
+
+    ret = {
+        # params as sent by the PID tab
+        'pid': {'kp': 0.5, 'ki': 2., 'kd': 0.01, 'gain': 1.2, 'int_bounds': (-np.inf, np.inf), 'kaw': 0., 'lead_coef': 0.3},
+        'IntLowpass': {'ff_coefs': iir(2, 0.1)[0], 'fb_coefs': iir(2, 0.1)[1], 'ki': 2.},
+        'DoubleIntLowpass': {'ff_coefs': iir(2, 0.1)[0], 'fb_coefs': iir(2, 0.1)[1], 'ki': 2., 'kii': 0.5},
+        'DoubleIntDoubleLowpass': {
+            'ff_coefs1': iir(2, 0.1)[0], 'fb_coefs1': iir(2, 0.1)[1],
+            'ff_coefs2': iir(1, 0.2)[0], 'fb_coefs2': iir(1, 0.2)[1],
+            'ki': 2., 'kii': 0.5
+        }
+    }
+    for params in ret.values():
+        params.update({'dt': 0.01, 'sign': 1, 'bounds': (1e6, 100e6)}, **kwargs)
+
+    return ret
+
+def process_variable(N, scale=0.1):
+
+    # locked 50 MHz control value
+    return 50e6 + scale*np.cumsum(np.random.default_rng(0).normal(size=N))
+
+def test_state_space_equivalence():
+
+    cases = loop_filter_params()
+    pv = process_variable(5000)
+    for filterType, params in cases.items():
+        ref = loopFilters[filterType](**params)
+        filt = StateSpaceFilter(filterType, **params)
+        ref.setInitialOffset(50e6)
+        filt.setInitialOffset(50e6)
+        diff = max(abs(filt.update(50e6, x) - ref.update(50e6, x)) for x in pv)
+        # tolerance of the docstring
+        assert diff < 1e-13 * 50e6
+
+    with pytest.raises(ValueError):
+        StateSpaceFilter('MultiRateDoubleIntDoubleLowpass', **cases['DoubleIntDoubleLowpass'])
+
+def test_iir_process_block():
+
+    xs = signal(2000)
+    for order in (1, 2):
+        filt = IIRFilter(*iir(order, 0.05), padding=xs[0])
+        ref = copy.deepcopy(filt)
+
+        # lfilter sums in a different order
+        expected = [ref.update(x) for x in xs[:1500]]
+        assert np.allclose(filt.process_block(xs[:1500]), expected, rtol=1e-14, atol=0)
+        # and continues from the same state
+        assert np.allclose([filt.update(x) for x in xs[1500:]], [ref.update(x) for x in xs[1500:]], rtol=1e-14, atol=0)
+
+def test_loop_filter_process_block():
+
+    pv = process_variable(2000, scale=100)
+    for kwargs in ({}, {'kaw': 0.5}, {'int_bounds': (-5.001e7, 5.001e7), 'bounds': (4.999e7, 5.001e7)}):
+        for filterType, params in loop_filter_params(**kwargs).items():
+            filt = loopFilters[filterType](**params)
+            filt.setInitialOffset(50e6)
+            ref = copy.deepcopy(filt)
+
+            control = filt.process_block(50e6, pv[:1500])
+            expected = [ref.update(50e6, x) for x in pv[:1500]]
+            control = np.append(control, [filt.update(50e6, x) for x in pv[1500:]])
+            expected += [ref.update(50e6, x) for x in pv[1500:]]
+
+            # integrators and clamping bit by bit, PID and back-calculation
+            # entirely, lowpasses through lfilter up to rounding
+            for name in ('error_curr', 'error_last', 'value_integral', 'value_integral_double'):
+                assert getattr(filt, name, None) == getattr(ref, name, None)
+            if filterType == 'pid' or filt.kaw:
+                np.testing.assert_array_equal(control, expected)
+            else:
+                assert np.allclose(control, expected, rtol=1e-14, atol=0)
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import tracemalloc
+
+import numpy as np
+import pytest
+from scipy.stats import chi2
+
+from src.frequency_stability import calc_averaging_factor, calc_confidence_interval, calc_deviations_batch, calc_deviations_streaming, calc_edf, calc_noise_id, calc_noise_id_single, calc_tau_grid, calc_theo1_sums
+
+
+def theo1_sums(x, ms):
+
+    ret = []
+    N = x.size
+    for m in ms:
+        tmp = 0
+        for a in range(1, m//2 + 1):
+            T = x[:N-m] - x[a:N-m+a] - x[m-a:N-a] + x[m:]
+            tmp += np.dot(T, T) / a
+        ret.append(tmp)
+
+    return np.array(ret)
+
+def test_theo1_sums():
+
+    rng = np.random.default_rng(0)
+    for N in (3, 10, 57, 400):
+        w = rng.normal(size=N)
+        for x in (w, np.cumsum(np.cumsum(w)), w + 1e-3*np.arange(N)**2):
+            for ms in (np.arange(2, N, 2), 2**np.arange(1, int(np.log2(N - 1)) + 1), np.array([2, 2])):
+                assert np.allclose(calc_theo1_sums(x, ms), theo1_sums(x, ms), rtol=1e-9, atol=0)
+
+def test_noise_id():
+
+    rng = np.random.default_rng(0)
+    for N in (2, 5, 100, 1000):
+        w = rng.normal(size=N)
+        taus = np.append(calc_tau_grid(N, 10., 'all'), 0.)
+        for x in (w, np.cumsum(w), np.cumsum(np.cumsum(w)), np.ones(N)):
+            expected = [calc_noise_id_single(x - np.mean(x), tau, 10.) for tau in taus]
+            assert np.allclose(calc_noise_id(x, taus, 10.), expected, equal_nan=True)
+
+def test_streaming_long_taus():
+
+    rng = np.random.default_rng(0)
+    fs = 10e6 + np.cumsum(rng.normal(size=2**16)) * 1e-3
+    fs[[5, 1000, 40000]] = np.nan
+
+    taus, expected = calc_deviations_streaming(fs, 10e6, 10., chunk_size=2**12, max_history=2**20)
+    for max_history in (2**10, 3*2**11 + 1):
+        _, devs = calc_deviations_streaming(fs, 10e6, 10., chunk_size=2**12, max_history=max_history)
+        for name in expected:
+            assert np.allclose(devs[name], expected[name], rtol=1e-12, equal_nan=True)
+
+def test_streaming_memory(tmp_path):
+
+    N = 2**20
+    fs = np.memmap(tmp_path / 'fs', dtype=float, mode='w+', shape=(N,))
+    fs[:] = 10e6 + np.random.default_rng(0).normal(size=N)
+    fs.flush()
+    fs = np.memmap(tmp_path / 'fs', dtype=float, mode='r', shape=(N,))
+
+    tracemalloc.start()
+    calc_deviations_streaming(fs, 10e6, 10., chunk_size=2**14, max_history=2**14)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    # a few chunks and history, the record is 8 MB
+    assert peak < 32 * 8 * 2**14
+
+def test_streaming_iterable():
+
+    chunks = [10e6 + np.zeros(100) for i in range(3)]
+    with pytest.raises(ValueError):
+        calc_deviations_streaming(iter(chunks), 10e6, 10.)
+    with pytest.raises(ValueError):
+        calc_deviations_streaming(iter(chunks), 10e6, 10., taus=[10.], max_history=10)
+
+    taus, devs = calc_deviations_streaming(iter(chunks), 10e6, 10., taus=[0.1, 1.])
+    assert np.all(devs['ADEV overlapped'] == 0)
+
+def test_confidence_interval():
+
+    rng = np.random.default_rng(0)
+    N = 1000
+    taus = calc_tau_grid(N, 10., 'many')
+    devs = rng.uniform(1, 2, taus.size)
+    noiseIDs = rng.uniform(-3, 3, taus.size)
+    devs[3] = np.nan
+    noiseIDs[5] = np.nan
+
+    lower, upper = calc_confidence_interval(devs, taus, 10., noiseIDs, N, 'HDEV', 0.9)
+    for i, tau in enumerate(taus):
+        edf = np.nan
+        if np.isfinite(devs[i]) and np.isfinite(noiseIDs[i]):
+            alpha = int(np.clip(np.round(noiseIDs[i]), -2, 2))
+            edf = calc_edf(alpha, 3, calc_averaging_factor(tau, 10.), N)
+        expected = devs[i] * np.sqrt(edf / chi2.ppf([0.95, 0.05], edf))
+        assert np.allclose([lower[i], upper[i]], expected, equal_nan=True)
+
+def test_unknown_names():
+
+    fs = 10e6 + np.random.default_rng(0).normal(size=100)
+    with pytest.raises(ValueError):
+        calc_tau_grid(100, 10., 'octaves')
+    with pytest.raises(ValueError):
+        calc_deviations_batch(fs, 10e6, 10., deviations=('ADEV overlapped', 'XDEV'))
+
+    taus, devs = calc_deviations_batch(fs, 10e6, 10., deviations=('TOTDEV', 'Theo1'))
+    assert set(devs) == {'TOTDEV', 'Theo1'}
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+import src.filters as filters
+from src.handlerStabilization import handlerStabilization
+
+
+def handler(backend=None):
+
+    # only the filter state of the handler, without devices and connections
+    ret = handlerStabilization.__new__(handlerStabilization)
+    ret._filterFreq = None
+    ret._filterFreqType = None
+    ret._filterPhase = None
+    ret._filterPhaseType = None
+    ret._flagCompiledFilters = False
+    ret._flagStateSpaceFilters = backend == 'statespace'
+    ret._control = 0
+
+    return ret
+
+def params(**kwargs):
+
+    ret = {
+        'dt': 0.1,
+        'ff_coefs1': np.array([0.2, 0.2]),
+        'fb_coefs1': np.array([0.6]),
+        'ff_coefs2': np.array([0.5]),
+        'fb_coefs2': np.array([0.5]),
+        'ki': 2,
+        'kii': 0.5,
+        'bounds': (1e6, 100e6)
+    }
+    ret.update(kwargs)
+
+    return ret
+
+def run(h, N, pv=10e6 + 1):
+
+    for i in range(N):
+        h._control = h._filterFreq.update(10e6, pv)
+
+    return h._control
+
+def test_decimation_change_keeps_control():
+
+    for backend in (None, 'statespace'):
+        h = handler(backend)
+        h._cmdSetFilter(('DoubleIntDoubleLowpass', 'freq', params()))
+        h._filterFreq.setInitialOffset(10e6)
+        run(h, 100)
+
+        # same type only updates parameters
+        filt = h._filterFreq
+        h._cmdSetFilter(('DoubleIntDoubleLowpass', 'freq', params(ki=1)))
+        assert h._filterFreq is filt
+
+        # decimation switches to multi-rate filter in python
+        control = h._control
+        h._cmdSetFilter(('MultiRateDoubleIntDoubleLowpass', 'freq', params(decimation=4)))
+        assert isinstance(h._filterFreq, filters.MultiRateDoubleIntDoubleLowpass)
+        assert abs(run(h, 1) - control) < 1
+
+        # and back
+        control = h._control
+        h._cmdSetFilter(('DoubleIntDoubleLowpass', 'freq', params()))
+        assert h._filterFreqType == 'DoubleIntDoubleLowpass'
+        assert abs(run(h, 1) - control) < 1
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+from src.messages import *
+
+
+def dispatched(msgs):
+
+    router = Router('test')
+    ret = []
+    for op in range(OP_SIZE):
+        router.register(op, lambda args, op=op: ret.append((op, args)))
+    router.dispatchBatch([Message(op, args) for op, args in msgs])
+
+    return ret
+
+def test_coalesced_run():
+
+    msgs = [(DDS_FREQ, 1), (FILT_SP, 2), (DDS_FREQ, 3)]
+
+    assert dispatched(msgs) == [(FILT_SP, 2), (DDS_FREQ, 3)]
+
+def test_coalesced_split_by_lock():
+
+    msgs = [(DDS_FREQ, 1), (FILT_LOCK, True), (DDS_FREQ, 2)]
+
+    assert dispatched(msgs) == msgs
+
+def test_coalesced_split_by_filter_set():
+
+    msgs = [
+        (FC_RATE, 10),
+        (FC_RATE, 20),
+        (FILT_SET, ('PID', 'freq', [])),
+        (FC_RATE, 30),
+        (FILT_RESET, None),
+        (FC_RATE, 40),
+        (FC_RATE, 50)
+    ]
+
+    assert dispatched(msgs) == [
+        (FC_RATE, 20),
+        (FILT_SET, ('PID', 'freq', [])),
+        (FC_RATE, 30),
+        (FILT_RESET, None),
+        (FC_RATE, 50)
+    ]
@@ -20,6 +20,24 @@ import config.config as cfg
 import numpy as np
 
 
+def format_margins(filterType, params, fSampling, responses=None):
+    '''
+    Stability margins of designed loop
+
+    Args:
+        filterType: loop filter type
+        params: loop filter parameters
+        fSampling: sampling frequency
+        responses: optional precomputed lowpass responses
+    Returns:
+        str: text with gain and phase margins
+    '''
+    freqs, loop = fd.calc_loop_response(filterType, params, fSampling, responses=responses)
+    gainMargin, phaseMargin, f_gc, _ = fd.calc_stability_margins(freqs, loop['Open loop'])
+
+    return 'Gain margin: {:.1f} dB, phase margin: {:.1f} deg at {:.2e} Hz'.format(gainMargin, phaseMargin, f_gc)
+
+
 class tabLowpass(QWidget):
 
     newDesign = pyqtSignal()
@@ -32,6 +50,7 @@ class tabLowpass(QWidget):
         self._freqSampling = 1
         self._ff_coefs = np.ones(1)
         self._fb_coefs = np.zeros(1)
+        self._sos = np.array([[1., 0., 0., 1., 0., 0.]])
 
         # Flags
         self._flagFilterDesigned = False
@@ -45,6 +64,9 @@ class tabLowpass(QWidget):
         self._btnDesign = QPushButton('Design')
         self._labelCutoff = QLabel('0 Hz')
         self._labelOrder = QLabel('Filter order: 0')
+        self._realization = QComboBox()
+        self._realization.addItem('Direct')
+        self._realization.addItem('SOS')
 
         # Layout
         layout = QGridLayout()
@@ -67,6 +89,9 @@ class tabLowpass(QWidget):
         layout.addWidget(QLabel('Cutoff frequency:'), 3, 0)
         layout.addWidget(self._labelCutoff, 3, 1)
         layout.addWidget(self._labelOrder, 3, 2)
+        # Realization, second order sections stay stable for high orders
+        layout.addWidget(QLabel('Realization'), 4, 0)
+        layout.addWidget(self._realization, 4, 1)
 
         mainLayout = QVBoxLayout()
         mainLayout.addLayout(layout)
@@ -83,6 +108,7 @@ class tabLowpass(QWidget):
         self._attPassband.returnPressed.connect(self._calcCoefs)
         self._attStopband.returnPressed.connect(self._calcCoefs)
         self._gain.returnPressed.connect(self._calcCoefs)
+        self._realization.activated.connect(self._calcCoefs)
 
     def _calcCoefs(self):
         '''
@@ -133,15 +159,16 @@ class tabLowpass(QWidget):
         OmegaCutoff = fd.calc_cutoff_freq(OmegaPassband, attPassband, N)
         self._labelCutoff.setText('{:.2e} Hz'.format(OmegaCutoff/2/np.pi))
 
-        fb_coefs, ff_coefs, _ = fd.get_digital_filter_coefs(
+        design = fd.design_filter(
             N,
-            OmegaCutoff,
-            2*np.pi*self._freqSampling
+            OmegaCutoff/2/np.pi,
+            self._freqSampling,
+            gain_dB
         )
-        ff_coefs *= fd.dB_to_att(gain_dB)
 
-        self._ff_coefs = ff_coefs
-        self._fb_coefs = fb_coefs
+        self._ff_coefs = design['ff_coefs']
+        self._fb_coefs = design['fb_coefs']
+        self._sos = design['sos']
 
         self._flagFilterDesigned = True
         print('Lowpass filter designed!', flush=True)
@@ -181,14 +208,20 @@ class tabLowpass(QWidget):
         Get IIR filter coefficients
         
         Returns:
-            tuple: (feed forward coefs, feedback coefs)
+            dict: feed forward and feedback coefs or second order sections
         '''
-        ret = {
-            'type': 'lowpass',
-            'params': {
+        if self._realization.currentText() == 'SOS':
+            params = {
+                'sos': self._sos
+            }
+        else:
+            params = {
                 'ff_coefs': self._ff_coefs,
                 'fb_coefs': self._fb_coefs
             }
+        ret = {
+            'type': 'lowpass',
+            'params': params
         }
         return ret
 
@@ -205,11 +238,13 @@ class tabLowpass(QWidget):
             'Passband attenuation [dB]': float(self._attPassband.text()),
             'Stopband attenuation [dB]': float(self._attStopband.text()),
             'Gain [dB]': float(self._gain.text()),
-            'Sampling frequency [Hz]': float(self._freqSampling)
+            'Sampling frequency [Hz]': float(self._freqSampling),
+            'Realization': self._realization.currentText()
         }
         if self.isDesigned():
             ret['Feedforward coefs'] = self._ff_coefs.tolist()
             ret['Feedback coefs'] = self._fb_coefs.tolist()
+            ret['SOS coefs'] = self._sos.tolist()
 
         return ret
 
@@ -230,6 +265,11 @@ class tabLowpass(QWidget):
         except KeyError:
             dialogWarning('Could not read lowpass filter parameters!')
 
+        # parameters saved before SOS realization was added do not have it
+        index = self._realization.findText(params.get('Realization', 'Direct'))
+        if index >= 0:
+            self._realization.setCurrentIndex(index)
+
 
 class tabPID(QWidget):
 
@@ -241,6 +281,7 @@ class tabPID(QWidget):
 
         # Variables
         self._coefs = {}
+        self._freqSampling = 1
 
         # Flags
         self._flagFilterDesigned = False
@@ -254,6 +295,7 @@ class tabPID(QWidget):
         self._boundsTop = QLineEdit('100e6')
         self._intBoundsBtm = QLineEdit('-inf')
         self._intBoundsTop = QLineEdit('inf')
+        self._kaw = QLineEdit('0')
         self._leadCoef = QLineEdit('0.9')
         self._btnDesign = QPushButton('Design')
         self._sign = QComboBox()
@@ -286,6 +328,12 @@ class tabPID(QWidget):
         layout.addWidget(self._sign, 3, 3)
         # Button
         layout.addWidget(self._btnDesign, 3, 4)
+        # Anti wind-up
+        layout.addWidget(QLabel('Anti wind-up gain'), 4, 0)
+        layout.addWidget(self._kaw, 4, 1)
+        # Margins
+        self._labelMargins = QLabel('Gain margin: -, phase margin: -')
+        layout.addWidget(self._labelMargins, 5, 0, 1, 5)
 
         mainLayout = QVBoxLayout()
         mainLayout.addLayout(layout)
@@ -305,6 +353,7 @@ class tabPID(QWidget):
         self._boundsTop.returnPressed.connect(self._calcCoefs)
         self._intBoundsBtm.returnPressed.connect(self._calcCoefs)
         self._intBoundsTop.returnPressed.connect(self._calcCoefs)
+        self._kaw.returnPressed.connect(self._calcCoefs)
         self._leadCoef.returnPressed.connect(self._calcCoefs)
         self._sign.activated.connect(self._calcCoefs)
 
@@ -330,6 +379,7 @@ class tabPID(QWidget):
                 float(self._intBoundsBtm.text()),
                 float(self._intBoundsTop.text())
             )
+            tmp['kaw'] = float(self._kaw.text())
             tmp['lead_coef'] = float(self._leadCoef.text())
         except ValueError:
             dialogWarning('Could not read parameters!')
@@ -340,6 +390,7 @@ class tabPID(QWidget):
         dialogInformation('PID filter designed successfully!')
 
         self._coefs = tmp
+        self._labelMargins.setText(format_margins('pid', tmp, self._freqSampling))
         self.newDesign.emit()
 
         return True
@@ -356,6 +407,15 @@ class tabPID(QWidget):
         else:
             return False
 
+    def setSampling(self, fSampling):
+        '''
+        Set sampling frequency
+        
+        Args:
+            fSampling: sampling frequency
+        '''
+        self._freqSampling = fSampling
+
     def filterCoefs(self):
         '''
         Get PID filter coefficients
@@ -370,9 +430,9 @@ class tabPID(QWidget):
 
         # Error calculation sign
         if self._sign.currentText() == 'Positive':
-            tmp['params']['sign'] = 1
+            ret['params']['sign'] = 1
         elif self._sign.currentText() == 'Negative':
-            tmp['params']['sign'] = -1
+            ret['params']['sign'] = -1
 
         return ret
 
@@ -395,6 +455,7 @@ class tabPID(QWidget):
             'Gain': float(self._gain.text()),
             'Bounds': [float(self._boundsBtm.text()), float(self._boundsTop.text())],
             'Bounds integral': [float(self._intBoundsBtm.text()), float(self._intBoundsTop.text())],
+            'Anti wind-up gain': float(self._kaw.text()),
             'Lead coef': float(self._leadCoef.text()),
             'Sign': sign
         }
@@ -417,6 +478,8 @@ class tabPID(QWidget):
             self._boundsTop.setText('{:.4e}'.format(params['Bounds'][1]))
             self._intBoundsBtm.setText('{:.4e}'.format(params['Bounds integral'][0]))
             self._intBoundsTop.setText('{:.4e}'.format(params['Bounds integral'][1]))
+            # parameters saved before anti wind-up was added do not have it
+            self._kaw.setText('{:.4e}'.format(params.get('Anti wind-up gain', 0)))
             self._leadCoef.setText('{:.4}'.format(params['Lead coef']))
             if params['Sign'] == 1:
                 self._sign.setCurrentIndex(0)
@@ -449,6 +512,7 @@ class tabIntLowpass(QWidget):
         self._boundsTop = QLineEdit('100e6')
         self._intBoundsBtm = QLineEdit('-inf')
         self._intBoundsTop = QLineEdit('inf')
+        self._kaw = QLineEdit('0')
         # Lowpass
         self._freqCutoff = QLineEdit('1')
         self._filterOrder = QLineEdit('1')
@@ -472,6 +536,9 @@ class tabIntLowpass(QWidget):
         layout.addWidget(self._freqCutoff, 1, 2)
         layout.addWidget(QLabel('Filter order'), 1, 3, 1, 2)
         layout.addWidget(self._filterOrder, 1, 5)
+        # Anti wind-up
+        layout.addWidget(QLabel('Anti wind-up gain'), 2, 0, 1, 2)
+        layout.addWidget(self._kaw, 2, 2)
         # Gain
         layout.addWidget(QLabel('Lowpass gain [dB]'), 3, 0)
         layout.addWidget(self._gain, 3, 1)
@@ -484,6 +551,9 @@ class tabIntLowpass(QWidget):
         layout.addWidget(self._boundsTop, 3, 6)
         # Design btn
         layout.addWidget(self._btnDesign, 4, 5, 1, 2)
+        # Margins
+        self._labelMargins = QLabel('Gain margin: -, phase margin: -')
+        layout.addWidget(self._labelMargins, 4, 0, 1, 5)
 
         mainLayout = QVBoxLayout()
         mainLayout.addLayout(layout)
@@ -500,6 +570,7 @@ class tabIntLowpass(QWidget):
         self._boundsTop.returnPressed.connect(self._calcCoefs)
         self._intBoundsBtm.returnPressed.connect(self._calcCoefs)
         self._intBoundsTop.returnPressed.connect(self._calcCoefs)
+        self._kaw.returnPressed.connect(self._calcCoefs)
         self._freqCutoff.returnPressed.connect(self._calcCoefs)
         self._filterOrder.returnPressed.connect(self._calcCoefs)
         self._gain.returnPressed.connect(self._calcCoefs)
@@ -545,6 +616,7 @@ class tabIntLowpass(QWidget):
                 float(self._intBoundsBtm.text()),
                 float(self._intBoundsTop.text())
             )
+            tmp['kaw'] = float(self._kaw.text())
         except ValueError:
             dialogWarning('Could not read integrator parameters!')
             return False
@@ -578,15 +650,16 @@ class tabIntLowpass(QWidget):
             dialogWarning('Filter order must be positive')
             return False
 
-        fb_coefs, ff_coefs, _ = fd.get_digital_filter_coefs(
+        design = fd.design_filter(
             filterOrder,
-            OmegaCutoff,
-            2*np.pi*self._freqSampling
+            OmegaCutoff/2/np.pi,
+            self._freqSampling,
+            gain_dB
         )
-        ff_coefs *= fd.dB_to_att(gain_dB)
 
-        self._ff_coefs = ff_coefs
-        self._fb_coefs = fb_coefs
+        self._ff_coefs = design['ff_coefs']
+        self._fb_coefs = design['fb_coefs']
+        self._response = design['response']
 
         return True
     
@@ -596,6 +669,12 @@ class tabIntLowpass(QWidget):
             if self._calcCoefsLowpass():
                 self._flagFilterDesigned = True
                 print('Loop filter designed!', flush=True)
+                self._labelMargins.setText(format_margins(
+                    'IntLowpass',
+                    self.filterCoefs()['params'],
+                    self._freqSampling,
+                    [self._response]
+                ))
                 self.newDesign.emit()
 
     def filterCoefs(self):
@@ -631,6 +710,7 @@ class tabIntLowpass(QWidget):
             'ki': float(self._ki.text()),
             'Bounds': [float(self._boundsBtm.text()), float(self._boundsTop.text())],
             'Bounds integral': [float(self._intBoundsBtm.text()), float(self._intBoundsTop.text())],
+            'Anti wind-up gain': float(self._kaw.text()),
             'Cutoff frequency [Hz]': float(self._freqCutoff.text()),
             'Filter order': float(self._filterOrder.text()),
             'Sampling frequency [Hz]': float(self._freqSampling),
@@ -656,6 +736,8 @@ class tabIntLowpass(QWidget):
             self._boundsTop.setText('{:.4e}'.format(params['Bounds'][1]))
             self._intBoundsBtm.setText('{:.4e}'.format(params['Bounds integral'][0]))
             self._intBoundsTop.setText('{:.4e}'.format(params['Bounds integral'][1]))
+            # parameters saved before anti wind-up was added do not have it
+            self._kaw.setText('{:.4e}'.format(params.get('Anti wind-up gain', 0)))
             self._freqCutoff.setText('{}'.format(params['Cutoff frequency [Hz]']))
             self._filterOrder.setText('{}'.format(params['Filter order']))
             self._gain.setText('{}'.format(params['Gain [dB]']))
@@ -689,6 +771,7 @@ class tabDoubleIntLowpass(QWidget):
         self._ki = QLineEdit('200')
         self._intBoundsBtm = QLineEdit('-inf')
         self._intBoundsTop = QLineEdit('inf')
+        self._kaw = QLineEdit('0')
         # Double integrator
         self._kii = QLineEdit('0')
         # Lowpass
@@ -733,6 +816,12 @@ class tabDoubleIntLowpass(QWidget):
         layout.addWidget(self._sign, 3, 3)
         # Design btn
         layout.addWidget(self._btnDesign, 3, 4)
+        # Anti wind-up
+        layout.addWidget(QLabel('Anti wind-up gain'), 4, 0)
+        layout.addWidget(self._kaw, 4, 1)
+        # Margins
+        self._labelMargins = QLabel('Gain margin: -, phase margin: -')
+        layout.addWidget(self._labelMargins, 5, 0, 1, 5)
 
         mainLayout = QVBoxLayout()
         mainLayout.addLayout(layout)
@@ -750,6 +839,7 @@ class tabDoubleIntLowpass(QWidget):
         self._boundsTop.returnPressed.connect(self._calcCoefs)
         self._intBoundsBtm.returnPressed.connect(self._calcCoefs)
         self._intBoundsTop.returnPressed.connect(self._calcCoefs)
+        self._kaw.returnPressed.connect(self._calcCoefs)
         self._freqCutoff.returnPressed.connect(self._calcCoefs)
         self._filterOrder.returnPressed.connect(self._calcCoefs)
         self._gain.returnPressed.connect(self._calcCoefs)
@@ -796,6 +886,7 @@ class tabDoubleIntLowpass(QWidget):
                 float(self._intBoundsBtm.text()),
                 float(self._intBoundsTop.text())
             )
+            tmp['kaw'] = float(self._kaw.text())
         except ValueError:
             dialogWarning('Could not read integrator parameters!')
             return False
@@ -829,15 +920,16 @@ class tabDoubleIntLowpass(QWidget):
             dialogWarning('Filter order must be positive')
             return False
 
-        fb_coefs, ff_coefs, _ = fd.get_digital_filter_coefs(
+        design = fd.design_filter(
             filterOrder,
-            OmegaCutoff,
-            2*np.pi*self._freqSampling
+            OmegaCutoff/2/np.pi,
+            self._freqSampling,
+            gain_dB
         )
-        ff_coefs *= fd.dB_to_att(gain_dB)
 
-        self._ff_coefs = ff_coefs
-        self._fb_coefs = fb_coefs
+        self._ff_coefs = design['ff_coefs']
+        self._fb_coefs = design['fb_coefs']
+        self._response = design['response']
 
         return True
     
@@ -847,6 +939,12 @@ class tabDoubleIntLowpass(QWidget):
             if self._calcCoefsLowpass():
                 self._flagFilterDesigned = True
                 print('Loop filter designed!', flush=True)
+                self._labelMargins.setText(format_margins(
+                    'DoubleIntLowpass',
+                    self.filterCoefs()['params'],
+                    self._freqSampling,
+                    [self._response]
+                ))
                 self.newDesign.emit()
 
     def filterCoefs(self):
@@ -883,6 +981,7 @@ class tabDoubleIntLowpass(QWidget):
             'kii': float(self._kii.text()),
             'Bounds': [float(self._boundsBtm.text()), float(self._boundsTop.text())],
             'Bounds integral': [float(self._intBoundsBtm.text()), float(self._intBoundsTop.text())],
+            'Anti wind-up gain': float(self._kaw.text()),
             'Cutoff frequency [Hz]': float(self._freqCutoff.text()),
             'Filter order': float(self._filterOrder.text()),
             'Sampling frequency [Hz]': float(self._freqSampling),
@@ -909,6 +1008,8 @@ class tabDoubleIntLowpass(QWidget):
             self._boundsTop.setText('{:.4e}'.format(params['Bounds'][1]))
             self._intBoundsBtm.setText('{:.4e}'.format(params['Bounds integral'][0]))
             self._intBoundsTop.setText('{:.4e}'.format(params['Bounds integral'][1]))
+            # parameters saved before anti wind-up was added do not have it
+            self._kaw.setText('{:.4e}'.format(params.get('Anti wind-up gain', 0)))
             self._freqCutoff.setText('{}'.format(params['Cutoff frequency [Hz]']))
             self._filterOrder.setText('{}'.format(params['Filter order']))
             self._gain.setText('{}'.format(params['Gain [dB]']))
@@ -935,6 +1036,7 @@ class tabDoubleIntDoubleLowpass(QWidget):
         self._fb_coefs1 = np.zeros(1)
         self._ff_coefs2 = np.ones(1)
         self._fb_coefs2 = np.zeros(1)
+        self._decimationFactor = 1
 
         # Flags
         self._flagFilterDesigned = False
@@ -944,6 +1046,7 @@ class tabDoubleIntDoubleLowpass(QWidget):
         self._ki = QLineEdit('200')
         self._intBoundsBtm = QLineEdit('-inf')
         self._intBoundsTop = QLineEdit('inf')
+        self._kaw = QLineEdit('0')
         # Double integrator
         self._kii = QLineEdit('0')
         # Lowpass
@@ -952,6 +1055,8 @@ class tabDoubleIntDoubleLowpass(QWidget):
         self._filterOrder1 = QLineEdit('1')
         self._filterOrder2 = QLineEdit('1')
         self._gain = QLineEdit('0')
+        # Slow terms rate
+        self._decimation = QLineEdit('1')
         # General
         self._boundsBtm = QLineEdit('1e6')
         self._boundsTop = QLineEdit('100e6')
@@ -996,6 +1101,15 @@ class tabDoubleIntDoubleLowpass(QWidget):
         layout.addWidget(self._sign, 4, 3)
         # Design btn
         layout.addWidget(self._btnDesign, 4, 4)
+        # Decimation
+        layout.addWidget(QLabel('Decimation'), 5, 0)
+        layout.addWidget(self._decimation, 5, 1)
+        # Anti wind-up
+        layout.addWidget(QLabel('Anti wind-up gain'), 5, 2)
+        layout.addWidget(self._kaw, 5, 3)
+        # Margins
+        self._labelMargins = QLabel('Gain margin: -, phase margin: -')
+        layout.addWidget(self._labelMargins, 6, 0, 1, 5)
 
         mainLayout = QVBoxLayout()
         mainLayout.addLayout(layout)
@@ -1013,11 +1127,13 @@ class tabDoubleIntDoubleLowpass(QWidget):
         self._boundsTop.returnPressed.connect(self._calcCoefs)
         self._intBoundsBtm.returnPressed.connect(self._calcCoefs)
         self._intBoundsTop.returnPressed.connect(self._calcCoefs)
+        self._kaw.returnPressed.connect(self._calcCoefs)
         self._freqCutoff1.returnPressed.connect(self._calcCoefs)
         self._filterOrder1.returnPressed.connect(self._calcCoefs)
         self._freqCutoff2.returnPressed.connect(self._calcCoefs)
         self._filterOrder2.returnPressed.connect(self._calcCoefs)
         self._gain.returnPressed.connect(self._calcCoefs)
+        self._decimation.returnPressed.connect(self._calcCoefs)
         self._sign.activated.connect(self._calcCoefs)
 
     def isDesigned(self):
@@ -1061,11 +1177,18 @@ class tabDoubleIntDoubleLowpass(QWidget):
                 float(self._intBoundsBtm.text()),
                 float(self._intBoundsTop.text())
             )
+            tmp['kaw'] = float(self._kaw.text())
+            decimation = int(float(self._decimation.text()))
         except ValueError:
             dialogWarning('Could not read integrator parameters!')
             return False
 
+        if decimation < 1:
+            dialogWarning('Decimation must be positive')
+            return False
+
         self._coefs = tmp
+        self._decimationFactor = decimation
 
         return True
     
@@ -1085,8 +1208,9 @@ class tabDoubleIntDoubleLowpass(QWidget):
             dialogWarning('Could not read lowpass 1 parameters!')
             return False
 
-        # Check Nyquist frequency
-        if OmegaCutoff >= np.pi*self._freqSampling:
+        # Check Nyquist frequency, lowpasses run at decimated rate
+        fSampling = self._freqSampling / self._decimationFactor
+        if OmegaCutoff >= np.pi*fSampling:
             dialogWarning('Critical frequency 1 above Nyquist frequency!')
             return False
         # Check attenuations
@@ -1094,15 +1218,16 @@ class tabDoubleIntDoubleLowpass(QWidget):
             dialogWarning('Filter order 1 must be positive')
             return False
 
-        fb_coefs, ff_coefs, _ = fd.get_digital_filter_coefs(
+        design = fd.design_filter(
             filterOrder,
-            OmegaCutoff,
-            2*np.pi*self._freqSampling
+            OmegaCutoff/2/np.pi,
+            fSampling,
+            gain_dB
         )
-        ff_coefs *= fd.dB_to_att(gain_dB)
 
-        self._ff_coefs1 = ff_coefs
-        self._fb_coefs1 = fb_coefs
+        self._ff_coefs1 = design['ff_coefs']
+        self._fb_coefs1 = design['fb_coefs']
+        self._response1 = design['response']
 
         return True
 
@@ -1122,8 +1247,9 @@ class tabDoubleIntDoubleLowpass(QWidget):
             dialogWarning('Could not read lowpass 2 parameters!')
             return False
 
-        # Check Nyquist frequency
-        if OmegaCutoff >= np.pi*self._freqSampling:
+        # Check Nyquist frequency, lowpasses run at decimated rate
+        fSampling = self._freqSampling / self._decimationFactor
+        if OmegaCutoff >= np.pi*fSampling:
             dialogWarning('Critical frequency 2 above Nyquist frequency!')
             return False
         # Check attenuations
@@ -1131,15 +1257,16 @@ class tabDoubleIntDoubleLowpass(QWidget):
             dialogWarning('Filter order 2 must be positive')
             return False
 
-        fb_coefs, ff_coefs, _ = fd.get_digital_filter_coefs(
+        design = fd.design_filter(
             filterOrder,
-            OmegaCutoff,
-            2*np.pi*self._freqSampling
+            OmegaCutoff/2/np.pi,
+            fSampling,
+            gain_dB
         )
-        ff_coefs *= fd.dB_to_att(gain_dB)
 
-        self._ff_coefs2 = ff_coefs
-        self._fb_coefs2 = fb_coefs
+        self._ff_coefs2 = design['ff_coefs']
+        self._fb_coefs2 = design['fb_coefs']
+        self._response2 = design['response']
 
         return True
     
@@ -1149,6 +1276,15 @@ class tabDoubleIntDoubleLowpass(QWidget):
             if self._calcCoefsLowpass1() and self._calcCoefsLowpass2():
                 self._flagFilterDesigned = True
                 print('Loop filter designed!', flush=True)
+                filterCoefs = self.filterCoefs()
+                # cached responses are on the grid of the decimated rate
+                responses = [self._response1, self._response2] if self._decimationFactor == 1 else None
+                self._labelMargins.setText(format_margins(
+                    filterCoefs['type'],
+                    filterCoefs['params'],
+                    self._freqSampling,
+                    responses
+                ))
                 self.newDesign.emit()
 
     def filterCoefs(self):
@@ -1157,6 +1293,12 @@ class tabDoubleIntDoubleLowpass(QWidget):
             'type': 'DoubleIntDoubleLowpass',
             'params': self._coefs
         }
+        # slow terms at decimated rate
+        if self._decimationFactor > 1:
+            tmp['type'] = 'MultiRateDoubleIntDoubleLowpass'
+            tmp['params']['decimation'] = self._decimationFactor
+        else:
+            tmp['params'].pop('decimation', None)
         tmp['params']['ff_coefs1'] = self._ff_coefs1
         tmp['params']['fb_coefs1'] = self._fb_coefs1
         tmp['params']['ff_coefs2'] = self._ff_coefs2
@@ -1187,13 +1329,15 @@ class tabDoubleIntDoubleLowpass(QWidget):
             'kii': float(self._kii.text()),
             'Bounds': [float(self._boundsBtm.text()), float(self._boundsTop.text())],
             'Bounds integral': [float(self._intBoundsBtm.text()), float(self._intBoundsTop.text())],
+            'Anti wind-up gain': float(self._kaw.text()),
             'Cutoff frequency 1 [Hz]': float(self._freqCutoff1.text()),
             'Filter order 1': float(self._filterOrder1.text()),
             'Cutoff frequency 2 [Hz]': float(self._freqCutoff2.text()),
             'Filter order 2': float(self._filterOrder2.text()),
             'Sampling frequency [Hz]': float(self._freqSampling),
             'Sign': sign,
-            'Gain [dB]': float(self._gain.text())
+            'Gain [dB]': float(self._gain.text()),
+            'Decimation': int(float(self._decimation.text()))
         }
         if self.isDesigned():
             ret['Feedforward coefs 1'] = self._ff_coefs1.tolist()
@@ -1217,11 +1361,14 @@ class tabDoubleIntDoubleLowpass(QWidget):
             self._boundsTop.setText('{:.4e}'.format(params['Bounds'][1]))
             self._intBoundsBtm.setText('{:.4e}'.format(params['Bounds integral'][0]))
             self._intBoundsTop.setText('{:.4e}'.format(params['Bounds integral'][1]))
+            # parameters saved before anti wind-up was added do not have it
+            self._kaw.setText('{:.4e}'.format(params.get('Anti wind-up gain', 0)))
             self._freqCutoff1.setText('{}'.format(params['Cutoff frequency 1 [Hz]']))
             self._filterOrder1.setText('{}'.format(params['Filter order 1']))
             self._freqCutoff2.setText('{}'.format(params['Cutoff frequency 2 [Hz]']))
             self._filterOrder2.setText('{}'.format(params['Filter order 2']))
             self._gain.setText('{}'.format(params['Gain [dB]']))
+            self._decimation.setText('{}'.format(params.get('Decimation', 1)))
             self._freqSampling = params['Sampling frequency [Hz]']
             if params['Sign'] == 1:
                 self._sign.setCurrentIndex(0)